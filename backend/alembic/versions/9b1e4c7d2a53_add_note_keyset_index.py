@@ -0,0 +1,29 @@
+"""add_note_keyset_index
+
+Revision ID: 9b1e4c7d2a53
+Revises: 34ae97d8ea36
+Create Date: 2026-10-17 09:12:44.218391
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b1e4c7d2a53'
+down_revision: Union[str, Sequence[str], None] = '34ae97d8ea36'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Serves keyset pagination of a user's notes on (created_at, id)
+    op.create_index('idx_note_user_active_created', 'notes', ['user_id', 'is_active', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_note_user_active_created', table_name='notes')
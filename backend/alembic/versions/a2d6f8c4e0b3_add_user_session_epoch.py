@@ -0,0 +1,29 @@
+"""add_user_session_epoch
+
+Revision ID: a2d6f8c4e0b3
+Revises: f4b8d2e6a1c7
+Create Date: 2026-10-18 14:05:51.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a2d6f8c4e0b3'
+down_revision: Union[str, Sequence[str], None] = 'f4b8d2e6a1c7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Tokens issued before this column carry no epoch and are read as epoch 0
+    op.add_column('users', sa.Column('session_epoch', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'session_epoch')
@@ -0,0 +1,30 @@
+"""add_note_import_hash
+
+Revision ID: a8d4e1f6c3b2
+Revises: f2c6d8e4a9b7
+Create Date: 2026-10-17 20:11:08.402617
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8d4e1f6c3b2'
+down_revision: Union[str, Sequence[str], None] = 'f2c6d8e4a9b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('notes', sa.Column('import_hash', sa.String(length=64), nullable=True))
+    op.create_index('idx_note_user_import', 'notes', ['user_id', 'import_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_note_user_import', table_name='notes')
+    op.drop_column('notes', 'import_hash')
@@ -0,0 +1,38 @@
+"""add_note_search_tokens
+
+Revision ID: b3f7c2d9e5a1
+Revises: a8d4e1f6c3b2
+Create Date: 2026-10-17 21:36:44.118290
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f7c2d9e5a1'
+down_revision: Union[str, Sequence[str], None] = 'a8d4e1f6c3b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('note_search_tokens',
+    sa.Column('note_id', sa.Integer(), nullable=False),
+    sa.Column('field', sa.SmallInteger(), nullable=False),
+    sa.Column('token', sa.String(length=32), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['note_id'], ['notes.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('note_id', 'field', 'token')
+    )
+    op.create_index('idx_note_search_user_token', 'note_search_tokens', ['user_id', 'token', 'note_id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_note_search_user_token', table_name='note_search_tokens')
+    op.drop_table('note_search_tokens')
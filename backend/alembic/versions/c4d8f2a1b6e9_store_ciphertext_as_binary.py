@@ -0,0 +1,106 @@
+"""store_ciphertext_as_binary
+
+Revision ID: c4d8f2a1b6e9
+Revises: 9b1e4c7d2a53
+Create Date: 2026-10-17 14:03:27.511804
+
+"""
+import base64
+import hashlib
+from typing import Callable, Optional, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d8f2a1b6e9'
+down_revision: Union[str, Sequence[str], None] = '9b1e4c7d2a53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+V2_PREFIX = "v2:"
+
+# table -> [(column, nullable)]
+CIPHERTEXT_COLUMNS = {
+    'users': [('encrypted_alias', False)],
+    'folders': [('encrypted_name', False)],
+    'notes': [('encrypted_title', True), ('encrypted_content', False)],
+}
+
+
+def _to_binary(text: Optional[str]) -> Optional[bytes]:
+    """'v2:' + base64(body) -> 0x02 + body, base64(body) -> 0x01 + body"""
+    if text is None:
+        return None
+    if text.startswith(V2_PREFIX):
+        return b'\x02' + base64.b64decode(text[len(V2_PREFIX):])
+    return b'\x01' + base64.b64decode(text)
+
+
+def _to_text(blob: Optional[bytes]) -> Optional[str]:
+    if blob is None:
+        return None
+    body = base64.b64encode(bytes(blob[1:])).decode('ascii')
+    return V2_PREFIX + body if blob[0] == 0x02 else body
+
+
+def _convert_table(table_name: str, old_type, new_type, convert: Callable) -> None:
+    """
+    Copy every ciphertext column of a table into a `<column>_new` column of new_type,
+    BATCH_SIZE rows at a time in id order, committing each batch. Notes also get
+    content_hash recomputed over the new representation.
+    """
+    columns = [name for name, _ in CIPHERTEXT_COLUMNS[table_name]]
+    rehash = table_name == 'notes'
+    src = sa.table(table_name, sa.column('id', sa.Integer), *(sa.column(name, old_type) for name in columns))
+    dst = sa.table(table_name, sa.column('id', sa.Integer), sa.column('content_hash', sa.String), *(sa.column(f'{name}_new', new_type) for name in columns))
+    values = {f'{name}_new': sa.bindparam(f'v_{name}', type_=new_type) for name in columns}
+    if rehash:
+        values['content_hash'] = sa.bindparam('v_content_hash')
+    stmt = sa.update(dst).where(dst.c.id == sa.bindparam('v_id')).values(values)
+
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(sa.select(src).where(src.c.id > last_id).order_by(src.c.id).limit(BATCH_SIZE)).all()
+        if not rows:
+            break
+        params = []
+        for row in rows:
+            item = {'v_id': row.id}
+            for name in columns:
+                item[f'v_{name}'] = convert(row._mapping[name])
+            if rehash:
+                content = item['v_encrypted_content']
+                item['v_content_hash'] = hashlib.sha256(content.encode('utf-8') if isinstance(content, str) else content).hexdigest()
+            params.append(item)
+        bind.execute(stmt, params)
+        last_id = rows[-1].id
+
+
+def _migrate(old_type, new_type, convert: Callable) -> None:
+    for table_name, columns in CIPHERTEXT_COLUMNS.items():
+        for name, _ in columns:
+            op.add_column(table_name, sa.Column(f'{name}_new', new_type, nullable=True))
+    # Each batch commits on its own so large tables are never locked in one long transaction
+    with op.get_context().autocommit_block():
+        for table_name in CIPHERTEXT_COLUMNS:
+            _convert_table(table_name, old_type, new_type, convert)
+    for table_name, columns in CIPHERTEXT_COLUMNS.items():
+        with op.batch_alter_table(table_name) as batch_op:
+            for name, nullable in columns:
+                batch_op.drop_column(name)
+                batch_op.alter_column(f'{name}_new', new_column_name=name, existing_type=new_type, nullable=nullable)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Ciphertext becomes raw bytes (BYTEA on PostgreSQL) instead of base64 TEXT
+    _migrate(sa.Text(), sa.LargeBinary(), _to_binary)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _migrate(sa.LargeBinary(), sa.Text(), _to_text)
@@ -0,0 +1,41 @@
+"""add_note_deltas
+
+Revision ID: e7a3b5c9d1f4
+Revises: c4d8f2a1b6e9
+Create Date: 2026-10-17 16:41:09.382650
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7a3b5c9d1f4'
+down_revision: Union[str, Sequence[str], None] = 'c4d8f2a1b6e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('note_deltas',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('note_id', sa.Integer(), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('encrypted_delta', sa.LargeBinary(), nullable=False),
+    sa.Column('content_hash', sa.String(length=128), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['note_id'], ['notes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_note_delta_note_seq', 'note_deltas', ['note_id', 'seq'], unique=True)
+    op.add_column('notes', sa.Column('delta_count', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('notes', 'delta_count')
+    op.drop_index('idx_note_delta_note_seq', table_name='note_deltas')
+    op.drop_table('note_deltas')
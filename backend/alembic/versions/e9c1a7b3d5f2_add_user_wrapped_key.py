@@ -0,0 +1,30 @@
+"""add_user_wrapped_key
+
+Revision ID: e9c1a7b3d5f2
+Revises: d5a9f3b7c1e8
+Create Date: 2026-10-17 21:12:40.518203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9c1a7b3d5f2'
+down_revision: Union[str, Sequence[str], None] = 'd5a9f3b7c1e8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Existing accounts get a data key at their next login
+    op.add_column('users', sa.Column('wrapped_key', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Records of accounts already moved to a data key are unreadable without it
+    op.drop_column('users', 'wrapped_key')
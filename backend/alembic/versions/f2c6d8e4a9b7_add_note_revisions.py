@@ -0,0 +1,39 @@
+"""add_note_revisions
+
+Revision ID: f2c6d8e4a9b7
+Revises: e7a3b5c9d1f4
+Create Date: 2026-10-17 18:22:51.740213
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2c6d8e4a9b7'
+down_revision: Union[str, Sequence[str], None] = 'e7a3b5c9d1f4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('note_revisions',
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('note_id', sa.Integer(), nullable=False),
+    sa.Column('encrypted_title', sa.LargeBinary(), nullable=True),
+    sa.Column('encrypted_content', sa.LargeBinary(), nullable=False),
+    sa.Column('content_hash', sa.String(length=128), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['note_id'], ['notes.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_note_revision_note', 'note_revisions', ['note_id', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_note_revision_note', table_name='note_revisions')
+    op.drop_table('note_revisions')
@@ -0,0 +1,30 @@
+"""add_note_search_indexed
+
+Revision ID: f4b8d2e6a1c7
+Revises: e9c1a7b3d5f2
+Create Date: 2026-10-18 09:42:17.306512
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b8d2e6a1c7'
+down_revision: Union[str, Sequence[str], None] = 'e9c1a7b3d5f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('notes', sa.Column('search_indexed', sa.Boolean(), server_default=sa.false(), nullable=False))
+    # Notes that already have tokens are done; the rest are looked at once by the login backfill
+    op.execute("UPDATE notes SET search_indexed = true WHERE id IN (SELECT note_id FROM note_search_tokens)")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('notes', 'search_indexed')
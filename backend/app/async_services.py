@@ -0,0 +1,424 @@
+"""
+Async counterparts of the services in app.services, used when DATABASE_ASYNC is enabled.
+Queries run on the AsyncSession; crypto runs on worker threads so the event loop never waits on it.
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, insert, select, update
+from anyio import to_thread
+from app.config import settings
+from app.models import User, Note, NoteDelta, NoteRevision, NoteSearchToken, SharedNote, Folder
+from app.schemas import UserCreate, NoteCreate, NoteUpdate, FolderCreate, FolderUpdate, NoteBatchOperation, NoteBatchResult, NotePatch, NoteDeltaRequest
+from app.crypto import CryptoUtils, UserKey
+from app.user_cache import CachedUser, user_cache
+from app.services import (
+    UserService, RevisionService, active_user_query, cache_user, recache_user, user_notes_query, split_note_page, NoteBatchPlan, note_batch_queries, note_patch_statement, folder_delete_statements, NOTE_BATCH_INSERT,
+    apply_note_deltas, compact_note_content, note_deltas_query, note_delta_base_query, note_content_after_delta, note_delta_statements, note_compaction_statements,
+    record_revisions_statement, note_revisions_query, split_revision_page, notes_deltas_query, group_note_deltas,
+    SEARCH_FIELD_CONTENT, SEARCH_TOKEN_INSERT, note_search_texts, search_tokens_query, search_index_changes, search_query_tokens, note_search_query, search_backfill_query, search_backfill_rows, search_indexed_statement,
+    share_values, active_share_query, rehash_notes_query, rehash_tables, rehash_batch_query, rehash_notes_batch, reencrypt_rows
+)
+from datetime import datetime
+from typing import Any, Dict, Optional, List, Tuple
+
+
+class AsyncUserService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_user_by_alias(self, alias: str) -> Optional[CachedUser]:
+        alias = alias.lower()
+        cached = user_cache.get_by_alias(alias)
+        if cached is not None:
+            return cached
+        user = (await self.db.scalars(active_user_query(User.alias == alias))).first()
+        return cache_user(user)
+
+    async def get_user_by_id(self, user_id: int) -> Optional[CachedUser]:
+        cached = user_cache.get_by_id(user_id)
+        if cached is not None:
+            return cached
+        user = (await self.db.scalars(active_user_query(User.id == user_id))).first()
+        return cache_user(user)
+
+    async def create_user(self, user_data: UserCreate) -> User:
+        alias = user_data.alias.lower()
+        # Records are encrypted under a random data key; the password-derived key only wraps it
+        wrapping_key = await to_thread.run_sync(CryptoUtils.user_key, alias, user_data.password, CryptoUtils.new_salt())
+        data_key = CryptoUtils.new_data_key()
+        user = User(
+            alias=alias,
+            encrypted_alias=CryptoUtils.encrypt_with_key(alias, CryptoUtils.envelope_key(wrapping_key, data_key)),
+            wrapped_key=CryptoUtils.wrap_key(data_key, wrapping_key),
+            created_at=datetime.utcnow(),
+            last_accessed_at=datetime.utcnow()
+        )
+        self.db.add(user)
+        await self.db.commit()
+        await self.db.refresh(user)
+        user_cache.invalidate(user.id, user.alias)
+        return user
+
+    async def unlock(self, user: CachedUser, password: str) -> Optional[UserKey]:
+        """Return the user's encryption key if the password is correct"""
+        return await to_thread.run_sync(UserService.unlock, user, password)
+
+    async def verify_password(self, user: CachedUser, password: str) -> bool:
+        return await self.unlock(user, password) is not None
+
+    async def upgrade_user_key(self, user: CachedUser, key: UserKey) -> Tuple[CachedUser, UserKey]:
+        """Async counterpart of UserService.upgrade_user_key; moving records to a data key runs once per account"""
+        if not key.envelope:
+            return await self.adopt_data_key(user, key)
+        if settings.KDF_REHASH_ON_LOGIN and CryptoUtils.is_outdated(key):
+            return await self.rewrap_data_key(user, key, key.password)
+        return user, key
+
+    async def rewrap_data_key(self, user: CachedUser, key: UserKey, password: str, end_sessions: bool = False) -> Tuple[CachedUser, UserKey]:
+        """
+        Wrap the user's data key under password with a fresh salt and the configured KDF;
+        one row, nothing is re-encrypted. end_sessions bumps session_epoch, which
+        invalidates every session token issued before (a password change).
+        """
+        wrapping_key = await to_thread.run_sync(CryptoUtils.user_key, user.alias, password, CryptoUtils.new_salt())
+        wrapped_key = CryptoUtils.wrap_key(key.key, wrapping_key)
+        values = {"wrapped_key": wrapped_key}
+        if end_sessions:
+            values["session_epoch"] = User.session_epoch + 1
+        session_epoch = (await self.db.execute(update(User).where(User.id == user.id).values(**values).returning(User.session_epoch))).scalar_one()
+        await self.db.commit()
+        return recache_user(user, wrapped_key=wrapped_key, session_epoch=session_epoch), CryptoUtils.envelope_key(wrapping_key, key.key)
+
+    async def adopt_data_key(self, user: CachedUser, key: UserKey) -> Tuple[CachedUser, UserKey]:
+        """Async variant of UserService.adopt_data_key; the KDF and re-encryption run on worker threads"""
+        row = (await self.db.execute(select(User.encrypted_alias, User.wrapped_key).where(User.id == user.id).with_for_update())).one()
+        if row.wrapped_key:
+            await self.db.rollback()
+            user = recache_user(user, encrypted_alias=row.encrypted_alias, wrapped_key=row.wrapped_key)
+            return user, await self.unlock(user, key.password) or key
+        wrapping_key = await to_thread.run_sync(CryptoUtils.user_key, user.alias, key.password, CryptoUtils.new_salt())
+        data_key = CryptoUtils.new_data_key()
+        new_key = CryptoUtils.envelope_key(wrapping_key, data_key)
+        try:
+            await self._reencrypt_records(user.id, key, new_key)
+            values = {"encrypted_alias": CryptoUtils.encrypt_with_key(user.alias, new_key), "wrapped_key": CryptoUtils.wrap_key(data_key, wrapping_key)}
+            await self.db.execute(update(User).where(User.id == user.id).values(**values))
+            await self.db.commit()
+        except:
+            await self.db.rollback()
+            raise
+        return recache_user(user, **values), new_key
+
+    async def _reencrypt_records(self, user_id: int, old_key: UserKey, new_key: UserKey) -> None:
+        """Async variant of UserService._reencrypt_records; doesn't commit"""
+        await self.db.execute(delete(NoteSearchToken).where(NoteSearchToken.user_id == user_id))
+        after_id = 0
+        while rows := (await self.db.execute(rehash_notes_query(user_id, after_id))).all():
+            delta_ids = [row.id for row in rows if row.delta_count]
+            deltas = group_note_deltas(await self.db.execute(notes_deltas_query(delta_ids))) if delta_ids else {}
+            updates, tokens = await to_thread.run_sync(rehash_notes_batch, user_id, rows, deltas, old_key, new_key)
+            if updates:
+                await self.db.execute(update(Note), updates)
+            if tokens:
+                await self.db.execute(SEARCH_TOKEN_INSERT, tokens)
+            after_id = rows[-1].id
+        for model, criterion, columns in rehash_tables(user_id):
+            after_id = 0
+            while rows := (await self.db.execute(rehash_batch_query(model, criterion, columns, after_id))).all():
+                await self.db.execute(update(model), await to_thread.run_sync(reencrypt_rows, rows, columns, old_key, new_key))
+                after_id = rows[-1].id
+
+    async def update_last_accessed(self, user: CachedUser) -> CachedUser:
+        return UserService.update_last_accessed(user)
+
+
+class AsyncFolderService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_folder_by_id(self, folder_id: int) -> Optional[Folder]:
+        stmt = select(Folder).where(Folder.id == folder_id, Folder.is_active == True)
+        return (await self.db.scalars(stmt)).first()
+
+    async def get_user_folders(self, user_id: int) -> List[Folder]:
+        stmt = select(Folder).where(Folder.user_id == user_id, Folder.is_active == True).order_by(Folder.created_at.asc())
+        return list((await self.db.scalars(stmt)).all())
+
+    async def create_folder(self, user_id: int, folder_data: FolderCreate, key: UserKey) -> Folder:
+        encrypted_name = await to_thread.run_sync(CryptoUtils.encrypt_with_key, folder_data.name, key)
+        folder = Folder(
+            user_id=user_id,
+            encrypted_name=encrypted_name,
+            color=folder_data.color or 'default',
+            icon=folder_data.icon or 'folder',
+            created_at=datetime.utcnow()
+        )
+        self.db.add(folder)
+        await self.db.commit()
+        await self.db.refresh(folder)
+        return folder
+
+    async def update_folder(self, folder_id: int, folder_data: FolderUpdate, key: UserKey) -> Folder:
+        folder = await self.get_folder_by_id(folder_id)
+        if folder_data.name is not None:
+            folder.encrypted_name = await to_thread.run_sync(CryptoUtils.encrypt_with_key, folder_data.name, key)
+        if folder_data.color is not None:
+            folder.color = folder_data.color
+        if folder_data.icon is not None:
+            folder.icon = folder_data.icon
+        await self.db.commit()
+        await self.db.refresh(folder)
+        return folder
+
+    async def delete_folder(self, folder_id: int, cascade: bool = False) -> None:
+        """
+        Soft-delete a folder with set-based statements in one transaction.
+        Its notes are unfiled, or soft-deleted too when cascade is set.
+        """
+        for stmt in folder_delete_statements(folder_id, cascade):
+            await self.db.execute(stmt, execution_options={"synchronize_session": False})
+        await self.db.commit()
+
+    async def decrypt_folder_name(self, folder: Folder, key: UserKey) -> Optional[str]:
+        try:
+            return await to_thread.run_sync(CryptoUtils.decrypt_with_key, folder.encrypted_name, key)
+        except:
+            return None
+
+
+class AsyncNoteService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_note_by_id(self, note_id: int) -> Optional[Note]:
+        stmt = select(Note).where(Note.id == note_id, Note.is_active == True)
+        return (await self.db.scalars(stmt)).first()
+
+    async def get_user_notes(self, user_id: int) -> List[Note]:
+        stmt = select(Note).where(Note.user_id == user_id, Note.is_active == True).order_by(Note.created_at.desc())
+        return list((await self.db.scalars(stmt)).all())
+
+    async def get_user_notes_page(self, user_id: int, limit: Optional[int] = None, cursor: Optional[str] = None, summary: bool = False) -> Tuple[list, Optional[str]]:
+        """Return (notes, next_cursor); summary pages are column rows without encrypted_content"""
+        stmt = user_notes_query(user_id, limit, cursor, summary)
+        rows = list((await self.db.execute(stmt)).all()) if summary else list((await self.db.scalars(stmt)).all())
+        return split_note_page(rows, limit)
+
+    async def create_note(self, user_id: int, note_data: NoteCreate, key: UserKey) -> Note:
+        encrypted_title = await to_thread.run_sync(CryptoUtils.encrypt_with_key, note_data.title, key) if note_data.title else None
+        encrypted_content = await to_thread.run_sync(CryptoUtils.encrypt_with_key, note_data.content, key)
+        content_hash = CryptoUtils.hash_content(encrypted_content)
+        note = Note(
+            user_id=user_id,
+            folder_id=note_data.folder_id,
+            encrypted_title=encrypted_title,
+            encrypted_content=encrypted_content,
+            content_hash=content_hash,
+            created_at=datetime.utcnow()
+        )
+        self.db.add(note)
+        await self.db.flush()
+        await self.update_search_index(user_id, note_search_texts(note.id, note_data.title or "", note_data.content), key)
+        await self.db.commit()
+        await self.db.refresh(note)
+        return note
+
+    async def update_note(self, note_id: int, note_data: NoteUpdate, key: UserKey) -> Note:
+        note = await self.get_note_by_id(note_id)
+        await self._record_revisions([note_id], [note_id] if note.delta_count else [], key)
+        if note_data.title is not None:
+            note.encrypted_title = await to_thread.run_sync(CryptoUtils.encrypt_with_key, note_data.title, key)
+        encrypted_content = await to_thread.run_sync(CryptoUtils.encrypt_with_key, note_data.content, key)
+        content_hash = CryptoUtils.hash_content(encrypted_content)
+        note.encrypted_content = encrypted_content
+        note.content_hash = content_hash
+        # Handle folder_id: -1 means remove from folder, None means no change
+        if note_data.folder_id is not None:
+            note.folder_id = None if note_data.folder_id == -1 else note_data.folder_id
+        note.updated_at = datetime.utcnow()
+        await self.update_search_index(note.user_id, note_search_texts(note_id, note_data.title, note_data.content), key)
+        await self.db.commit()
+        await self.db.refresh(note)
+        return note
+
+    async def patch_note(self, note_id: int, user_id: int, patch: NotePatch, key: UserKey) -> Optional[Any]:
+        """Apply a partial update; returns the note summary row, or None if not found / hash conflict"""
+        if patch.content is not None:
+            delta_count = await self.db.scalar(select(Note.delta_count).where(Note.id == note_id, Note.user_id == user_id, Note.is_active == True))
+            if delta_count is None:
+                return None
+            await self._record_revisions([note_id], [note_id] if delta_count else [], key)
+        stmt = await to_thread.run_sync(note_patch_statement, note_id, user_id, patch, key)
+        row = (await self.db.execute(stmt)).first()
+        if row is None:
+            await self.db.rollback()
+            return None
+        await self.update_search_index(user_id, note_search_texts(note_id, patch.title, patch.content), key)
+        await self.db.commit()
+        return row
+
+    async def save_delta(self, note_id: int, user_id: int, delta: NoteDeltaRequest, key: UserKey) -> Optional[Any]:
+        """Async variant of NoteService.save_delta"""
+        base = (await self.db.execute(note_delta_base_query(note_id, user_id))).first()
+        if base is None or base.content_hash != delta.previous_hash:
+            await self.db.rollback()
+            return None
+        deltas = (await self.db.scalars(note_deltas_query(note_id))).all()
+        content = await to_thread.run_sync(note_content_after_delta, base.encrypted_content, deltas, delta.edits, key)
+        stmt, delta_values = await to_thread.run_sync(note_delta_statements, note_id, user_id, delta, key)
+        row = (await self.db.execute(stmt)).first()
+        if row is None:
+            await self.db.rollback()
+            return None
+        await self.db.execute(insert(NoteDelta).values(seq=row.delta_count, **delta_values))
+        if row.delta_count >= settings.NOTE_DELTA_COMPACT_THRESHOLD:
+            row = await self._compact(note_id, key)
+        await self.update_search_index(user_id, {(note_id, SEARCH_FIELD_CONTENT): content}, key)
+        await self.db.commit()
+        return row
+
+    async def _compact(self, note_id: int, key: UserKey) -> Any:
+        base = await self.db.scalar(select(Note.encrypted_content).where(Note.id == note_id))
+        deltas = (await self.db.scalars(note_deltas_query(note_id))).all()
+        encrypted_content = await to_thread.run_sync(compact_note_content, base, deltas, key)
+        delete_stmt, update_stmt = note_compaction_statements(note_id, encrypted_content)
+        await self.db.execute(delete_stmt)
+        row = (await self.db.execute(update_stmt)).first()
+        await self.db.execute(record_revisions_statement([note_id]))
+        return row
+
+    async def _record_revisions(self, note_ids: List[int], compact_ids: List[int], key: UserKey) -> None:
+        for note_id in compact_ids:
+            await self._compact(note_id, key)
+        await self.db.execute(record_revisions_statement(note_ids))
+
+    async def update_search_index(self, user_id: int, texts: Dict[Tuple[int, int], str], key: UserKey) -> None:
+        """Async variant of NoteService.update_search_index"""
+        if not settings.SEARCH_INDEX_ENABLED or not texts:
+            return
+        rows = (await self.db.execute(search_tokens_query(note_id for note_id, _ in texts))).all()
+        deletes, inserts = await to_thread.run_sync(search_index_changes, user_id, texts, rows, key)
+        for stmt in deletes:
+            await self.db.execute(stmt)
+        if inserts:
+            await self.db.execute(SEARCH_TOKEN_INSERT, inserts)
+
+    async def index_notes(self, user_id: int, key: UserKey) -> int:
+        """Async variant of NoteService.index_notes"""
+        if not settings.SEARCH_INDEX_ENABLED:
+            return 0
+        rows = (await self.db.execute(search_backfill_query(user_id))).all()
+        if not rows:
+            return 0
+        delta_ids = [row.id for row in rows if row.delta_count]
+        deltas = group_note_deltas(await self.db.execute(notes_deltas_query(delta_ids))) if delta_ids else {}
+        inserts = await to_thread.run_sync(search_backfill_rows, user_id, rows, deltas, key)
+        if inserts:
+            await self.db.execute(SEARCH_TOKEN_INSERT, inserts)
+        await self.db.execute(search_indexed_statement([row.id for row in rows]))
+        await self.db.commit()
+        return len(rows)
+
+    async def search_notes(self, user_id: int, query: str, key: UserKey, limit: int = 50) -> list:
+        """Async variant of NoteService.search_notes"""
+        tokens = await to_thread.run_sync(search_query_tokens, query, key)
+        return list((await self.db.execute(note_search_query(user_id, tokens, limit))).all())
+
+    async def apply_batch(self, user_id: int, operations: List[NoteBatchOperation], key: UserKey) -> List[NoteBatchResult]:
+        """Apply a batch of note operations in one transaction using bulk statements"""
+        notes_stmt, folders_stmt = note_batch_queries(user_id, operations)
+        existing = {row.id: row for row in await self.db.execute(notes_stmt)} if notes_stmt is not None else {}
+        folder_ids = set(await self.db.scalars(folders_stmt)) if folders_stmt is not None else set()
+        plan = await to_thread.run_sync(NoteBatchPlan, user_id, operations, key, existing, folder_ids)
+        try:
+            if plan.replaced_bodies:
+                await self._record_revisions(plan.replaced_bodies, [note_id for note_id in plan.replaced_bodies if existing[note_id].delta_count], key)
+            if plan.updates:
+                await self.db.execute(update(Note), plan.updates)
+            if plan.inserts:
+                plan.complete_inserts((await self.db.execute(NOTE_BATCH_INSERT, plan.inserts)).all())
+            await self.update_search_index(user_id, plan.search_texts, key)
+            await self.db.commit()
+        except:
+            await self.db.rollback()
+            raise
+        return plan.results
+
+    async def delete_note(self, note_id: int) -> None:
+        note = await self.get_note_by_id(note_id)
+        if note:
+            note.is_active = False
+            note.updated_at = datetime.utcnow()
+            await self.db.commit()
+
+    async def decrypt_note_content(self, note: Note, key: UserKey) -> Optional[str]:
+        deltas = (await self.db.scalars(note_deltas_query(note.id))).all() if note.delta_count else []
+        try:
+            content = await to_thread.run_sync(CryptoUtils.decrypt_with_key, note.encrypted_content, key)
+            return await to_thread.run_sync(apply_note_deltas, content, deltas, key) if deltas else content
+        except:
+            return None
+
+    async def raw_note_content(self, note: Note, key: UserKey) -> bytes:
+        """Async variant of NoteService.raw_note_content"""
+        if not note.delta_count:
+            return note.encrypted_content
+        deltas = (await self.db.scalars(note_deltas_query(note.id))).all()
+        return await to_thread.run_sync(compact_note_content, note.encrypted_content, deltas, key)
+
+    async def decrypt_note_title(self, note: Note, key: UserKey) -> Optional[str]:
+        try:
+            return await to_thread.run_sync(CryptoUtils.decrypt_with_key, note.encrypted_title, key) if note.encrypted_title else None
+        except:
+            return None
+
+
+class AsyncRevisionService:
+    """Read side of RevisionService; pruning runs as a sync background job"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def list_revisions(self, note_id: int, limit: int = 50, cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+        return split_revision_page(list((await self.db.execute(note_revisions_query(note_id, limit, cursor))).all()), limit)
+
+    async def get_revision(self, note_id: int, revision_id: int) -> Optional[NoteRevision]:
+        stmt = select(NoteRevision).where(NoteRevision.id == revision_id, NoteRevision.note_id == note_id)
+        return (await self.db.scalars(stmt)).first()
+
+    async def decrypt_revision(self, revision: NoteRevision, key: UserKey) -> Tuple[Optional[str], Optional[str]]:
+        return await to_thread.run_sync(RevisionService.decrypt_revision, revision, key)
+
+
+class AsyncShareService:
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_share(self, note_id: int) -> Optional[SharedNote]:
+        stmt = select(SharedNote).where(SharedNote.note_id == note_id, SharedNote.is_active == True)
+        return (await self.db.scalars(stmt)).first()
+
+    async def create_share(self, note_id: int, title: Optional[str], content: str, expires_in_seconds: Optional[int] = None) -> Tuple[SharedNote, str, Optional[str]]:
+        """Async variant of ShareService.create_share"""
+        token, values = await to_thread.run_sync(share_values, title, content, expires_in_seconds)
+        share = (await self.db.scalars(select(SharedNote).where(SharedNote.note_id == note_id))).first()
+        replaced = share.share_token if share is not None and share.is_active else None
+        if share is None:
+            share = SharedNote(note_id=note_id, **values)
+            self.db.add(share)
+        else:
+            for name, value in values.items():
+                setattr(share, name, value)
+        await self.db.commit()
+        await self.db.refresh(share)
+        return share, token, replaced
+
+    async def revoke_share(self, note_id: int) -> Optional[str]:
+        share = await self.get_share(note_id)
+        if share is None:
+            return None
+        share.is_active = False
+        await self.db.commit()
+        return share.share_token
+
+    async def get_active_share(self, token_hash: str) -> Optional[SharedNote]:
+        return (await self.db.scalars(active_share_query(token_hash))).first()
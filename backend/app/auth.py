@@ -0,0 +1,163 @@
+"""
+Stateless session tokens and the authentication dependency used by the routes.
+
+A token is base64url(payload) + "." + base64url(HMAC-SHA256(payload)). The payload
+carries the user id, alias, expiry, session epoch and the user's encryption key
+wrapped with AES-GCM under a server secret, so a request holding a valid token
+can be served without a password KDF. The only lookup is the user's (cached)
+session_epoch: a password change bumps it, which ends every older session.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.crypto import UserKey
+from app.kdf import KdfParams, LEGACY_KDF
+from app.database import get_db, get_async_db
+from app.user_cache import CachedUser
+from app.services import UserService
+from app.async_services import AsyncUserService
+
+
+class InvalidSessionToken(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class AuthSession:
+    """The authenticated caller of a request"""
+    user_id: int
+    alias: str
+    key: UserKey = field(repr=False)
+    expires_at: Optional[int] = None
+    epoch: int = 0
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+class SessionTokens:
+    """Issues and validates HMAC-signed session tokens"""
+
+    def __init__(self, secret: str, ttl_seconds: int):
+        secret_bytes = secret.encode("utf-8")
+        # Separate subkeys for signing and for wrapping the user key
+        self._sign_key = hmac.new(secret_bytes, b"cryptora-session-sign", hashlib.sha256).digest()
+        self._wrap = AESGCM(hmac.new(secret_bytes, b"cryptora-session-wrap", hashlib.sha256).digest())
+        self.ttl_seconds = ttl_seconds
+
+    def _sign(self, body: str) -> str:
+        return _b64encode(hmac.new(self._sign_key, body.encode("ascii"), hashlib.sha256).digest())
+
+    @staticmethod
+    def _aad(user_id: int, alias: str, expires_at: int) -> bytes:
+        return f"{user_id}:{alias}:{expires_at}".encode("utf-8")
+
+    def issue(self, user_id: int, alias: str, key: UserKey, epoch: int = 0) -> str:
+        """Mint a token for an already authenticated user"""
+        expires_at = int(time.time()) + self.ttl_seconds
+        nonce = os.urandom(12)
+        wrapped = self._wrap.encrypt(nonce, key.key, self._aad(user_id, alias, expires_at))
+        payload = {"uid": user_id, "sub": alias, "exp": expires_at, "salt": _b64encode(key.salt), "kdf": _b64encode(key.kdf.encode()), "env": int(key.envelope), "ep": epoch, "key": _b64encode(nonce + wrapped)}
+        body = _b64encode(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+        return f"{body}.{self._sign(body)}"
+
+    def verify(self, token: str) -> AuthSession:
+        """Return the session for a token or raise InvalidSessionToken"""
+        try:
+            body, signature = token.split(".")
+        except ValueError:
+            raise InvalidSessionToken("Malformed token")
+        if not hmac.compare_digest(signature, self._sign(body)):
+            raise InvalidSessionToken("Bad signature")
+        try:
+            payload = json.loads(_b64decode(body))
+            user_id, alias, expires_at = int(payload["uid"]), str(payload["sub"]), int(payload["exp"])
+            if expires_at <= time.time():
+                raise InvalidSessionToken("Token expired")
+            blob = _b64decode(payload["key"])
+            key = self._wrap.decrypt(blob[:12], blob[12:], self._aad(user_id, alias, expires_at))
+            salt = _b64decode(payload["salt"])
+            # Tokens issued before KDF parameters were recorded all carry legacy keys
+            kdf = KdfParams.decode(_b64decode(payload["kdf"]))[0] if "kdf" in payload else LEGACY_KDF
+            envelope = bool(payload.get("env"))
+            epoch = int(payload.get("ep", 0))
+        except InvalidSessionToken:
+            raise
+        except Exception:
+            raise InvalidSessionToken("Malformed token")
+        return AuthSession(user_id=user_id, alias=alias, key=UserKey(user=alias, salt=salt, key=key, kdf=kdf, envelope=envelope), expires_at=expires_at, epoch=epoch)
+
+
+session_tokens = SessionTokens(settings.SECRET_KEY, settings.SESSION_TTL_SECONDS)
+
+bearer_scheme = HTTPBearer(auto_error=False, description="Session token from /login")
+
+
+def _session_from_token(alias: str, credentials: HTTPAuthorizationCredentials) -> AuthSession:
+    try:
+        session = session_tokens.verify(credentials.credentials)
+    except InvalidSessionToken as e:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Invalid session: {e}", headers={"WWW-Authenticate": "Bearer"})
+    if session.alias != alias.lower():
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Session does not belong to this user")
+    return session
+
+
+def _check_session_epoch(session: AuthSession, user: Optional[CachedUser]) -> AuthSession:
+    """Reject tokens of deleted users and tokens issued before the last password change"""
+    if user is None or user.session_epoch != session.epoch:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid session: Session revoked", headers={"WWW-Authenticate": "Bearer"})
+    return session
+
+
+def authenticate(alias: str, password: Optional[str] = None, credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme), db: Session = Depends(get_db)) -> AuthSession:
+    """
+    Resolve the caller from a bearer session token (no KDF; the epoch check is
+    served by the user cache), falling back to the legacy ?password= query parameter.
+    """
+    if credentials is not None:
+        session = _session_from_token(alias, credentials)
+        return _check_session_epoch(session, UserService(db).get_user_by_id(session.user_id))
+    if password is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing session token or password", headers={"WWW-Authenticate": "Bearer"})
+    user_service = UserService(db)
+    user = user_service.get_user_by_alias(alias)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{alias}' not found")
+    key = user_service.unlock(user, password)
+    if not key:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    return AuthSession(user_id=user.id, alias=user.alias, key=key)
+
+
+async def authenticate_async(alias: str, password: Optional[str] = None, credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme), db: AsyncSession = Depends(get_async_db)) -> AuthSession:
+    """Async variant of authenticate for the async router"""
+    if credentials is not None:
+        session = _session_from_token(alias, credentials)
+        return _check_session_epoch(session, await AsyncUserService(db).get_user_by_id(session.user_id))
+    if password is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing session token or password", headers={"WWW-Authenticate": "Bearer"})
+    user_service = AsyncUserService(db)
+    user = await user_service.get_user_by_alias(alias)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{alias}' not found")
+    key = await user_service.unlock(user, password)
+    if not key:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
+    return AuthSession(user_id=user.id, alias=user.alias, key=key)
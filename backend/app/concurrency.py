@@ -0,0 +1,77 @@
+"""
+Execution pools for blocking work.
+
+Route handlers are plain `def` functions, so FastAPI runs them on the anyio
+worker thread pool instead of the event loop; that pool is sized here to match
+the database connection pool. Key derivation is CPU-bound and is pushed onto a
+separate, bounded crypto pool so a burst of logins can't occupy every
+DB thread (or, with a process pool, can run in parallel despite the GIL).
+"""
+import itertools
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, TypeVar
+
+import anyio.to_thread
+
+from app.config import settings
+
+T = TypeVar("T")
+
+_crypto_executor: Optional[Executor] = None
+_worker = threading.local()
+
+
+def crypto_pool_size() -> int:
+    return settings.CRYPTO_POOL_SIZE or os.cpu_count() or 1
+
+
+def configure_threadpool() -> None:
+    """Size the worker thread pool that runs sync route handlers (call from within the event loop)"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.DB_THREADPOOL_SIZE
+
+
+def _mark_crypto_worker() -> None:
+    _worker.active = True
+
+
+def get_crypto_executor() -> Optional[Executor]:
+    """Return the crypto pool, creating it on first use ('inline' mode has none)"""
+    global _crypto_executor
+    # Crypto work started from a crypto worker runs inline; waiting on the pool from within it can deadlock
+    if getattr(_worker, "active", False):
+        return None
+    if _crypto_executor is None and settings.CRYPTO_POOL_KIND != "inline":
+        if settings.CRYPTO_POOL_KIND == "process":
+            _crypto_executor = ProcessPoolExecutor(max_workers=crypto_pool_size(), initializer=_mark_crypto_worker)
+        else:
+            _crypto_executor = ThreadPoolExecutor(max_workers=crypto_pool_size(), thread_name_prefix="crypto", initializer=_mark_crypto_worker)
+    return _crypto_executor
+
+
+def run_crypto(fn: Callable[..., T], *args) -> T:
+    """Run CPU-bound crypto work on the crypto pool and wait for the result"""
+    executor = get_crypto_executor()
+    if executor is None:
+        return fn(*args)
+    return executor.submit(fn, *args).result()
+
+
+def map_crypto(fn: Callable[..., T], items: Iterable, *args) -> List[T]:
+    """Run fn(item, *args) for every item across the crypto pool; results keep the input order"""
+    items = list(items)
+    executor = get_crypto_executor()
+    if executor is None:
+        return [fn(item, *args) for item in items]
+    extra = [itertools.repeat(arg, len(items)) for arg in args]
+    # Larger chunks amortise pickling when the pool is a process pool
+    chunksize = max(1, len(items) // (crypto_pool_size() * 4))
+    return list(executor.map(fn, items, *extra, chunksize=chunksize))
+
+
+def shutdown_crypto_executor() -> None:
+    global _crypto_executor
+    if _crypto_executor is not None:
+        _crypto_executor.shutdown(wait=True)
+        _crypto_executor = None
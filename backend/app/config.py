@@ -1,10 +1,18 @@
+from pydantic import Field
 from pydantic_settings import BaseSettings
 from functools import lru_cache
-from typing import List
+from typing import List, Literal, Optional
+import secrets
 
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    
+    # Async data layer (asyncpg / aiosqlite); URL is derived from DATABASE_URL when unset
+    DATABASE_ASYNC: bool = False
+    ASYNC_DATABASE_URL: Optional[str] = None
     
     # API
     API_V1_PREFIX: str = "/api/v1"
@@ -18,9 +26,68 @@ class Settings(BaseSettings):
     MAX_ALIAS_LENGTH: int = 100
     MIN_ALIAS_LENGTH: int = 1
     
+    # Sessions (set SECRET_KEY explicitly when running more than one worker)
+    SECRET_KEY: str = Field(default_factory=lambda: secrets.token_urlsafe(32))
+    SESSION_TTL_SECONDS: int = 900
+    
     # Rate limiting
     RATE_LIMIT_ENABLED: bool = True
     RATE_LIMIT_PER_MINUTE: int = 60
+    RATE_LIMIT_EXPENSIVE_COST: int = 10  # Tokens charged for KDF-heavy requests (login, register, ?password= auth)
+    RATE_LIMIT_READ_COST: float = 0.1  # Tokens charged for GET/HEAD requests (writes cost 1), so a dashboard load fetching every note stays within the limit
+    RATE_LIMIT_SHARDS: int = 16
+    
+    # Instrumentation (per-route latency histograms on /metrics)
+    METRICS_ENABLED: bool = True
+    
+    # Execution pools
+    DB_THREADPOOL_SIZE: int = 30  # Worker threads for sync handlers; matches pool_size + max_overflow
+    CRYPTO_POOL_KIND: Literal["thread", "process", "inline"] = "thread"
+    CRYPTO_POOL_SIZE: int = 0  # 0 = one worker per CPU
+    
+    # Password key derivation (python -m app.kdf picks values for a target latency; keys wrapped under other parameters are rewrapped at login)
+    KDF_ALGORITHM: Literal["pbkdf2-sha256", "scrypt"] = "pbkdf2-sha256"
+    KDF_PBKDF2_ITERATIONS: int = 100_000
+    KDF_SCRYPT_N: int = 32768  # Power of two; memory per derivation is 128 * N * r bytes
+    KDF_SCRYPT_R: int = 8
+    KDF_SCRYPT_P: int = 1
+    KDF_REHASH_ON_LOGIN: bool = True  # Rewrap an account's data key under the configured KDF when it logs in
+    
+    # Key derivation cache
+    KEY_CACHE_SIZE: int = 1024
+    KEY_CACHE_TTL_SECONDS: int = 300
+    
+    # User lookup cache
+    USER_CACHE_SIZE: int = 4096
+    USER_CACHE_TTL_SECONDS: int = 30  # Also bounds how long other workers serve a user changed elsewhere
+    LAST_ACCESS_FLUSH_INTERVAL_SECONDS: int = 30  # Buffered last_accessed_at times are written this often; 0 = only at shutdown
+    
+    # Compression before encryption (zstd needs the optional 'zstandard' package)
+    COMPRESSION_ALGORITHM: Literal["none", "zlib", "zstd"] = "zlib"
+    COMPRESSION_MIN_BYTES: int = 512  # Smaller plaintexts are stored uncompressed
+    
+    # Delta saves
+    NOTE_DELTA_COMPACT_THRESHOLD: int = 32  # Deltas kept before they are folded into a new base snapshot
+    
+    # Note revisions ("count" keeps the last N; "decay" thins older revisions to hourly/daily/weekly)
+    NOTE_REVISION_RETENTION: Literal["count", "decay"] = "count"
+    NOTE_REVISION_KEEP_LAST: int = 50
+    NOTE_REVISION_PRUNE_INTERVAL_SECONDS: int = 600  # 0 disables the background pruner
+    NOTE_REVISION_PRUNE_BATCH_SIZE: int = 200  # Notes pruned per transaction
+    
+    # Bulk import
+    IMPORT_BATCH_SIZE: int = 500  # Records encrypted and inserted per transaction
+    IMPORT_MAX_RECORD_BYTES: int = 8_000_000  # Largest single NDJSON line or tar member accepted
+    
+    # Blind-index search (opt-in; tokens are keyed hashes of the words and word prefixes of each note)
+    SEARCH_INDEX_ENABLED: bool = False
+    SEARCH_MIN_PREFIX_LENGTH: int = 3  # Shortest word prefix indexed for prefix matching; 0 = whole words only
+    SEARCH_MAX_TERM_LENGTH: int = 32  # Longer words are indexed by their first characters only
+    
+    # Shared notes
+    SHARE_CACHE_SIZE: int = 1024
+    SHARE_CACHE_TTL_SECONDS: int = 60  # Also bounds how long other workers keep serving a revoked link
+    SHARE_VIEW_FLUSH_INTERVAL_SECONDS: int = 10  # View counts are written in batches this often; 0 = only at shutdown
     
     class Config:
         env_file = ".env"
@@ -2,78 +2,372 @@
 Server-side encryption utilities for simple API mode.
 Note: In production zero-knowledge mode, encryption happens client-side only.
 This is for testing/simplified API usage.
+
+Ciphertext is stored as raw bytes: a header followed by
+salt (16 bytes) + nonce (12 bytes) + ciphertext (no salt in v5).
+    v1 (legacy): 0x01, per-record salt
+    v2:          0x02, per-user salt
+    v3:          0x03 + codec byte, per-user salt; the plaintext was compressed
+                 with the codec before encryption and the header is bound to
+                 the ciphertext as AES-GCM associated data
+    v4:          0x04 + codec byte + the KDF id and cost parameters the key
+                 was derived with (see app.kdf), per-user salt; otherwise like
+                 v3. Keys of v1-v3 blobs were all derived with LEGACY_KDF
+    v5:          0x05 + codec byte, no salt; encrypted under the user's random
+                 data key, otherwise like v3
+
+Envelope encryption: every account has a random data key, stored in
+User.wrapped_key as a v4 blob under the password-derived key (wrap_key). All of
+the user's records are v5 blobs under the data key, so after one unwrap at login
+a field costs a single AES-GCM operation, and password or KDF changes only
+rewrap the data key. Accounts from before that have v2-v4 records under the
+password-derived key itself (sharing the salt and KDF parameters of their
+encrypted alias) until their next login moves them over.
+
+Base64 only appears at the JSON boundary (to_text / from_text), where the
+text forms are unchanged from when blobs were stored as TEXT:
+    v1: base64(salt + nonce + ciphertext)
+    vN: "vN:" + base64(everything after the version byte)
 """
 import hashlib
+import hmac
 import base64
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Callable, Optional, Tuple, Union
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.backends import default_backend
 import os
 
+from app.config import settings
+from app.concurrency import run_crypto
+from app.kdf import KdfParams, LEGACY_KDF, configured_kdf, derive
+from app.metrics import timed
+
+try:
+    import zstandard
+except ImportError:  # optional; only needed for COMPRESSION_ALGORITHM=zstd
+    zstandard = None
+
+SALT_SIZE = 16
+NONCE_SIZE = 12
+BLOB_V1 = 0x01
+BLOB_V2 = 0x02
+BLOB_V3 = 0x03
+BLOB_V4 = 0x04
+BLOB_V5 = 0x05
+DATA_KEY_SIZE = 32
+
+# Codec byte of a v3 header
+CODEC_NONE = 0x00
+CODEC_ZLIB = 0x01
+CODEC_ZSTD = 0x02
+COMPRESSION_CODECS = {"none": CODEC_NONE, "zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+
+if settings.COMPRESSION_ALGORITHM == "zstd" and zstandard is None:
+    raise RuntimeError("COMPRESSION_ALGORITHM=zstd requires the 'zstandard' package")
+
+# Parameters new keys are derived with; keys under any other parameters are outdated
+CURRENT_KDF = configured_kdf(settings)
+
+
+def _compress(data: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, 6)
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return data
+
+
+def _decompress(data: bytes, codec: int) -> bytes:
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(data)
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("Blob is zstd-compressed but the 'zstandard' package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec != CODEC_NONE:
+        raise ValueError(f"Unknown compression codec {codec}")
+    return data
+
+
+class KeyCache:
+    """
+    Bounded, TTL-evicted cache of derived keys.
+    Entries are keyed on an HMAC digest of (user, password, salt, KDF parameters)
+    under a per-process secret, so plaintext passwords are never held as cache keys.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 300.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._secret = os.urandom(32)
+        self._entries: "OrderedDict[bytes, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _digest(self, user: str, password: str, salt: bytes, kdf: KdfParams) -> bytes:
+        mac = hmac.new(self._secret, digestmod=hashlib.sha256)
+        for part in (user.encode('utf-8'), password.encode('utf-8'), salt, kdf.encode()):
+            mac.update(struct.pack('>I', len(part)))
+            mac.update(part)
+        return mac.digest()
+
+    def get_or_derive(self, user: str, password: str, salt: bytes, kdf: KdfParams, derive: Callable[[str, bytes, KdfParams], bytes]) -> bytes:
+        """Return the cached key for (user, password, salt, kdf), deriving it on a miss"""
+        digest = self._digest(user, password, salt, kdf)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[digest]
+                self.evictions += 1
+            self.misses += 1
+        # Derive outside the lock so concurrent misses don't serialize on the KDF
+        key = derive(password, salt, kdf)
+        with self._lock:
+            self._entries[digest] = (time.monotonic() + self.ttl_seconds, key)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return key
+
+    def discard(self, user: str, password: str, salt: bytes, kdf: KdfParams) -> None:
+        """Drop an entry, e.g. after the derived key failed to authenticate"""
+        with self._lock:
+            self._entries.pop(self._digest(user, password, salt, kdf), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+key_cache = KeyCache(max_size=settings.KEY_CACHE_SIZE, ttl_seconds=settings.KEY_CACHE_TTL_SECONDS)
+
+
+@dataclass(frozen=True)
+class UserKey:
+    """
+    A user's unlocked encryption key.
+    With envelope set, key is the user's data key (v5 blobs) and salt/kdf are
+    those of the password-derived key wrapping it; otherwise key itself was
+    derived from the password with salt and kdf (v2-v4 blobs).
+    The password is kept only so records under other derived keys (legacy v1
+    per-record salts) stay readable and the data key can be rewrapped.
+    """
+    user: str
+    salt: bytes
+    key: bytes = field(repr=False)
+    password: Optional[str] = field(default=None, repr=False)
+    kdf: KdfParams = LEGACY_KDF
+    envelope: bool = False
+
 
 class CryptoUtils:
     """Simple encryption utilities for server-side operations"""
-    
+
     @staticmethod
-    def derive_key(password: str, salt: bytes) -> bytes:
-        """Derive encryption key from password using PBKDF2"""
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=salt,
-            iterations=100000,
-            backend=default_backend()
-        )
-        return kdf.derive(password.encode('utf-8'))
-    
+    @timed("kdf")
+    def derive_key(password: str, salt: bytes, kdf: Optional[KdfParams] = None) -> bytes:
+        """Derive encryption key from password on the crypto pool (kdf defaults to the configured one)"""
+        return run_crypto(derive, password, salt, kdf or CURRENT_KDF)
+
+    @staticmethod
+    def cached_key(user: str, password: str, salt: bytes, kdf: Optional[KdfParams] = None) -> bytes:
+        """Derive encryption key through the in-process key cache"""
+        return key_cache.get_or_derive(user, password, salt, kdf or CURRENT_KDF, CryptoUtils.derive_key)
+
+    @staticmethod
+    def new_salt() -> bytes:
+        return os.urandom(SALT_SIZE)
+
+    @staticmethod
+    def user_key(user: str, password: str, salt: bytes, kdf: Optional[KdfParams] = None) -> UserKey:
+        """Build the (cached) key used for all of a user's records; new keys use the configured KDF"""
+        kdf = kdf or CURRENT_KDF
+        return UserKey(user=user, salt=salt, key=CryptoUtils.cached_key(user, password, salt, kdf), password=password, kdf=kdf)
+
+    @staticmethod
+    def new_data_key() -> bytes:
+        return os.urandom(DATA_KEY_SIZE)
+
+    @staticmethod
+    def envelope_key(wrapping_key: UserKey, data_key: bytes) -> UserKey:
+        """The key a user's records are encrypted with, remembering the (password-derived) key that wraps it"""
+        return replace(wrapping_key, key=data_key, envelope=True)
+
+    @staticmethod
+    def wrap_key(data_key: bytes, wrapping_key: UserKey) -> bytes:
+        """Encrypt a data key under a password-derived key; a v4 blob carrying its salt and KDF parameters"""
+        header = bytes([BLOB_V4, CODEC_NONE]) + wrapping_key.kdf.encode()
+        nonce = os.urandom(NONCE_SIZE)
+        return header + wrapping_key.salt + nonce + AESGCM(wrapping_key.key).encrypt(nonce, data_key, header)
+
     @staticmethod
-    def encrypt(plaintext: str, password: str) -> str:
+    def unwrap_key(wrapped: bytes, wrapping_key: UserKey) -> bytes:
+        """The data key in a wrap_key blob; raises InvalidTag when wrapping_key (i.e. the password) is wrong"""
+        header, _, nonce, ciphertext = CryptoUtils._unpack(wrapped)
+        return AESGCM(wrapping_key.key).decrypt(nonce, ciphertext, header)
+
+    @staticmethod
+    def is_outdated(user_key: UserKey) -> bool:
+        """True when the key was derived with other parameters than the configured KDF"""
+        return user_key.kdf != CURRENT_KDF
+
+    @staticmethod
+    def to_text(blob: bytes) -> str:
+        """Render a stored blob in its JSON text form"""
+        body = base64.b64encode(blob[1:]).decode('ascii')
+        return body if blob[0] == BLOB_V1 else f"v{blob[0]}:{body}"
+
+    @staticmethod
+    def from_text(text: str) -> bytes:
+        """Parse the JSON text form of a blob back into stored bytes"""
+        version, sep, body = text.partition(":")
+        if sep and version[:1] == "v" and version[1:].isdigit():
+            return bytes([int(version[1:])]) + base64.b64decode(body)
+        return bytes([BLOB_V1]) + base64.b64decode(text)
+
+    @staticmethod
+    def _unpack(blob: bytes) -> Tuple[bytes, bytes, bytes, bytes]:
+        """Split a blob into (header, salt, nonce, ciphertext)"""
+        if blob[0] == BLOB_V5:
+            return blob[:2], b"", blob[2:2 + NONCE_SIZE], blob[2 + NONCE_SIZE:]
+        if blob[0] == BLOB_V4:
+            header_size = 2 + KdfParams.decode(blob[2:])[1]
+        else:
+            header_size = 2 if blob[0] == BLOB_V3 else 1
+        salt_end = header_size + SALT_SIZE
+        return blob[:header_size], blob[header_size:salt_end], blob[salt_end:salt_end + NONCE_SIZE], blob[salt_end + NONCE_SIZE:]
+
+    @staticmethod
+    def _header_kdf(header: bytes) -> KdfParams:
+        return KdfParams.decode(header[2:])[0] if header[0] == BLOB_V4 else LEGACY_KDF
+
+    @staticmethod
+    def extract_salt(blob: bytes) -> bytes:
+        """Return the KDF salt embedded in a blob (empty for v5)"""
+        return CryptoUtils._unpack(blob)[1]
+
+    @staticmethod
+    def extract_kdf(blob: bytes) -> KdfParams:
+        """Return the KDF parameters a blob's key was derived with"""
+        return CryptoUtils._header_kdf(CryptoUtils._unpack(blob)[0])
+
+    @staticmethod
+    @timed("cipher")
+    def encrypt_with_key(plaintext: str, user_key: UserKey, codec: Optional[int] = None) -> bytes:
         """
-        Encrypt plaintext with password using AES-256-GCM
-        Returns base64 encoded: salt (16 bytes) + nonce (12 bytes) + ciphertext
+        Compress (above COMPRESSION_MIN_BYTES) then encrypt under an unlocked user
+        key using AES-256-GCM. codec defaults to COMPRESSION_ALGORITHM.
+        Returns a v5 blob (0x05 + codec + nonce + ciphertext) under a data key, else
+        a v4 blob: 0x04 + codec + KDF parameters + salt + nonce + ciphertext
         """
-        # Generate random salt and nonce
-        salt = os.urandom(16)
-        nonce = os.urandom(12)
-        
-        # Derive key from password
-        key = CryptoUtils.derive_key(password, salt)
-        
-        # Encrypt
-        aesgcm = AESGCM(key)
-        ciphertext = aesgcm.encrypt(nonce, plaintext.encode('utf-8'), None)
-        
-        # Combine: salt + nonce + ciphertext
-        combined = salt + nonce + ciphertext
-        
-        # Return as base64
-        return base64.b64encode(combined).decode('utf-8')
-    
+        data = plaintext.encode('utf-8')
+        if codec is None:
+            codec = COMPRESSION_CODECS[settings.COMPRESSION_ALGORITHM]
+        if codec != CODEC_NONE and len(data) >= settings.COMPRESSION_MIN_BYTES:
+            compressed = _compress(data, codec)
+            # Keep incompressible data as is
+            if len(compressed) < len(data):
+                data = compressed
+            else:
+                codec = CODEC_NONE
+        else:
+            codec = CODEC_NONE
+        nonce = os.urandom(NONCE_SIZE)
+        if user_key.envelope:
+            header = bytes([BLOB_V5, codec])
+            return header + nonce + AESGCM(user_key.key).encrypt(nonce, data, header)
+        header = bytes([BLOB_V4, codec]) + user_key.kdf.encode()
+        return header + user_key.salt + nonce + AESGCM(user_key.key).encrypt(nonce, data, header)
+
+    @staticmethod
+    @timed("cipher")
+    def decrypt_with_key(blob: bytes, user_key: UserKey) -> str:
+        """
+        Decrypt (and decompress) a blob with a user key
+        Blobs under a password-derived key other than this one (legacy v1, or
+        written before a rehash) fall back to the cached password KDF
+        """
+        header, salt, nonce, ciphertext = CryptoUtils._unpack(blob)
+        kdf = CryptoUtils._header_kdf(header)
+        if header[0] == BLOB_V5:
+            if not user_key.envelope:
+                raise ValueError("Blob was encrypted under a data key")
+            key = user_key.key
+        elif not user_key.envelope and salt == user_key.salt and kdf == user_key.kdf:
+            key = user_key.key
+        elif user_key.password is not None:
+            key = CryptoUtils.cached_key(user_key.user, user_key.password, salt, kdf)
+        else:
+            raise ValueError("Blob was not encrypted under this user key")
+        if header[0] >= BLOB_V3:
+            data = _decompress(AESGCM(key).decrypt(nonce, ciphertext, header), header[1])
+        else:
+            data = AESGCM(key).decrypt(nonce, ciphertext, None)
+        return data.decode('utf-8')
+
     @staticmethod
-    def decrypt(encrypted_data: str, password: str) -> str:
+    def encrypt(plaintext: str, password: str, user: str = "") -> bytes:
         """
-        Decrypt encrypted data with password
+        Encrypt plaintext with password using AES-256-GCM under a fresh salt and the configured KDF
+        Returns a v4 blob: 0x04 + codec + KDF parameters + salt (16 bytes) + nonce (12 bytes) + ciphertext
+        """
+        return CryptoUtils.encrypt_with_key(plaintext, CryptoUtils.user_key(user, password, CryptoUtils.new_salt()))
+
+    @staticmethod
+    def decrypt(blob: bytes, password: str, user: str = "") -> str:
+        """
+        Decrypt a blob with password
         Returns plaintext or raises exception if password is wrong
         """
-        # Decode from base64
-        combined = base64.b64decode(encrypted_data)
-        
-        # Extract components
-        salt = combined[:16]
-        nonce = combined[16:28]
-        ciphertext = combined[28:]
-        
-        # Derive key
-        key = CryptoUtils.derive_key(password, salt)
-        
-        # Decrypt
-        aesgcm = AESGCM(key)
-        plaintext = aesgcm.decrypt(nonce, ciphertext, None)
+        return CryptoUtils.decrypt_with_key(blob, CryptoUtils.user_key(user, password, CryptoUtils.extract_salt(blob), CryptoUtils.extract_kdf(blob)))
+
+    @staticmethod
+    def hash_content(content: Union[str, bytes]) -> str:
+        """Generate SHA-256 hash of content"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        return hashlib.sha256(content).hexdigest()
+
+    @staticmethod
+    def keyed_hasher(user_key: UserKey, purpose: bytes) -> Callable[[Union[str, bytes]], str]:
+        """
+        HMAC-SHA256 (hex) under a per-purpose subkey of the user key, keyed once for many inputs.
+        Equal inputs give equal hashes for the same user without exposing the plaintext.
+        """
+        base = hmac.new(hmac.new(user_key.key, purpose, hashlib.sha256).digest(), digestmod=hashlib.sha256)
         
-        return plaintext.decode('utf-8')
+        def keyed_hash(content: Union[str, bytes]) -> str:
+            mac = base.copy()
+            mac.update(content.encode('utf-8') if isinstance(content, str) else content)
+            return mac.hexdigest()
+        return keyed_hash
     
     @staticmethod
-    def hash_content(content: str) -> str:
-        """Generate SHA-256 hash of content"""
-        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+    def keyed_hash(content: Union[str, bytes], user_key: UserKey, purpose: bytes) -> str:
+        """Single keyed_hasher digest"""
+        return CryptoUtils.keyed_hasher(user_key, purpose)(content)
@@ -1,14 +1,17 @@
+from typing import AsyncIterator, Optional
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from app.config import settings
 
 # Create database engine
 engine = create_engine(
     settings.DATABASE_URL,
-    pool_pre_ping=True,      # Verify connections before using
-    pool_size=10,             # Connection pool size
-    max_overflow=20,          # Max connections beyond pool_size
-    echo=False                # Set to True for SQL query logging
+    pool_pre_ping=True,                     # Verify connections before using
+    pool_size=settings.DB_POOL_SIZE,        # Connection pool size
+    max_overflow=settings.DB_MAX_OVERFLOW,  # Max connections beyond pool_size
+    echo=False                              # Set to True for SQL query logging
 )
 
 # Create session factory
@@ -18,6 +21,40 @@ SessionLocal = sessionmaker(
     bind=engine
 )
 
+# Async drivers for each sync backend
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def async_database_url() -> str:
+    """Async URL from ASYNC_DATABASE_URL, or DATABASE_URL with its driver swapped"""
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    url = make_url(settings.DATABASE_URL)
+    return url.set(drivername=ASYNC_DRIVERS.get(url.get_backend_name(), url.drivername)).render_as_string(hide_password=False)
+
+
+# Async engine, only built when the async data layer is enabled
+async_engine: Optional[AsyncEngine] = None
+AsyncSessionLocal: Optional[async_sessionmaker[AsyncSession]] = None
+
+if settings.DATABASE_ASYNC:
+    async_engine = create_async_engine(
+        async_database_url(),
+        pool_pre_ping=True,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        echo=False
+    )
+    # expire_on_commit=False: attributes can't lazy-load after commit in async code
+    AsyncSessionLocal = async_sessionmaker(
+        async_engine,
+        autoflush=False,
+        expire_on_commit=False
+    )
+
 # Base class for models (SQLAlchemy 2.0 style)
 class Base(DeclarativeBase):
     pass
@@ -33,3 +70,11 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    """
+    Async database session dependency.
+    Yields an AsyncSession and ensures it's closed after use.
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
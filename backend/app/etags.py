@@ -0,0 +1,71 @@
+"""
+Strong ETags and conditional request handling for note and folder reads.
+
+A note's ETag is derived from its content_hash together with delta_count and
+updated_at: content_hash alone misses title/folder patches, which leave the body
+alone, and compaction, which rewrites the stored base. Every tag is computed from
+columns the handler has already loaded, so an If-None-Match hit answers 304
+before anything is decrypted or serialized.
+"""
+import hashlib
+from datetime import datetime
+from typing import Iterable, Optional
+
+from fastapi import Response, status
+
+# Conditional responses must be revalidated: they carry private, per-user data
+CACHE_CONTROL = "private, no-cache"
+
+
+def _etag(*parts) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def note_etag(content_hash: str, delta_count: int, updated_at: Optional[datetime]) -> str:
+    return _etag(content_hash, delta_count, updated_at.isoformat() if updated_at else "")
+
+
+def folder_etag(folder) -> str:
+    # encrypted_name is re-encrypted (new nonce) on every rename
+    return _etag(folder.encrypted_name, folder.color or "", folder.icon or "")
+
+
+def user_view_etag(user, notes: Iterable, folders: Iterable, next_cursor: Optional[str]) -> str:
+    """List-level tag for a page of GET /{alias}: the user fields plus every note and folder tag"""
+    parts = [user.id, user.encrypted_alias, user.last_accessed_at.isoformat(), next_cursor or ""]
+    parts += [f"n{note.id}:{note_etag(note.content_hash, note.delta_count, note.updated_at)}" for note in notes]
+    parts += [f"f{folder.id}:{folder_etag(folder)}" for folder in folders]
+    return _etag(*parts)
+
+
+def _tags(header: str) -> list:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def if_none_match(header: Optional[str], etag: str) -> bool:
+    """True if the client's copy is current (weak comparison, per RFC 9110)"""
+    if not header:
+        return False
+    tags = _tags(header)
+    return "*" in tags or etag in [tag[2:] if tag.startswith("W/") else tag for tag in tags]
+
+
+def if_match(header: Optional[str], etag: str) -> bool:
+    """True if the precondition holds (strong comparison; an absent header always holds)"""
+    if header is None:
+        return True
+    tags = _tags(header)
+    return "*" in tags or etag in tags
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+def set_etag(response: Response, etag: str) -> None:
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
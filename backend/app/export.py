@@ -0,0 +1,191 @@
+"""
+Streaming vault export.
+
+A user's folders and notes are read with server-side cursors (yield_per) and
+encoded record by record, so memory stays flat regardless of vault size.
+Records are plain dicts shared by both archive formats:
+
+    ndjson: one JSON object per line ("header", "folder"..., "note"..., "end")
+    tar:    manifest.json, folders/<id>.json, notes/<id>.json, summary.json
+
+Encrypted exports carry ciphertext in its JSON text form, plus any pending
+deltas of a note; decrypted exports carry plaintext, using the session's
+already derived key for every record.
+"""
+import io
+import json
+import tarfile
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional
+
+from anyio import to_thread
+from sqlalchemy import select, Select
+
+from app.crypto import CryptoUtils, UserKey
+from app.database import SessionLocal, AsyncSessionLocal
+from app.models import Folder, Note
+from app.services import apply_note_deltas, group_note_deltas, notes_deltas_query
+
+EXPORT_FORMAT_VERSION = 1
+# Rows fetched per round trip from the server-side cursor
+EXPORT_BATCH_SIZE = 500
+
+
+def export_folders_query(user_id: int) -> Select:
+    return select(Folder.id, Folder.encrypted_name, Folder.color, Folder.icon, Folder.created_at).where(Folder.user_id == user_id, Folder.is_active == True).order_by(Folder.id)
+
+
+def export_notes_query(user_id: int) -> Select:
+    return (
+        select(Note.id, Note.folder_id, Note.encrypted_title, Note.encrypted_content, Note.content_hash, Note.created_at, Note.updated_at, Note.delta_count)
+        .where(Note.user_id == user_id, Note.is_active == True)
+        .order_by(Note.id)
+    )
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def header_record(alias: str, decrypted: bool) -> dict:
+    return {"type": "header", "version": EXPORT_FORMAT_VERSION, "alias": alias, "decrypted": decrypted, "exported_at": datetime.utcnow().isoformat()}
+
+
+def folder_records(rows, key: UserKey, decrypted: bool) -> List[dict]:
+    records = []
+    for row in rows:
+        record = {"type": "folder", "id": row.id, "color": row.color, "icon": row.icon, "created_at": _timestamp(row.created_at)}
+        if decrypted:
+            try:
+                record["name"] = CryptoUtils.decrypt_with_key(row.encrypted_name, key)
+            except Exception:
+                record["name"] = None
+        else:
+            record["encrypted_name"] = CryptoUtils.to_text(row.encrypted_name)
+        records.append(record)
+    return records
+
+
+def note_records(rows, deltas: Dict[int, List[bytes]], key: UserKey, decrypted: bool) -> List[dict]:
+    """Export records for one cursor partition of notes"""
+    records = []
+    for row in rows:
+        record = {"type": "note", "id": row.id, "folder_id": row.folder_id, "content_hash": row.content_hash, "created_at": _timestamp(row.created_at), "updated_at": _timestamp(row.updated_at)}
+        note_deltas = deltas.get(row.id, [])
+        if decrypted:
+            try:
+                record["title"] = CryptoUtils.decrypt_with_key(row.encrypted_title, key) if row.encrypted_title else None
+                record["content"] = apply_note_deltas(CryptoUtils.decrypt_with_key(row.encrypted_content, key), note_deltas, key)
+            except Exception:
+                record["title"] = record["content"] = None
+                record["error"] = "decryption failed"
+        else:
+            record["encrypted_title"] = CryptoUtils.to_text(row.encrypted_title) if row.encrypted_title else None
+            record["encrypted_content"] = CryptoUtils.to_text(row.encrypted_content)
+            if note_deltas:
+                record["encrypted_deltas"] = [CryptoUtils.to_text(blob) for blob in note_deltas]
+        records.append(record)
+    return records
+
+
+def end_record(folders: int, notes: int) -> dict:
+    return {"type": "end", "folders": folders, "notes": notes}
+
+
+class NdjsonEncoder:
+    media_type = "application/x-ndjson"
+    extension = "ndjson"
+
+    def encode(self, record: dict) -> bytes:
+        return json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8") + b"\n"
+
+    def finish(self) -> bytes:
+        return b""
+
+
+class _Drain(io.RawIOBase):
+    """Write-only sink whose contents are handed out and dropped after each record"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+class TarEncoder:
+    media_type = "application/x-tar"
+    extension = "tar"
+    member_names = {"header": "manifest.json", "end": "summary.json"}
+
+    def __init__(self):
+        self._sink = _Drain()
+        # "w|" is the non-seeking stream mode, so nothing is buffered beyond one block
+        self._tar = tarfile.open(fileobj=self._sink, mode="w|")
+        self._mtime = time.time()
+
+    def encode(self, record: dict) -> bytes:
+        name = self.member_names.get(record["type"]) or f"{record['type']}s/{record['id']}.json"
+        data = json.dumps(record, ensure_ascii=False, indent=2).encode("utf-8")
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = self._mtime
+        self._tar.addfile(info, io.BytesIO(data))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        self._tar.close()
+        return self._sink.drain()
+
+
+EXPORT_ENCODERS = {"ndjson": NdjsonEncoder, "tar": TarEncoder}
+
+
+def stream_export(user_id: int, alias: str, key: UserKey, format: str = "ndjson", decrypted: bool = False) -> Iterator[bytes]:
+    """Encoded export chunks; owns its session so it outlives the request handler"""
+    encoder = EXPORT_ENCODERS[format]()
+    folders = notes = 0
+    with SessionLocal() as db:
+        yield encoder.encode(header_record(alias, decrypted))
+        result = db.execute(export_folders_query(user_id).execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for partition in result.partitions():
+            yield b"".join(encoder.encode(record) for record in folder_records(partition, key, decrypted))
+            folders += len(partition)
+        result = db.execute(export_notes_query(user_id).execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for partition in result.partitions():
+            delta_ids = [row.id for row in partition if row.delta_count]
+            deltas = group_note_deltas(db.execute(notes_deltas_query(delta_ids))) if delta_ids else {}
+            yield b"".join(encoder.encode(record) for record in note_records(partition, deltas, key, decrypted))
+            notes += len(partition)
+    yield encoder.encode(end_record(folders, notes)) + encoder.finish()
+
+
+async def stream_export_async(user_id: int, alias: str, key: UserKey, format: str = "ndjson", decrypted: bool = False) -> AsyncIterator[bytes]:
+    """Async variant of stream_export; record building and crypto run on worker threads"""
+    encoder = EXPORT_ENCODERS[format]()
+    folders = notes = 0
+    async with AsyncSessionLocal() as db:
+        yield encoder.encode(header_record(alias, decrypted))
+        result = await db.stream(export_folders_query(user_id).execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for partition in result.partitions():
+            records = await to_thread.run_sync(folder_records, partition, key, decrypted)
+            yield b"".join(encoder.encode(record) for record in records)
+            folders += len(partition)
+        result = await db.stream(export_notes_query(user_id).execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for partition in result.partitions():
+            delta_ids = [row.id for row in partition if row.delta_count]
+            deltas = group_note_deltas(await db.execute(notes_deltas_query(delta_ids))) if delta_ids else {}
+            records = await to_thread.run_sync(note_records, partition, deltas, key, decrypted)
+            yield b"".join(encoder.encode(record) for record in records)
+            notes += len(partition)
+    yield encoder.encode(end_record(folders, notes)) + encoder.finish()
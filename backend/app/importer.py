@@ -0,0 +1,357 @@
+"""
+Streaming bulk import.
+
+Accepts the archives app.export writes (NDJSON lines or tar members) as well as
+hand-written NDJSON with plaintext "title"/"content" notes. The upload is parsed
+incrementally and handled IMPORT_BATCH_SIZE records at a time: records are
+validated and encrypted on the crypto pool, then inserted with executemany in
+one transaction per batch.
+
+Ciphertext in an archive is only accepted under the session's own key: blobs
+under any other salt or KDF parameters are reported as errors instead of having
+a key derived for them, and encoded sizes are checked before anything is
+decrypted.
+
+Every imported note carries import_hash, a keyed hash of its plaintext title and
+content. A re-upload of an interrupted import skips the notes that were already
+committed, and folders are matched by name, so resuming never duplicates data.
+"""
+import json
+import tarfile
+import threading
+from dataclasses import replace
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from anyio import to_thread
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from app.concurrency import map_crypto
+from app.config import settings
+from app.crypto import CryptoUtils, UserKey
+from app.database import SessionLocal
+from app.models import Folder, Note
+from app.schemas import FolderCreate, ImportProgress, NoteCreate
+from app.services import IMPORT_HASH_PURPOSE, SEARCH_FIELD_CONTENT, SEARCH_FIELD_TITLE, SEARCH_TOKEN_INSERT, apply_note_deltas, note_search_tokens, search_token_rows
+
+# Errors kept on the progress report; the rest are only counted
+MAX_REPORTED_ERRORS = 20
+# Header, salt, nonce and tag bytes a blob adds to its (possibly uncompressed) plaintext, rounded up
+MAX_BLOB_OVERHEAD = 64
+
+
+class ImportFormatError(ValueError):
+    """The upload can't be parsed; nothing after this point is imported"""
+
+
+class ImportInProgress(Exception):
+    pass
+
+
+def _parse_record(data: bytes) -> dict:
+    try:
+        record = json.loads(data)
+    except ValueError as exc:
+        raise ImportFormatError(f"Invalid JSON record: {exc}") from exc
+    if not isinstance(record, dict):
+        raise ImportFormatError("Every record must be a JSON object")
+    return record
+
+
+class NdjsonReader:
+    """Incremental NDJSON parser; feed() returns the records completed by a chunk"""
+
+    def __init__(self, max_record_bytes: int):
+        self._buffer = bytearray()
+        self._max_record_bytes = max_record_bytes
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        self._buffer += chunk
+        records, start = [], 0
+        while (end := self._buffer.find(b"\n", start)) >= 0:
+            if self._buffer[start:end].strip():
+                records.append(_parse_record(self._buffer[start:end]))
+            start = end + 1
+        del self._buffer[:start]
+        if len(self._buffer) > self._max_record_bytes:
+            raise ImportFormatError(f"Record larger than {self._max_record_bytes} bytes")
+        return records
+
+    def close(self) -> List[dict]:
+        records = [_parse_record(self._buffer)] if self._buffer.strip() else []
+        self._buffer.clear()
+        return records
+
+
+class TarReader:
+    """
+    Incremental tar parser yielding the JSON document of every regular *.json member.
+    Other members (directories, pax headers, attachments) are skipped as they stream past.
+    """
+
+    def __init__(self, max_record_bytes: int):
+        self._buffer = bytearray()
+        self._max_record_bytes = max_record_bytes
+        self._member: Optional[tarfile.TarInfo] = None  # Member whose data is being read; None while skipping
+        self._remaining: Optional[int] = None  # Padded data bytes left in the current member; None = expecting a header
+        self._finished = False
+
+    def feed(self, chunk: bytes) -> List[dict]:
+        if self._finished:
+            return []
+        self._buffer += chunk
+        records = []
+        while True:
+            if self._remaining is None:
+                if len(self._buffer) < tarfile.BLOCKSIZE:
+                    break
+                header = bytes(self._buffer[:tarfile.BLOCKSIZE])
+                del self._buffer[:tarfile.BLOCKSIZE]
+                if header == tarfile.NUL * tarfile.BLOCKSIZE:
+                    # End-of-archive marker; trailing padding is ignored
+                    self._finished = True
+                    self._buffer.clear()
+                    break
+                try:
+                    info = tarfile.TarInfo.frombuf(header, "utf-8", "surrogateescape")
+                except tarfile.HeaderError as exc:
+                    raise ImportFormatError(f"Invalid tar header: {exc}") from exc
+                wanted = info.isreg() and info.name.endswith(".json")
+                if wanted and info.size > self._max_record_bytes:
+                    raise ImportFormatError(f"Member {info.name} is larger than {self._max_record_bytes} bytes")
+                self._member = info if wanted else None
+                self._remaining = -(-info.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+            if self._member is None:
+                skipped = min(self._remaining, len(self._buffer))
+                del self._buffer[:skipped]
+                self._remaining -= skipped
+                if self._remaining:
+                    break
+            else:
+                if len(self._buffer) < self._remaining:
+                    break
+                records.append(_parse_record(bytes(self._buffer[:self._member.size])))
+                del self._buffer[:self._remaining]
+            self._member = self._remaining = None
+        return records
+
+    def close(self) -> List[dict]:
+        if self._remaining is not None or (self._buffer and not self._finished):
+            raise ImportFormatError("Truncated tar archive")
+        return []
+
+
+IMPORT_READERS = {"ndjson": NdjsonReader, "tar": TarReader}
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if isinstance(value, str) else None
+    except ValueError:
+        return None
+
+
+def _prepare_folder(record: dict, key: UserKey) -> dict:
+    if record.get("encrypted_name"):
+        name = CryptoUtils.decrypt_with_key(CryptoUtils.from_text(record["encrypted_name"]), key)
+    else:
+        name = record.get("name")
+    folder = FolderCreate.model_validate({"name": name, "color": record.get("color") or "default", "icon": record.get("icon") or "folder"})
+    return {"kind": "folder", "source_id": record.get("id"), "name": folder.name, "values": {"encrypted_name": CryptoUtils.encrypt_with_key(folder.name, key), "color": folder.color, "icon": folder.icon}}
+
+
+def _max_encoded_size(plaintext_bytes: int) -> int:
+    """Length of the JSON text form of a blob holding plaintext_bytes, stored uncompressed"""
+    return 4 + 4 * -(-(plaintext_bytes + MAX_BLOB_OVERHEAD) // 3)
+
+
+def _check_encoded_size(texts: List[str]) -> None:
+    limit = _max_encoded_size(settings.MAX_CONTENT_SIZE)
+    if any(not isinstance(text, str) or len(text) > limit for text in texts):
+        raise ValueError(f"Content larger than {settings.MAX_CONTENT_SIZE} bytes")
+
+
+def _prepare_note(record: dict, key: UserKey) -> dict:
+    if record.get("encrypted_content"):
+        # Ciphertext from an export of this vault: verify it decrypts under the key and keep it as is
+        _check_encoded_size([record["encrypted_content"], *(record.get("encrypted_deltas") or [])])
+        content_blob = CryptoUtils.from_text(record["encrypted_content"])
+        title_blob = CryptoUtils.from_text(record["encrypted_title"]) if record.get("encrypted_title") else None
+        content = CryptoUtils.decrypt_with_key(content_blob, key)
+        title = CryptoUtils.decrypt_with_key(title_blob, key) if title_blob else None
+        deltas = [CryptoUtils.from_text(delta) for delta in record.get("encrypted_deltas") or []]
+        if deltas:
+            content = apply_note_deltas(content, deltas, key)
+            content_blob = CryptoUtils.encrypt_with_key(content, key)
+    else:
+        note = NoteCreate.model_validate({"title": record.get("title"), "content": record.get("content")})
+        title, content = note.title, note.content
+        title_blob = CryptoUtils.encrypt_with_key(title, key) if title else None
+        content_blob = CryptoUtils.encrypt_with_key(content, key)
+    if len(content.encode("utf-8")) > settings.MAX_CONTENT_SIZE:
+        raise ValueError(f"Content larger than {settings.MAX_CONTENT_SIZE} bytes")
+    values = {
+        "encrypted_title": title_blob,
+        "encrypted_content": content_blob,
+        "content_hash": CryptoUtils.hash_content(content_blob),
+        "import_hash": CryptoUtils.keyed_hash(f"{title or ''}\x00{content}", key, IMPORT_HASH_PURPOSE),
+    }
+    created_at = _parse_timestamp(record.get("created_at"))
+    if created_at:
+        values["created_at"] = created_at
+    prepared = {"kind": "note", "source_folder_id": record.get("folder_id"), "values": values}
+    if settings.SEARCH_INDEX_ENABLED:
+        prepared["search_tokens"] = {SEARCH_FIELD_TITLE: note_search_tokens(title, key), SEARCH_FIELD_CONTENT: note_search_tokens(content, key)}
+    return prepared
+
+
+def prepare_record(record: dict, key: UserKey) -> dict:
+    """Validate, decrypt/encrypt and hash one import record; runs on the crypto pool"""
+    record_type = record.get("type", "note")
+    # Without the password, decrypt_with_key refuses blobs under any key but the session's instead of deriving one
+    key = replace(key, password=None)
+    try:
+        if record_type == "note":
+            return _prepare_note(record, key)
+        if record_type == "folder":
+            return _prepare_folder(record, key)
+        if record_type in ("header", "end"):
+            return {"kind": "skip"}
+        return {"kind": "error", "error": f"unknown record type '{record_type}'"}
+    except ValidationError as exc:
+        return {"kind": "error", "error": "; ".join(f"{'.'.join(map(str, e['loc']))}: {e['msg']}" for e in exc.errors())}
+    except Exception as exc:
+        return {"kind": "error", "error": str(exc) or "decryption failed"}
+
+
+class VaultImporter:
+    """Imports prepared batches for one user, one transaction per batch"""
+
+    def __init__(self, user_id: int, key: UserKey, progress: ImportProgress):
+        self.user_id = user_id
+        self.key = key
+        self.progress = progress
+        self.folder_ids: Dict[Any, int] = {}  # Folder id in the archive -> folder id in this vault
+        self._folders_by_name: Optional[Dict[str, int]] = None
+
+    def _existing_folders(self, db: Session) -> Dict[str, int]:
+        folders: Dict[str, int] = {}
+        for folder_id, encrypted_name in db.execute(select(Folder.id, Folder.encrypted_name).where(Folder.user_id == self.user_id, Folder.is_active == True).order_by(Folder.id)):
+            try:
+                folders.setdefault(CryptoUtils.decrypt_with_key(encrypted_name, self.key), folder_id)
+            except Exception:
+                continue
+        return folders
+
+    def _insert_folders(self, db: Session, folders: List[dict]) -> Dict[str, int]:
+        rows, pending, reused = [], {}, 0
+        for folder in folders:
+            if folder["name"] in self._folders_by_name or folder["name"] in pending:
+                reused += 1
+            else:
+                pending[folder["name"]] = len(rows)
+                rows.append({"user_id": self.user_id, **folder["values"]})
+        if rows:
+            ids = db.scalars(insert(Folder).returning(Folder.id, sort_by_parameter_order=True), rows).all()
+            for name, index in pending.items():
+                self._folders_by_name[name] = ids[index]
+        for folder in folders:
+            if folder["source_id"] is not None:
+                self.folder_ids[folder["source_id"]] = self._folders_by_name[folder["name"]]
+        return {"folders_created": len(rows), "folders_reused": reused}
+
+    def _insert_notes(self, db: Session, notes: List[dict]) -> Dict[str, int]:
+        hashes = [note["values"]["import_hash"] for note in notes]
+        seen = set(db.scalars(select(Note.import_hash).where(Note.user_id == self.user_id, Note.is_active == True, Note.import_hash.in_(hashes)))) if hashes else set()
+        rows, inserted = [], []
+        for note in notes:
+            if note["values"]["import_hash"] in seen:
+                continue
+            seen.add(note["values"]["import_hash"])
+            rows.append({"user_id": self.user_id, "folder_id": self.folder_ids.get(note["source_folder_id"]), **note["values"]})
+            inserted.append(note)
+        if rows and settings.SEARCH_INDEX_ENABLED:
+            ids = db.scalars(insert(Note).returning(Note.id, sort_by_parameter_order=True), rows).all()
+            tokens = [token_row for note_id, note in zip(ids, inserted) for field, field_tokens in note["search_tokens"].items() for token_row in search_token_rows(self.user_id, note_id, field, field_tokens)]
+            if tokens:
+                db.execute(SEARCH_TOKEN_INSERT, tokens)
+        elif rows:
+            # executemany (insertmanyvalues), grouped by key set
+            db.execute(insert(Note), rows)
+        return {"notes_imported": len(rows), "notes_skipped": len(notes) - len(rows)}
+
+    def import_batch(self, records: List[dict]) -> None:
+        prepared = map_crypto(prepare_record, records, self.key)
+        with SessionLocal() as db:
+            if self._folders_by_name is None:
+                self._folders_by_name = self._existing_folders(db)
+            counts = self._insert_folders(db, [item for item in prepared if item["kind"] == "folder"])
+            counts.update(self._insert_notes(db, [item for item in prepared if item["kind"] == "note"]))
+            db.commit()
+        # Reported only once the batch is committed
+        progress = self.progress
+        for index, item in enumerate(prepared):
+            if item["kind"] == "error":
+                progress.failed += 1
+                if len(progress.errors) < MAX_REPORTED_ERRORS:
+                    progress.errors.append(f"record {progress.records + index + 1}: {item['error']}")
+        for name, count in counts.items():
+            setattr(progress, name, getattr(progress, name) + count)
+        progress.records += len(records)
+
+
+class ImportTracker:
+    """Latest import per user, so clients can poll progress (kept in process memory)"""
+
+    def __init__(self):
+        self._imports: Dict[int, ImportProgress] = {}
+        self._lock = threading.Lock()
+
+    def start(self, user_id: int) -> ImportProgress:
+        with self._lock:
+            current = self._imports.get(user_id)
+            if current is not None and current.status == "running":
+                raise ImportInProgress()
+            progress = ImportProgress(status="running", bytes_received=0, records=0, folders_created=0, folders_reused=0, notes_imported=0, notes_skipped=0, failed=0, started_at=datetime.utcnow())
+            self._imports[user_id] = progress
+            return progress
+
+    def get(self, user_id: int) -> Optional[ImportProgress]:
+        return self._imports.get(user_id)
+
+
+import_tracker = ImportTracker()
+
+
+async def run_import(user_id: int, key: UserKey, chunks: AsyncIterator[bytes], format: str = "ndjson") -> ImportProgress:
+    """
+    Parse an uploaded archive as it arrives and import it batch by batch.
+    Batches are committed as they fill, so a failed or interrupted import keeps its
+    progress and can be resumed by uploading the same archive again.
+    """
+    progress = import_tracker.start(user_id)
+    importer = VaultImporter(user_id, key, progress)
+    reader = IMPORT_READERS[format](settings.IMPORT_MAX_RECORD_BYTES)
+    batch_size = settings.IMPORT_BATCH_SIZE
+    batch: List[dict] = []
+    try:
+        async for chunk in chunks:
+            progress.bytes_received += len(chunk)
+            batch.extend(reader.feed(chunk))
+            while len(batch) >= batch_size:
+                await to_thread.run_sync(importer.import_batch, batch[:batch_size])
+                del batch[:batch_size]
+        batch.extend(reader.close())
+        if batch:
+            await to_thread.run_sync(importer.import_batch, batch)
+    except BaseException as exc:
+        progress.status = "failed"
+        if isinstance(exc, ImportFormatError):
+            progress.errors.append(str(exc))
+        raise
+    finally:
+        progress.finished_at = datetime.utcnow()
+    progress.status = "completed"
+    return progress
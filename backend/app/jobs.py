@@ -0,0 +1,90 @@
+"""
+Periodic background jobs, started and stopped by the app lifespan.
+
+Jobs do their DB work with the sync engine on a worker thread, so they run the
+same way whether the routes use the sync or the async data layer.
+"""
+import asyncio
+import logging
+from typing import Callable, List
+
+from anyio import to_thread
+
+from app.config import settings
+from app.database import SessionLocal
+from app.last_access import last_access
+from app.services import RevisionService, ShareService, UserService
+from app.sharing import share_views
+
+logger = logging.getLogger(__name__)
+
+
+async def run_periodically(interval: float, job: Callable[[], object]) -> None:
+    """Call a blocking job every `interval` seconds until cancelled; failures are logged, not fatal"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await to_thread.run_sync(job)
+        except Exception:
+            logger.exception("Background job %s failed", job.__name__)
+
+
+def prune_note_revisions() -> int:
+    """Apply the revision retention policy in NOTE_REVISION_PRUNE_BATCH_SIZE-note transactions"""
+    with SessionLocal() as db:
+        return RevisionService(db).prune(settings.NOTE_REVISION_PRUNE_BATCH_SIZE)
+
+
+def flush_share_views() -> int:
+    """Write the view counts collected since the last flush; they're kept for the next one if the write fails"""
+    counts = share_views.drain()
+    if not counts:
+        return 0
+    try:
+        with SessionLocal() as db:
+            ShareService(db).add_views(counts)
+    except Exception:
+        share_views.restore(counts)
+        raise
+    return len(counts)
+
+
+def flush_last_accessed() -> int:
+    """Write the last-access times buffered since the last flush; they're kept for the next one if the write fails"""
+    pending = last_access.drain()
+    if not pending:
+        return 0
+    try:
+        with SessionLocal() as db:
+            UserService(db).flush_last_accessed(pending)
+    except Exception:
+        last_access.restore(pending)
+        raise
+    return len(pending)
+
+
+# Write-behind buffers, flushed once more on shutdown
+FLUSH_JOBS = [flush_share_views, flush_last_accessed]
+
+
+def start_background_jobs() -> List[asyncio.Task]:
+    tasks = []
+    if settings.NOTE_REVISION_PRUNE_INTERVAL_SECONDS > 0:
+        tasks.append(asyncio.create_task(run_periodically(settings.NOTE_REVISION_PRUNE_INTERVAL_SECONDS, prune_note_revisions)))
+    if settings.SHARE_VIEW_FLUSH_INTERVAL_SECONDS > 0:
+        tasks.append(asyncio.create_task(run_periodically(settings.SHARE_VIEW_FLUSH_INTERVAL_SECONDS, flush_share_views)))
+    if settings.LAST_ACCESS_FLUSH_INTERVAL_SECONDS > 0:
+        tasks.append(asyncio.create_task(run_periodically(settings.LAST_ACCESS_FLUSH_INTERVAL_SECONDS, flush_last_accessed)))
+    return tasks
+
+
+async def stop_background_jobs(tasks: List[asyncio.Task]) -> None:
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # Don't lose what was buffered since the last flush
+    for job in FLUSH_JOBS:
+        try:
+            await to_thread.run_sync(job)
+        except Exception:
+            logger.exception("Final flush %s failed", job.__name__)
@@ -0,0 +1,189 @@
+"""
+Password key derivation.
+
+The KDF and its cost are set through the KDF_* settings and recorded in the
+header of every v4 blob, so they can be changed per deployment without losing
+access to existing records: a key is always derived with the parameters its
+blobs were written under, and data keys wrapped with outdated parameters are
+rewrapped under the configured ones at the account's next login
+(UserService.upgrade_user_key).
+
+    pbkdf2-sha256   0x01 + iterations (uint32)
+    scrypt          0x02 + log2(N) + r + p (one byte each)
+
+Blobs older than v4 carry no parameters; they were all written with LEGACY_KDF.
+Headers come from stored and uploaded blobs alike, so decoded parameters beyond
+MAX_PBKDF2_ITERATIONS / MAX_SCRYPT_* are rejected as corrupt rather than derived.
+
+Pick parameters for a host with:
+    python -m app.kdf --target-ms 250
+    python -m app.kdf --algorithm scrypt --target-ms 250 --max-memory-mb 64
+"""
+import argparse
+import os
+import statistics
+import struct
+import time
+from dataclasses import dataclass
+from typing import Callable, Tuple
+
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+KDF_PBKDF2_SHA256 = 0x01
+KDF_SCRYPT = 0x02
+KEY_SIZE = 32
+# Ceilings on decoded (and configured) parameters, far above any sensible cost
+MAX_PBKDF2_ITERATIONS = 10_000_000
+MAX_SCRYPT_MEMORY_BYTES = 256 << 20
+MAX_SCRYPT_P = 16
+
+
+@dataclass(frozen=True)
+class KdfParams:
+    """A KDF and its cost parameters, as encoded in a v4 blob header"""
+    algorithm: str  # "pbkdf2-sha256" or "scrypt"
+    iterations: int = 0  # pbkdf2-sha256
+    log_n: int = 0  # scrypt: N = 2 ** log_n
+    r: int = 0
+    p: int = 0
+
+    def encode(self) -> bytes:
+        if self.algorithm == "scrypt":
+            return struct.pack(">BBBB", KDF_SCRYPT, self.log_n, self.r, self.p)
+        return struct.pack(">BI", KDF_PBKDF2_SHA256, self.iterations)
+
+    @staticmethod
+    def decode(data: bytes) -> Tuple["KdfParams", int]:
+        """Parse encoded parameters from the start of data; returns (params, bytes consumed). Raises ValueError on out-of-range parameters"""
+        if data[:1] == bytes([KDF_SCRYPT]):
+            _, log_n, r, p = struct.unpack_from(">BBBB", data)
+            params, size = KdfParams("scrypt", log_n=log_n, r=r, p=p), 4
+        elif data[:1] == bytes([KDF_PBKDF2_SHA256]):
+            _, iterations = struct.unpack_from(">BI", data)
+            params, size = KdfParams("pbkdf2-sha256", iterations=iterations), 5
+        else:
+            raise ValueError(f"Unknown KDF id {data[:1].hex() or 'missing'}")
+        params.check()
+        return params, size
+
+    def check(self) -> None:
+        """Raise ValueError unless the parameters are within the ceilings a key may be derived with"""
+        if self.algorithm == "scrypt":
+            if not (1 <= self.log_n and 1 <= self.r and 1 <= self.p <= MAX_SCRYPT_P) or self.memory_bytes > MAX_SCRYPT_MEMORY_BYTES:
+                raise ValueError(f"KDF parameters out of range: {self}")
+        elif not 1 <= self.iterations <= MAX_PBKDF2_ITERATIONS:
+            raise ValueError(f"KDF parameters out of range: {self}")
+
+    @property
+    def memory_bytes(self) -> int:
+        """Working memory of one derivation (scrypt only; PBKDF2 needs next to none)"""
+        return 128 * self.r * (1 << self.log_n) if self.algorithm == "scrypt" else 0
+
+    def __str__(self) -> str:
+        if self.algorithm == "scrypt":
+            return f"scrypt(N=2^{self.log_n}, r={self.r}, p={self.p})"
+        return f"pbkdf2-sha256({self.iterations} iterations)"
+
+
+# What v1-v3 blobs were written with
+LEGACY_KDF = KdfParams("pbkdf2-sha256", iterations=100_000)
+
+
+def derive(password: str, salt: bytes, params: KdfParams) -> bytes:
+    # Module-level so it can be shipped to a process pool
+    if params.algorithm == "scrypt":
+        kdf = Scrypt(salt=salt, length=KEY_SIZE, n=1 << params.log_n, r=params.r, p=params.p)
+    else:
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=KEY_SIZE, salt=salt, iterations=params.iterations)
+    return kdf.derive(password.encode('utf-8'))
+
+
+def configured_kdf(settings) -> KdfParams:
+    """The KDF new keys are derived with, from the KDF_* settings"""
+    if settings.KDF_ALGORITHM == "scrypt":
+        n = settings.KDF_SCRYPT_N
+        if n < 2 or n & (n - 1):
+            raise RuntimeError(f"KDF_SCRYPT_N must be a power of two, got {n}")
+        if not (1 <= settings.KDF_SCRYPT_R <= 255 and 1 <= settings.KDF_SCRYPT_P <= MAX_SCRYPT_P):
+            raise RuntimeError(f"KDF_SCRYPT_R must be between 1 and 255 and KDF_SCRYPT_P between 1 and {MAX_SCRYPT_P}")
+        params = KdfParams("scrypt", log_n=n.bit_length() - 1, r=settings.KDF_SCRYPT_R, p=settings.KDF_SCRYPT_P)
+        if params.memory_bytes > MAX_SCRYPT_MEMORY_BYTES:
+            raise RuntimeError(f"KDF_SCRYPT_N * KDF_SCRYPT_R needs more than {MAX_SCRYPT_MEMORY_BYTES >> 20} MiB per derivation")
+        return params
+    if not 1 <= settings.KDF_PBKDF2_ITERATIONS <= MAX_PBKDF2_ITERATIONS:
+        raise RuntimeError(f"KDF_PBKDF2_ITERATIONS must be between 1 and {MAX_PBKDF2_ITERATIONS}, got {settings.KDF_PBKDF2_ITERATIONS}")
+    return KdfParams("pbkdf2-sha256", iterations=settings.KDF_PBKDF2_ITERATIONS)
+
+
+# ============= Calibration =============
+
+def time_derive(params: KdfParams, rounds: int) -> float:
+    """Median seconds per derivation with params on this host"""
+    salt = os.urandom(16)
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        derive("calibration-password", salt, params)
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def calibrate_pbkdf2(target: float, rounds: int, report: Callable[[KdfParams, float], None]) -> KdfParams:
+    """Iterations (in steps of 1000) taking about target seconds, scaled from a probe run"""
+    probe = KdfParams("pbkdf2-sha256", iterations=100_000)
+    elapsed = time_derive(probe, rounds)
+    report(probe, elapsed)
+    params = KdfParams("pbkdf2-sha256", iterations=min(MAX_PBKDF2_ITERATIONS, max(1000, int(round(probe.iterations * target / elapsed, -3)))))
+    report(params, time_derive(params, rounds))
+    return params
+
+
+def calibrate_scrypt(target: float, rounds: int, r: int, p: int, max_memory: int, report: Callable[[KdfParams, float], None]) -> KdfParams:
+    """The largest N (a power of two) within both target seconds and max_memory bytes"""
+    params = KdfParams("scrypt", log_n=10, r=r, p=p)
+    while True:
+        candidate = KdfParams("scrypt", log_n=params.log_n + 1, r=r, p=p)
+        if candidate.memory_bytes > max_memory:
+            return params
+        elapsed = time_derive(candidate, rounds)
+        report(candidate, elapsed)
+        if elapsed > target:
+            return params
+        params = candidate
+
+
+def settings_lines(params: KdfParams) -> list:
+    if params.algorithm == "scrypt":
+        return ["KDF_ALGORITHM=scrypt", f"KDF_SCRYPT_N={1 << params.log_n}", f"KDF_SCRYPT_R={params.r}", f"KDF_SCRYPT_P={params.p}"]
+    return ["KDF_ALGORITHM=pbkdf2-sha256", f"KDF_PBKDF2_ITERATIONS={params.iterations}"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pick KDF_* settings that take about --target-ms per key derivation on this host")
+    parser.add_argument("--algorithm", choices=["pbkdf2-sha256", "scrypt"], default="pbkdf2-sha256")
+    parser.add_argument("--target-ms", type=float, default=250, help="time one derivation should take")
+    parser.add_argument("--rounds", type=int, default=3, help="timed derivations per candidate (the median is used)")
+    parser.add_argument("--scrypt-r", type=int, default=8)
+    parser.add_argument("--scrypt-p", type=int, default=1)
+    parser.add_argument("--max-memory-mb", type=int, default=64, help="scrypt memory per derivation; every concurrent login needs this much")
+    args = parser.parse_args()
+    target = args.target_ms / 1e3
+
+    def report(params: KdfParams, elapsed: float) -> None:
+        print(f"  {params}: {elapsed * 1e3:.1f} ms")
+
+    print(f"Calibrating {args.algorithm} for {args.target_ms:g} ms per derivation")
+    if args.algorithm == "scrypt":
+        params = calibrate_scrypt(target, args.rounds, args.scrypt_r, args.scrypt_p, min(args.max_memory_mb << 20, MAX_SCRYPT_MEMORY_BYTES), report)
+    else:
+        params = calibrate_pbkdf2(target, args.rounds, report)
+    print(f"\nChosen: {params}" + (f", {params.memory_bytes >> 20} MiB per derivation" if params.memory_bytes else ""))
+    print("Settings (data keys wrapped under other parameters are rewrapped at the next login):")
+    for line in settings_lines(params):
+        print(f"  {line}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Write-behind buffer for users' last_accessed_at.
+
+Logins record their timestamp here instead of updating the users row inline,
+so a burst of logins doesn't queue on row locks and commits. A background job
+(app.jobs.flush_last_accessed) writes the latest timestamp per user in bulk
+and once more on shutdown; a crash loses at most one flush interval.
+"""
+import threading
+from datetime import datetime
+from typing import Dict
+
+
+class LastAccessBuffer:
+    """Latest access time per user, coalesced between background flushes"""
+
+    def __init__(self):
+        self._pending: Dict[int, datetime] = {}
+        self._lock = threading.Lock()
+
+    def record(self, user_id: int, accessed_at: datetime) -> None:
+        with self._lock:
+            if accessed_at > self._pending.get(user_id, datetime.min):
+                self._pending[user_id] = accessed_at
+
+    def drain(self) -> Dict[int, datetime]:
+        """Take the pending timestamps, leaving the buffer empty"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def restore(self, pending: Dict[int, datetime]) -> None:
+        """Put back timestamps whose write failed, unless newer ones arrived meanwhile"""
+        with self._lock:
+            for user_id, accessed_at in pending.items():
+                if accessed_at > self._pending.get(user_id, datetime.min):
+                    self._pending[user_id] = accessed_at
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+
+last_access = LastAccessBuffer()
@@ -1,17 +1,52 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
-from app.database import Base, engine
+from app.database import Base, engine, async_engine
 from app.routers import router
+from app.async_routers import async_router
+from app.crypto import key_cache
+from app.sharing import share_cache
+from app.user_cache import user_cache
+from app.metrics import MetricsMiddleware, instrument_engine, registry as metrics_registry
+from app.ratelimit import RateLimitMiddleware, InMemoryTokenBucketStore
+from app.concurrency import configure_threadpool, get_crypto_executor, shutdown_crypto_executor
+from app.jobs import start_background_jobs, stop_background_jobs
 
 Base.metadata.create_all(bind=engine)
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_threadpool()
+    get_crypto_executor()
+    jobs = start_background_jobs()
+    yield
+    await stop_background_jobs(jobs)
+    shutdown_crypto_executor()
+    if async_engine is not None:
+        await async_engine.dispose()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
     description=settings.DESCRIPTION,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
+)
+
+# Added before CORS so CORS stays outermost and 429 responses still carry CORS headers
+app.add_middleware(
+    RateLimitMiddleware,
+    store=InMemoryTokenBucketStore(shards=settings.RATE_LIMIT_SHARDS),
+    per_minute=settings.RATE_LIMIT_PER_MINUTE,
+    expensive_paths=[("POST", "/login"), ("POST", "/register"), ("POST", "/password")],
+    expensive_cost=settings.RATE_LIMIT_EXPENSIVE_COST,
+    read_cost=settings.RATE_LIMIT_READ_COST,
+    enabled=settings.RATE_LIMIT_ENABLED
 )
 
 app.add_middleware(
@@ -22,7 +57,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-app.include_router(router)
+# Outermost, so the latency it records includes rate limiting and CORS
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, registry=metrics_registry)
+    instrument_engine(engine)
+    if async_engine is not None:
+        instrument_engine(async_engine.sync_engine)
 
 @app.get("/", tags=["Root"])
 async def root():
@@ -39,5 +79,16 @@ async def health_check():
     return {
         "status": "healthy",
         "service": settings.PROJECT_NAME,
-        "version": settings.VERSION
+        "version": settings.VERSION,
+        "key_cache": key_cache.stats(),
+        "user_cache": user_cache.stats(),
+        "share_cache": share_cache.stats()
     }
+
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+    async def metrics():
+        return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Registered last so the catch-all /{alias} route doesn't shadow the routes above
+app.include_router(async_router if settings.DATABASE_ASYNC else router)
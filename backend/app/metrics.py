@@ -0,0 +1,281 @@
+"""
+Request instrumentation, exposed in Prometheus text format on /metrics.
+
+MetricsMiddleware opens a RequestTimings for every HTTP request (in a context
+variable, so route handlers on worker threads share it) and, when the response
+is done, records it under the matched route template:
+
+    kdf        password KDF in CryptoUtils.derive_key (key cache misses only)
+    cipher     AES-GCM and compression in CryptoUtils.encrypt/decrypt_with_key
+    db         time inside SQL statements, from engine cursor events
+    serialize  response validation and rendering after the endpoint returns
+
+plus the total latency, the number of SQL statements, and a status counter.
+Crypto time is charged to the innermost timed call, so a KDF inside a decrypt
+isn't counted twice. Work on the crypto pool's own threads (bulk import) and in
+background jobs has no request and isn't recorded.
+
+Each hook is a couple of perf_counter() calls and a histogram update is a
+bisect under a lock, so this stays on in production (METRICS_ENABLED).
+"""
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+PHASES = ("kdf", "cipher", "db", "serialize")
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+
+
+@dataclass
+class RequestTimings:
+    kdf: float = 0.0
+    cipher: float = 0.0
+    db: float = 0.0
+    serialize: float = 0.0
+    queries: int = 0
+    endpoint_end: Optional[float] = None
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+# ============= Crypto timing =============
+
+_timer_stack = threading.local()
+
+
+def timed(phase: str) -> Callable:
+    """Charge a function's wall time to `phase` of the current request, minus any timed calls nested inside"""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            timings = _current.get()
+            if timings is None:
+                return fn(*args, **kwargs)
+            stack = getattr(_timer_stack, "frames", None)
+            if stack is None:
+                stack = _timer_stack.frames = []
+            stack.append(0.0)  # Time spent in nested timed calls
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = stack.pop()
+                setattr(timings, phase, getattr(timings, phase) + elapsed - nested)
+                if stack:
+                    stack[-1] += elapsed
+        return wrapper
+    return decorator
+
+
+# ============= SQL timing =============
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    timings = _current.get()
+    if timings is not None:
+        conn.info.setdefault("metrics_query_start", []).append((timings, time.perf_counter()))
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("metrics_query_start")
+    if starts:
+        timings, start = starts.pop()
+        timings.db += time.perf_counter() - start
+        timings.queries += 1
+
+
+def _handle_error(exception_context):
+    starts = exception_context.connection.info.get("metrics_query_start") if exception_context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engine(engine) -> None:
+    """Time every statement on a sync Engine (pass async_engine.sync_engine for the async one)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+# ============= Routes =============
+
+def _timed_endpoint(endpoint: Callable) -> Callable:
+    """Mark when the endpoint returns; everything after that until the response exists is serialization"""
+    if getattr(endpoint, "__metrics_wrapped__", False):
+        return endpoint
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                timings = _current.get()
+                if timings is not None:
+                    timings.endpoint_end = time.perf_counter()
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                timings = _current.get()
+                if timings is not None:
+                    timings.endpoint_end = time.perf_counter()
+    wrapper.__metrics_wrapped__ = True
+    return wrapper
+
+
+class InstrumentedRoute(APIRoute):
+    """APIRoute that reports the serialization time of its responses"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def instrumented_handler(request):
+            response = await handler(request)
+            timings = _current.get()
+            if timings is not None and timings.endpoint_end is not None:
+                timings.serialize += time.perf_counter() - timings.endpoint_end
+            return response
+        return instrumented_handler
+
+
+# ============= Registry =============
+
+class _RouteStats:
+    __slots__ = ("duration", "phases", "queries", "statuses")
+
+    def __init__(self):
+        self.duration = Histogram(LATENCY_BUCKETS)
+        self.phases = {phase: Histogram(LATENCY_BUCKETS) for phase in PHASES}
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.statuses: Dict[int, int] = {}
+
+
+def _label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_bound(bound: float) -> str:
+    return repr(float(bound))
+
+
+class MetricsRegistry:
+    """Per-route histograms; routes are keyed by their template, so label cardinality stays bounded"""
+
+    def __init__(self, prefix: str = "cryptora"):
+        self.prefix = prefix
+        self._routes: Dict[Tuple[str, str], _RouteStats] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, route: str, status: int, duration: float, timings: RequestTimings) -> None:
+        with self._lock:
+            stats = self._routes.get((method, route))
+            if stats is None:
+                stats = self._routes[(method, route)] = _RouteStats()
+            stats.duration.observe(duration)
+            for phase in PHASES:
+                stats.phases[phase].observe(getattr(timings, phase))
+            stats.queries.observe(timings.queries)
+            stats.statuses[status] = stats.statuses.get(status, 0) + 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._routes.clear()
+
+    def _histogram_lines(self, name: str, labels: str, histogram: Histogram) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(histogram.bounds, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{_format_bound(bound)}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum!r}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return lines
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        requests, duration, phases, queries = f"{self.prefix}_requests_total", f"{self.prefix}_request_duration_seconds", f"{self.prefix}_request_phase_seconds", f"{self.prefix}_request_db_queries"
+        sections = {
+            requests: [f"# HELP {requests} Requests by route and status", f"# TYPE {requests} counter"],
+            duration: [f"# HELP {duration} Request latency by route", f"# TYPE {duration} histogram"],
+            phases: [f"# HELP {phases} Time per request spent in kdf, cipher, db and serialize", f"# TYPE {phases} histogram"],
+            queries: [f"# HELP {queries} SQL statements per request", f"# TYPE {queries} histogram"],
+        }
+        with self._lock:
+            for (method, route), stats in sorted(self._routes.items()):
+                labels = f'method="{_label(method)}",route="{_label(route)}"'
+                for status, count in sorted(stats.statuses.items()):
+                    sections[requests].append(f'{requests}{{{labels},status="{status}"}} {count}')
+                sections[duration] += self._histogram_lines(duration, labels, stats.duration)
+                for phase in PHASES:
+                    sections[phases] += self._histogram_lines(phases, f'{labels},phase="{phase}"', stats.phases[phase])
+                sections[queries] += self._histogram_lines(queries, labels, stats.queries)
+        return "\n".join(line for lines in sections.values() for line in lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware timing each HTTP request and recording it in a MetricsRegistry"""
+
+    def __init__(self, app, registry: MetricsRegistry = registry, exclude_paths: Tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.registry = registry
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            self.registry.observe(scope["method"], getattr(route, "path", None) or "unmatched", status_code, time.perf_counter() - start, timings)
@@ -1,6 +1,6 @@
-from sqlalchemy import String, Text, Integer, Boolean, Index, ForeignKey
+from sqlalchemy import String, Integer, SmallInteger, Boolean, Index, ForeignKey, LargeBinary
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import false, func
 from datetime import datetime
 from typing import Optional, List
 from app.database import Base
@@ -11,7 +11,9 @@ class User(Base):
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True, autoincrement=True)
     alias: Mapped[str] = mapped_column(String(255), unique=True, nullable=False, index=True)
-    encrypted_alias: Mapped[str] = mapped_column(Text, nullable=False)
+    encrypted_alias: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    wrapped_key: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)  # Data key wrapped under the password KDF; null until the account moves to envelope encryption
+    session_epoch: Mapped[int] = mapped_column(Integer, default=0, server_default='0', nullable=False)  # Bumped on password change; session tokens from an older epoch are rejected
     created_at: Mapped[datetime] = mapped_column(nullable=False, server_default=func.now())
     last_accessed_at: Mapped[datetime] = mapped_column(nullable=False, server_default=func.now())
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
@@ -26,7 +28,7 @@ class Folder(Base):
     
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
-    encrypted_name: Mapped[str] = mapped_column(Text, nullable=False)
+    encrypted_name: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
     color: Mapped[Optional[str]] = mapped_column(String(20), nullable=True, default='default')
     icon: Mapped[Optional[str]] = mapped_column(String(50), nullable=True, default='folder')
     created_at: Mapped[datetime] = mapped_column(nullable=False, server_default=func.now())
@@ -43,17 +45,83 @@ class Note(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True, autoincrement=True)
     user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False, index=True)
     folder_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey('folders.id', ondelete='SET NULL'), nullable=True, index=True)
-    encrypted_title: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
-    encrypted_content: Mapped[str] = mapped_column(Text, nullable=False)
+    encrypted_title: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    encrypted_content: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
     content_hash: Mapped[str] = mapped_column(String(128), nullable=False)
     created_at: Mapped[datetime] = mapped_column(nullable=False, server_default=func.now())
     updated_at: Mapped[Optional[datetime]] = mapped_column(nullable=True, onupdate=func.now())
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
+    delta_count: Mapped[int] = mapped_column(Integer, default=0, server_default='0', nullable=False)
+    import_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)  # Keyed hash of the plaintext for notes created by an import
+    search_indexed: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false(), nullable=False)  # Set once the login backfill has looked at the note, even if it yielded no tokens
     user: Mapped["User"] = relationship("User", back_populates="notes")
     folder: Mapped[Optional["Folder"]] = relationship("Folder", back_populates="notes")
+    deltas: Mapped[List["NoteDelta"]] = relationship("NoteDelta", back_populates="note", cascade="all, delete-orphan", order_by="NoteDelta.seq")
+    revisions: Mapped[List["NoteRevision"]] = relationship("NoteRevision", back_populates="note", cascade="all, delete-orphan")
     
     __table_args__ = (
         Index('idx_note_user_active', 'user_id', 'is_active'),
         Index('idx_note_folder', 'folder_id'),
         Index('idx_note_created', 'created_at'),
+        Index('idx_note_user_active_created', 'user_id', 'is_active', 'created_at', 'id'),
+        Index('idx_note_user_import', 'user_id', 'import_hash'),
     )
+
+
+class NoteDelta(Base):
+    """An encrypted edit applied on top of a note's encrypted_content (the base snapshot)"""
+    __tablename__ = "note_deltas"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    note_id: Mapped[int] = mapped_column(Integer, ForeignKey('notes.id', ondelete='CASCADE'), nullable=False)
+    seq: Mapped[int] = mapped_column(Integer, nullable=False)
+    encrypted_delta: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    content_hash: Mapped[str] = mapped_column(String(128), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(nullable=False, server_default=func.now())
+    note: Mapped["Note"] = relationship("Note", back_populates="deltas")
+    
+    __table_args__ = (Index('idx_note_delta_note_seq', 'note_id', 'seq', unique=True),)
+
+
+class NoteRevision(Base):
+    """Snapshot of a prior version of a note (encrypted title and compacted body)"""
+    __tablename__ = "note_revisions"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    note_id: Mapped[int] = mapped_column(Integer, ForeignKey('notes.id', ondelete='CASCADE'), nullable=False)
+    encrypted_title: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    encrypted_content: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    content_hash: Mapped[str] = mapped_column(String(128), nullable=False)
+    created_at: Mapped[datetime] = mapped_column(nullable=False, server_default=func.now())  # When this version was written
+    note: Mapped["Note"] = relationship("Note", back_populates="revisions")
+    
+    __table_args__ = (Index('idx_note_revision_note', 'note_id', 'id'),)
+
+
+class SharedNote(Base):
+    """Public share link: a snapshot of a note encrypted under a key derived from the link token"""
+    __tablename__ = "shared_notes"
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True, autoincrement=True)
+    note_id: Mapped[int] = mapped_column(Integer, ForeignKey('notes.id', ondelete='CASCADE'), unique=True, nullable=False)
+    share_token: Mapped[str] = mapped_column(String(64), unique=True, index=True, nullable=False)  # SHA-256 of the link token, never the token itself
+    encrypted_title: Mapped[Optional[bytes]] = mapped_column(LargeBinary, nullable=True)
+    encrypted_content: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(nullable=False, server_default=func.now())
+    expires_at: Mapped[Optional[datetime]] = mapped_column(nullable=True)
+    view_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
+    
+    __table_args__ = (Index('idx_shared_token_active', 'share_token', 'is_active'),)
+
+
+class NoteSearchToken(Base):
+    """Blind-index token: a keyed hash of one word (or word prefix) of a note's title or body"""
+    __tablename__ = "note_search_tokens"
+    
+    note_id: Mapped[int] = mapped_column(Integer, ForeignKey('notes.id', ondelete='CASCADE'), primary_key=True)
+    field: Mapped[int] = mapped_column(SmallInteger, primary_key=True)  # 0 = title, 1 = content
+    token: Mapped[str] = mapped_column(String(32), primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    
+    __table_args__ = (Index('idx_note_search_user_token', 'user_id', 'token', 'note_id'),)
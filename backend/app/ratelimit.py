@@ -0,0 +1,175 @@
+"""
+Token-bucket rate limiting.
+
+RateLimitMiddleware charges requests against a per-IP bucket and, when the
+request names a user, a per-alias bucket. Writes cost one token and requests
+that run the password KDF (login, register, and any route authenticated with
+?password=) cost expensive_cost. Reads (GET/HEAD) cost read_cost, a fraction of
+a token, since the dashboard fetches every folder and note of a vault on load.
+Buckets live in a TokenBucketStore: InMemoryTokenBucketStore
+is per-process; a shared backend (e.g. Redis) can implement the same interface
+so several workers share limits.
+"""
+import json
+from urllib.parse import parse_qs
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class TokenBucketStore(ABC):
+    """Storage for token buckets; implement this for a shared backend"""
+
+    @abstractmethod
+    async def consume(self, key: str, cost: float, capacity: float, refill_per_second: float) -> float:
+        """
+        Take `cost` tokens from the bucket at `key` (created full at `capacity`).
+        Returns 0.0 if allowed, otherwise the seconds until enough tokens accrue.
+        """
+
+
+class _Shard:
+    __slots__ = ("lock", "buckets")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, List[float]] = {}
+
+
+class InMemoryTokenBucketStore(TokenBucketStore):
+    """Process-local buckets, sharded so concurrent requests rarely share a lock"""
+
+    def __init__(self, shards: int = 16, max_keys_per_shard: int = 10_000):
+        self._shards = [_Shard() for _ in range(shards)]
+        self.max_keys_per_shard = max_keys_per_shard
+
+    def consume_sync(self, key: str, cost: float, capacity: float, refill_per_second: float) -> float:
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+        with shard.lock:
+            bucket = shard.buckets.get(key)
+            if bucket is None:
+                if len(shard.buckets) >= self.max_keys_per_shard:
+                    # Drop the oldest bucket; a fresh one starts full, so this only ever loosens limits
+                    del shard.buckets[next(iter(shard.buckets))]
+                bucket = shard.buckets[key] = [capacity, now]
+            else:
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * refill_per_second)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            return (cost - bucket[0]) / refill_per_second
+
+    async def consume(self, key: str, cost: float, capacity: float, refill_per_second: float) -> float:
+        return self.consume_sync(key, cost, capacity, refill_per_second)
+
+
+# Paths that never count against a limit
+EXEMPT_PATHS = frozenset({"/", "/health", "/docs", "/redoc", "/openapi.json"})
+# Methods charged read_cost instead of a full token
+READ_METHODS = frozenset({"GET", "HEAD"})
+# Top-level paths that are not user aliases; requests under them only use the per-IP bucket
+RESERVED_SEGMENTS = frozenset({"login", "register", "password", "shared", "metrics", "health", "docs", "redoc", "openapi.json"})
+
+
+class RateLimitMiddleware:
+    """ASGI middleware enforcing per-IP and per-alias token buckets"""
+
+    def __init__(self, app, store: TokenBucketStore, per_minute: int, expensive_paths: Iterable[Tuple[str, str]] = (), expensive_cost: float = 10.0, read_cost: float = 0.1, enabled: bool = True):
+        self.app = app
+        self.store = store
+        self.capacity = float(per_minute)
+        self.refill_per_second = per_minute / 60.0
+        self.expensive_paths = frozenset(expensive_paths)
+        self.expensive_cost = float(expensive_cost)
+        self.read_cost = float(read_cost)
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        # CORS preflights are exempt so browsers still see the real limit on the actual request
+        if not self.enabled or scope["type"] != "http" or scope["path"] in EXEMPT_PATHS or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        method, path = scope["method"], scope["path"]
+        if _has_password_param(scope):
+            # The legacy ?password= fallback runs the KDF on every request, so it costs as much as a login
+            cost = self.expensive_cost
+        else:
+            cost = self.read_cost if method in READ_METHODS else 1.0
+        if not cost and (method, path) not in self.expensive_paths:
+            await self.app(scope, receive, send)
+            return
+
+        alias: Optional[str] = None
+        if (method, path) in self.expensive_paths:
+            cost = self.expensive_cost
+            # The alias for login/register is in the JSON body; buffer it and replay it downstream
+            body, receive = await _buffer_body(receive)
+            alias = _alias_from_body(body)
+        else:
+            segment = path.split("/", 2)[1]
+            if segment and segment not in RESERVED_SEGMENTS:
+                alias = segment.lower()
+
+        client = scope.get("client")
+        retry_after = await self.store.consume(f"ip:{client[0] if client else 'unknown'}", cost, self.capacity, self.refill_per_second)
+        if not retry_after and alias:
+            retry_after = await self.store.consume(f"alias:{alias}", cost, self.capacity, self.refill_per_second)
+        if retry_after:
+            await _send_429(send, retry_after)
+            return
+        await self.app(scope, receive, send)
+
+
+async def _buffer_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            break
+    body = b"".join(chunks)
+    replayed = False
+
+    async def replay():
+        nonlocal replayed
+        if not replayed:
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+
+    return body, replay
+
+
+def _has_password_param(scope) -> bool:
+    query = scope.get("query_string", b"")
+    return b"password" in query and "password" in parse_qs(query.decode("latin-1"), keep_blank_values=True)
+
+
+def _alias_from_body(body: bytes) -> Optional[str]:
+    if len(body) > 4096:
+        return None
+    try:
+        alias = json.loads(body).get("alias")
+    except Exception:
+        return None
+    return alias.lower() if isinstance(alias, str) else None
+
+
+async def _send_429(send, retry_after: float) -> None:
+    body = b'{"detail":"Rate limit exceeded"}'
+    await send({
+        "type": "http.response.start",
+        "status": 429,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
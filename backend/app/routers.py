@@ -1,19 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
 from sqlalchemy.orm import Session
 from app.database import get_db
+from app.export import EXPORT_ENCODERS, stream_export
+from app.importer import ImportFormatError, ImportInProgress, import_tracker, run_import
+from app.config import settings
+from app.metrics import InstrumentedRoute
+from app.etags import folder_etag, if_match, if_none_match, not_modified, note_etag, set_etag, user_view_etag
+from app.sharing import render_share, share_cache, share_token_hash, share_views
+from app.auth import AuthSession, authenticate, session_tokens
 from app.schemas import (
     UserCreate, UserResponse, UserWithNotes, 
-    NoteCreate, NoteUpdate, NoteResponse, NoteWithDecrypted, 
+    NoteCreate, NoteUpdate, NotePatch, NoteDeltaRequest, NoteResponse, NoteSummary, NoteWithDecrypted, 
     FolderCreate, FolderUpdate, FolderResponse, FolderWithDecrypted,
-    LoginRequest, LoginResponse
+    NoteBatchRequest, NoteBatchResponse, NoteRevisionPage, NoteRevisionWithDecrypted, ImportProgress,
+    ShareCreate, ShareResponse, SharedNoteView,
+    LoginRequest, LoginResponse, PasswordChangeRequest
 )
-from app.services import UserService, NoteService, FolderService
+from app.services import UserService, NoteService, FolderService, RevisionService, ShareService, ContentTooLarge
+from typing import List, Literal, Optional
 
-router = APIRouter(tags=["Users & Notes"], responses={404: {"description": "User or note not found"}, 409: {"description": "Conflict"}})
+router = APIRouter(tags=["Users & Notes"], route_class=InstrumentedRoute if settings.METRICS_ENABLED else APIRoute, responses={404: {"description": "User or note not found"}, 409: {"description": "Conflict"}})
 
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register_user(user_data: UserCreate, db: Session = Depends(get_db)) -> UserResponse:
+def register_user(user_data: UserCreate, db: Session = Depends(get_db)) -> UserResponse:
     user_service = UserService(db)
     existing = user_service.get_user_by_alias(user_data.alias)
     if existing:
@@ -22,149 +34,375 @@ async def register_user(user_data: UserCreate, db: Session = Depends(get_db)) ->
 
 
 @router.post("/login", response_model=LoginResponse)
-async def login_user(login_data: LoginRequest, db: Session = Depends(get_db)) -> LoginResponse:
+def login_user(login_data: LoginRequest, db: Session = Depends(get_db)) -> LoginResponse:
     user_service = UserService(db)
     user = user_service.get_user_by_alias(login_data.alias)
     if not user:
         return LoginResponse(success=False, message="User not found")
-    if not user_service.verify_password(user, login_data.password):
+    key = user_service.unlock(user, login_data.password)
+    if not key:
         return LoginResponse(success=False, message="Invalid password")
-    user_service.update_last_accessed(user.id)
-    return LoginResponse(success=True, message="Login successful", user=user)
+    user, key = user_service.upgrade_user_key(user, key)
+    NoteService(db).index_notes(user.id, key)
+    user = user_service.update_last_accessed(user)
+    token = session_tokens.issue(user.id, user.alias, key, user.session_epoch)
+    return LoginResponse(success=True, message="Login successful", user=user, token=token, token_type="bearer", expires_in=session_tokens.ttl_seconds)
 
 
+
+@router.post("/password", response_model=LoginResponse)
+def change_password(request: PasswordChangeRequest, db: Session = Depends(get_db)) -> LoginResponse:
+    """Change a user's password; only the wrapped data key is rewritten, not the records"""
+    user_service = UserService(db)
+    user = user_service.get_user_by_alias(request.alias)
+    if not user:
+        return LoginResponse(success=False, message="User not found")
+    key = user_service.unlock(user, request.password)
+    if not key:
+        return LoginResponse(success=False, message="Invalid password")
+    user, key = user_service.upgrade_user_key(user, key)
+    user, key = user_service.rewrap_data_key(user, key, request.new_password, end_sessions=True)
+    user = user_service.update_last_accessed(user)
+    token = session_tokens.issue(user.id, user.alias, key, user.session_epoch)
+    return LoginResponse(success=True, message="Password changed", user=user, token=token, token_type="bearer", expires_in=session_tokens.ttl_seconds)
+
 @router.get("/{alias}", response_model=UserWithNotes)
-async def get_user_with_notes(alias: str, db: Session = Depends(get_db)) -> UserWithNotes:
+def get_user_with_notes(
+    alias: str,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size; omit to return every note"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    fields: Literal["full", "summary"] = Query("full", description="'summary' omits encrypted_content"),
+    if_none_match_header: Optional[str] = Header(None, alias="If-None-Match"),
+    db: Session = Depends(get_db)
+) -> UserWithNotes:
     user_service = UserService(db)
     note_service = NoteService(db)
     folder_service = FolderService(db)
     user = user_service.get_user_by_alias(alias)
     if not user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{alias}' not found")
-    notes = note_service.get_user_notes(user.id)
-    folders = folder_service.get_user_folders(user.id)
-    return UserWithNotes(id=user.id, alias=user.alias, encrypted_alias=user.encrypted_alias, created_at=user.created_at, last_accessed_at=user.last_accessed_at, notes=notes, folders=folders)
+    try:
+        notes, next_cursor = note_service.get_user_notes_page(user.id, limit, cursor, summary=fields == "summary")
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    # Folders only ride along with the first page
+    folders = folder_service.get_user_folders(user.id) if not cursor else []
+    etag = user_view_etag(user, notes, folders, next_cursor)
+    if if_none_match(if_none_match_header, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    note_schema = NoteSummary if fields == "summary" else NoteResponse
+    return UserWithNotes(id=user.id, alias=user.alias, encrypted_alias=user.encrypted_alias, created_at=user.created_at, last_accessed_at=user.last_accessed_at, notes=[note_schema.model_validate(note) for note in notes], folders=folders, next_cursor=next_cursor)
 
 
 # ============= Folder Routes =============
 
 @router.post("/{alias}/folders", response_model=FolderResponse, status_code=status.HTTP_201_CREATED)
-async def create_folder(alias: str, folder_data: FolderCreate, password: str, db: Session = Depends(get_db)) -> FolderResponse:
-    user_service = UserService(db)
+def create_folder(alias: str, folder_data: FolderCreate, auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> FolderResponse:
     folder_service = FolderService(db)
-    user = user_service.get_user_by_alias(alias)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{alias}' not found")
-    if not user_service.verify_password(user, password):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
-    return folder_service.create_folder(user.id, folder_data, password)
+    return folder_service.create_folder(auth.user_id, folder_data, auth.key)
 
 
 @router.get("/{alias}/folders/{folder_id}", response_model=FolderWithDecrypted)
-async def get_folder(alias: str, folder_id: int, password: str, db: Session = Depends(get_db)) -> FolderWithDecrypted:
-    user_service = UserService(db)
+def get_folder(alias: str, folder_id: int, response: Response, if_none_match_header: Optional[str] = Header(None, alias="If-None-Match"), auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> FolderWithDecrypted:
     folder_service = FolderService(db)
-    user = user_service.get_user_by_alias(alias)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{alias}' not found")
-    if not user_service.verify_password(user, password):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     folder = folder_service.get_folder_by_id(folder_id)
-    if not folder or folder.user_id != user.id:
+    if not folder or folder.user_id != auth.user_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Folder {folder_id} not found")
-    decrypted_name = folder_service.decrypt_folder_name(folder, password)
+    etag = folder_etag(folder)
+    if if_none_match(if_none_match_header, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    decrypted_name = folder_service.decrypt_folder_name(folder, auth.key)
     return FolderWithDecrypted(id=folder.id, user_id=folder.user_id, encrypted_name=folder.encrypted_name, color=folder.color, icon=folder.icon, created_at=folder.created_at, decrypted_name=decrypted_name or "Unnamed Folder")
 
 
 @router.put("/{alias}/folders/{folder_id}", response_model=FolderResponse)
-async def update_folder(alias: str, folder_id: int, folder_data: FolderUpdate, password: str, db: Session = Depends(get_db)) -> FolderResponse:
-    user_service = UserService(db)
+def update_folder(alias: str, folder_id: int, folder_data: FolderUpdate, response: Response, if_match_header: Optional[str] = Header(None, alias="If-Match"), auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> FolderResponse:
     folder_service = FolderService(db)
-    user = user_service.get_user_by_alias(alias)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{alias}' not found")
-    if not user_service.verify_password(user, password):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     folder = folder_service.get_folder_by_id(folder_id)
-    if not folder or folder.user_id != user.id:
+    if not folder or folder.user_id != auth.user_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Folder {folder_id} not found")
-    return folder_service.update_folder(folder_id, folder_data, password)
+    if not if_match(if_match_header, folder_etag(folder)):
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Folder modified. Refresh.")
+    folder = folder_service.update_folder(folder_id, folder_data, auth.key)
+    set_etag(response, folder_etag(folder))
+    return folder
 
 
 @router.delete("/{alias}/folders/{folder_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_folder(alias: str, folder_id: int, password: str, db: Session = Depends(get_db)) -> None:
-    user_service = UserService(db)
+def delete_folder(
+    alias: str,
+    folder_id: int,
+    cascade: bool = Query(False, description="Also delete the notes in the folder instead of unfiling them"),
+    auth: AuthSession = Depends(authenticate),
+    db: Session = Depends(get_db)
+) -> None:
     folder_service = FolderService(db)
-    user = user_service.get_user_by_alias(alias)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{alias}' not found")
-    if not user_service.verify_password(user, password):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     folder = folder_service.get_folder_by_id(folder_id)
-    if not folder or folder.user_id != user.id:
+    if not folder or folder.user_id != auth.user_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Folder {folder_id} not found")
-    folder_service.delete_folder(folder_id)
+    folder_service.delete_folder(folder_id, cascade=cascade)
 
 
 # ============= Note Routes =============
 
 
 @router.post("/{alias}/notes", response_model=NoteResponse, status_code=status.HTTP_201_CREATED)
-async def create_note(alias: str, note_data: NoteCreate, password: str, db: Session = Depends(get_db)) -> NoteResponse:
-    user_service = UserService(db)
+def create_note(alias: str, note_data: NoteCreate, auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> NoteResponse:
     note_service = NoteService(db)
-    user = user_service.get_user_by_alias(alias)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{alias}' not found")
-    if not user_service.verify_password(user, password):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
-    return note_service.create_note(user.id, note_data, password)
+    return note_service.create_note(auth.user_id, note_data, auth.key)
+
+
+@router.post("/{alias}/notes/batch", response_model=NoteBatchResponse)
+def batch_notes(alias: str, batch: NoteBatchRequest, auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> NoteBatchResponse:
+    """Create, update, move or delete many notes in one transaction; results are reported per item"""
+    note_service = NoteService(db)
+    return NoteBatchResponse(results=note_service.apply_batch(auth.user_id, batch.operations, auth.key))
+
+
+@router.get("/{alias}/search", response_model=List[NoteSummary])
+def search_notes(
+    alias: str,
+    q: str = Query(..., min_length=1, max_length=500, description="Words that must all appear in the note's title or body (as whole words or word prefixes)"),
+    limit: int = Query(50, ge=1, le=500),
+    auth: AuthSession = Depends(authenticate),
+    db: Session = Depends(get_db)
+) -> List[NoteSummary]:
+    """Find notes through the blind search index, newest first, without decrypting any note"""
+    if not settings.SEARCH_INDEX_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Search is not enabled")
+    note_service = NoteService(db)
+    try:
+        return note_service.search_notes(auth.user_id, q, auth.key, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
 @router.get("/{alias}/notes/{note_id}", response_model=NoteWithDecrypted)
-async def get_note(alias: str, note_id: int, password: str, db: Session = Depends(get_db)) -> NoteWithDecrypted:
-    user_service = UserService(db)
+def get_note(alias: str, note_id: int, response: Response, if_none_match_header: Optional[str] = Header(None, alias="If-None-Match"), auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> NoteWithDecrypted:
+    note_service = NoteService(db)
+    note = note_service.get_note_by_id(note_id)
+    if not note or note.user_id != auth.user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} not found")
+    etag = note_etag(note.content_hash, note.delta_count, note.updated_at)
+    if if_none_match(if_none_match_header, etag):
+        return not_modified(etag)
+    set_etag(response, etag)
+    decrypted_title = note_service.decrypt_note_title(note, auth.key)
+    decrypted_content = note_service.decrypt_note_content(note, auth.key)
+    return NoteWithDecrypted(id=note.id, user_id=note.user_id, encrypted_title=note.encrypted_title, encrypted_content=note.encrypted_content, content_hash=note.content_hash, created_at=note.created_at, updated_at=note.updated_at, folder_id=note.folder_id, delta_count=note.delta_count, decrypted_title=decrypted_title, decrypted_content=decrypted_content)
+
+
+@router.get("/{alias}/notes/{note_id}/raw", response_class=Response, responses={200: {"content": {"application/octet-stream": {}}}})
+def get_note_raw(alias: str, note_id: int, auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> Response:
+    """
+    Ciphertext of the note body as raw bytes (header + salt + nonce + ciphertext), no base64.
+    Pending deltas are folded into the returned blob, not into the stored note.
+    """
     note_service = NoteService(db)
-    user = user_service.get_user_by_alias(alias)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{alias}' not found")
-    if not user_service.verify_password(user, password):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     note = note_service.get_note_by_id(note_id)
-    if not note or note.user_id != user.id:
+    if not note or note.user_id != auth.user_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} not found")
-    decrypted_title = note_service.decrypt_note_title(note, password)
-    decrypted_content = note_service.decrypt_note_content(note, password)
-    return NoteWithDecrypted(id=note.id, user_id=note.user_id, encrypted_title=note.encrypted_title, encrypted_content=note.encrypted_content, content_hash=note.content_hash, created_at=note.created_at, updated_at=note.updated_at, folder_id=note.folder_id, decrypted_title=decrypted_title, decrypted_content=decrypted_content)
+    return Response(content=note_service.raw_note_content(note, auth.key), media_type="application/octet-stream", headers={"X-Content-Hash": note.content_hash})
 
 
 @router.put("/{alias}/notes/{note_id}", response_model=NoteResponse)
-async def update_note(alias: str, note_id: int, note_data: NoteUpdate, password: str, db: Session = Depends(get_db)) -> NoteResponse:
-    user_service = UserService(db)
+def update_note(alias: str, note_id: int, note_data: NoteUpdate, response: Response, if_match_header: Optional[str] = Header(None, alias="If-Match", description="ETag from a previous read; replaces previous_hash"), auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> NoteResponse:
     note_service = NoteService(db)
-    user = user_service.get_user_by_alias(alias)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{alias}' not found")
-    if not user_service.verify_password(user, password):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     note = note_service.get_note_by_id(note_id)
-    if not note or note.user_id != user.id:
+    if not note or note.user_id != auth.user_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} not found")
+    if not if_match(if_match_header, note_etag(note.content_hash, note.delta_count, note.updated_at)):
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail="Note modified. Refresh.")
     if note_data.previous_hash and note.content_hash != note_data.previous_hash:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Note modified. Refresh.")
-    return note_service.update_note(note_id, note_data, password)
+    note = note_service.update_note(note_id, note_data, auth.key)
+    set_etag(response, note_etag(note.content_hash, note.delta_count, note.updated_at))
+    return note
+
+
+@router.patch("/{alias}/notes/{note_id}", response_model=NoteSummary)
+def patch_note(alias: str, note_id: int, patch: NotePatch, auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> NoteSummary:
+    """Partial update: title/folder changes are a single UPDATE (after an ownership check of the target folder) and never re-encrypt the body"""
+    if patch.folder_id not in (None, -1):
+        folder = FolderService(db).get_folder_by_id(patch.folder_id)
+        if not folder or folder.user_id != auth.user_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Folder {patch.folder_id} not found")
+    note_service = NoteService(db)
+    try:
+        row = note_service.patch_note(note_id, auth.user_id, patch, auth.key)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if row is None:
+        note = note_service.get_note_by_id(note_id)
+        if not note or note.user_id != auth.user_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} not found")
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Note modified. Refresh.")
+    return NoteSummary.model_validate(row)
+
+
+@router.post("/{alias}/notes/{note_id}/delta", response_model=NoteSummary)
+def save_note_delta(alias: str, note_id: int, delta: NoteDeltaRequest, auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> NoteSummary:
+    """Save edits as an encrypted delta; cost scales with the edit, not the note. previous_hash is required."""
+    note_service = NoteService(db)
+    try:
+        row = note_service.save_delta(note_id, auth.user_id, delta, auth.key)
+    except ContentTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=str(e))
+    if row is None:
+        note = note_service.get_note_by_id(note_id)
+        if not note or note.user_id != auth.user_id:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} not found")
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Note modified. Refresh.")
+    return NoteSummary.model_validate(row)
+
+
+@router.get("/{alias}/notes/{note_id}/revisions", response_model=NoteRevisionPage)
+def list_note_revisions(
+    alias: str,
+    note_id: int,
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    auth: AuthSession = Depends(authenticate),
+    db: Session = Depends(get_db)
+) -> NoteRevisionPage:
+    """Prior versions of a note, newest first"""
+    note = NoteService(db).get_note_by_id(note_id)
+    if not note or note.user_id != auth.user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} not found")
+    try:
+        revisions, next_cursor = RevisionService(db).list_revisions(note_id, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return NoteRevisionPage(revisions=revisions, next_cursor=next_cursor)
+
+
+@router.get("/{alias}/notes/{note_id}/revisions/{revision_id}", response_model=NoteRevisionWithDecrypted)
+def get_note_revision(alias: str, note_id: int, revision_id: int, auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> NoteRevisionWithDecrypted:
+    note = NoteService(db).get_note_by_id(note_id)
+    if not note or note.user_id != auth.user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} not found")
+    revision_service = RevisionService(db)
+    revision = revision_service.get_revision(note_id, revision_id)
+    if not revision:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Revision {revision_id} not found")
+    decrypted_title, decrypted_content = revision_service.decrypt_revision(revision, auth.key)
+    return NoteRevisionWithDecrypted(id=revision.id, note_id=revision.note_id, content_hash=revision.content_hash, created_at=revision.created_at, encrypted_title=revision.encrypted_title, encrypted_content=revision.encrypted_content, decrypted_title=decrypted_title, decrypted_content=decrypted_content)
 
 
 @router.delete("/{alias}/notes/{note_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_note(alias: str, note_id: int, password: str, db: Session = Depends(get_db)) -> None:
-    user_service = UserService(db)
+def delete_note(alias: str, note_id: int, auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> None:
     note_service = NoteService(db)
-    user = user_service.get_user_by_alias(alias)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"User '{alias}' not found")
-    if not user_service.verify_password(user, password):
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid password")
     note = note_service.get_note_by_id(note_id)
-    if not note or note.user_id != user.id:
+    if not note or note.user_id != auth.user_id:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} not found")
     note_service.delete_note(note_id)
+
+
+
+# ============= Import =============
+
+@router.post("/{alias}/import", response_model=ImportProgress, responses={400: {"description": "Malformed archive"}})
+async def import_vault(
+    alias: str,
+    request: Request,
+    format: Literal["ndjson", "tar"] = Query("ndjson", description="Archive format"),
+    auth: AuthSession = Depends(authenticate)
+) -> ImportProgress:
+    """
+    Import folders and notes from an archive streamed as the request body (the /export layout).
+    Uploading the same archive again resumes an interrupted import without duplicating notes.
+    """
+    # async so the body is parsed as it arrives; batches are encrypted and written on worker threads
+    try:
+        return await run_import(auth.user_id, auth.key, request.stream(), format)
+    except ImportInProgress:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="An import is already running for this user")
+    except ImportFormatError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+
+@router.get("/{alias}/import", response_model=ImportProgress)
+def get_import_progress(alias: str, auth: AuthSession = Depends(authenticate)) -> ImportProgress:
+    """Progress of the latest import (counts cover committed batches)"""
+    progress = import_tracker.get(auth.user_id)
+    if progress is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No import found")
+    return progress
+
+# ============= Export =============
+
+@router.get("/{alias}/export", response_class=StreamingResponse, responses={200: {"content": {"application/x-ndjson": {}, "application/x-tar": {}}}})
+def export_vault(
+    alias: str,
+    format: Literal["ndjson", "tar"] = Query("ndjson", description="Archive format"),
+    decrypted: bool = Query(False, description="Export plaintext instead of ciphertext"),
+    auth: AuthSession = Depends(authenticate)
+) -> StreamingResponse:
+    """Stream every folder and note of the vault as one archive"""
+    encoder = EXPORT_ENCODERS[format]
+    return StreamingResponse(
+        stream_export(auth.user_id, auth.alias, auth.key, format, decrypted),
+        media_type=encoder.media_type,
+        headers={"Content-Disposition": f'attachment; filename="{auth.alias}-vault.{encoder.extension}"'}
+    )
+
+
+# ============= Sharing =============
+
+@router.post("/{alias}/notes/{note_id}/share", response_model=ShareResponse, status_code=status.HTTP_201_CREATED)
+def share_note(alias: str, note_id: int, share_data: Optional[ShareCreate] = None, auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> ShareResponse:
+    """Create a public link to a snapshot of the note; an earlier link to the note stops working"""
+    note_service = NoteService(db)
+    note = note_service.get_note_by_id(note_id)
+    if not note or note.user_id != auth.user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} not found")
+    content = note_service.decrypt_note_content(note, auth.key)
+    if content is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=f"Note {note_id} could not be decrypted")
+    title = note_service.decrypt_note_title(note, auth.key)
+    share, token, replaced = ShareService(db).create_share(note_id, title, content, share_data.expires_in_seconds if share_data else None)
+    if replaced:
+        share_cache.discard(replaced)
+    return ShareResponse(note_id=note_id, share_token=token, created_at=share.created_at, expires_at=share.expires_at, view_count=share.view_count)
+
+
+@router.get("/{alias}/notes/{note_id}/share", response_model=ShareResponse)
+def get_note_share(alias: str, note_id: int, auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> ShareResponse:
+    note = NoteService(db).get_note_by_id(note_id)
+    if not note or note.user_id != auth.user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} not found")
+    share = ShareService(db).get_share(note_id)
+    if share is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} is not shared")
+    return ShareResponse(note_id=note_id, created_at=share.created_at, expires_at=share.expires_at, view_count=share.view_count)
+
+
+@router.delete("/{alias}/notes/{note_id}/share", status_code=status.HTTP_204_NO_CONTENT)
+def revoke_note_share(alias: str, note_id: int, auth: AuthSession = Depends(authenticate), db: Session = Depends(get_db)) -> None:
+    note = NoteService(db).get_note_by_id(note_id)
+    if not note or note.user_id != auth.user_id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} not found")
+    token_hash = ShareService(db).revoke_share(note_id)
+    if token_hash is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Note {note_id} is not shared")
+    share_cache.discard(token_hash)
+
+
+# Registered last so a user aliased "shared" keeps their /{alias}/... routes
+@router.get("/shared/{share_token}", response_model=SharedNoteView, responses={404: {"description": "Unknown, revoked or expired link"}})
+def get_shared_note(share_token: str, db: Session = Depends(get_db)) -> Response:
+    """Public read of a shared note; the link token is the only credential"""
+    token_hash = share_token_hash(share_token)
+    shared = share_cache.get(token_hash)
+    if shared is None:
+        share = ShareService(db).get_active_share(token_hash)
+        if share is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Shared note not found")
+        shared = render_share(share, share_token)
+        share_cache.put(token_hash, shared)
+    # Counted in memory; a background job writes the totals in batches
+    share_views.record(shared.share_id)
+    return Response(content=shared.body, media_type="application/json")
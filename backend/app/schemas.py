@@ -1,7 +1,17 @@
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, BeforeValidator, Field, field_validator
 from datetime import datetime
-from typing import Optional, List
+from typing import Annotated, Optional, List, Literal, Union
 import re
+from app.config import settings
+from app.crypto import CryptoUtils
+
+
+def _ciphertext_to_text(value):
+    return CryptoUtils.to_text(value) if isinstance(value, bytes) else value
+
+
+# Ciphertext columns hold raw bytes; base64 is produced here, at the JSON boundary
+Ciphertext = Annotated[str, BeforeValidator(_ciphertext_to_text)]
 
 
 # ============= User Schemas =============
@@ -30,7 +40,7 @@ class UserCreate(BaseModel):
 class UserResponse(UserBase):
     """Schema for user response"""
     id: int
-    encrypted_alias: str
+    encrypted_alias: Ciphertext
     created_at: datetime
     last_accessed_at: datetime
     
@@ -55,7 +65,7 @@ class FolderResponse(BaseModel):
     """Schema for folder response"""
     id: int
     user_id: int
-    encrypted_name: str
+    encrypted_name: Ciphertext
     color: Optional[str]
     icon: Optional[str]
     created_at: datetime
@@ -78,39 +88,155 @@ class NoteUpdate(BaseModel):
     title: Optional[str] = Field(None, max_length=500)
     content: str = Field(..., description="Updated note content")
     folder_id: Optional[int] = Field(None, description="Folder ID (use -1 to remove from folder)")
-    previous_hash: Optional[str] = Field(None, description="Optional: Previous hash for overwrite protection")
+    previous_hash: Optional[str] = Field(None, description="Optional: Previous hash for overwrite protection; prefer the If-Match header")
 
-class NoteResponse(BaseModel):
+class NoteSummary(BaseModel):
+    """Note listing without the encrypted body"""
     id: int
     user_id: int
     folder_id: Optional[int]
-    encrypted_title: Optional[str]
-    encrypted_content: str
+    encrypted_title: Optional[Ciphertext]
     content_hash: str
     created_at: datetime
     updated_at: Optional[datetime]
+    delta_count: int = Field(0, description="Deltas stored on top of encrypted_content; the body is the base with these applied")
     
     model_config = {"from_attributes": True}
 
+class NotePatch(BaseModel):
+    """Partial note update; only the fields that are sent are changed"""
+    title: Optional[str] = Field(None, max_length=500, description="New title (empty string clears it)")
+    content: Optional[str] = Field(None, description="New content; omit to keep the current body untouched")
+    folder_id: Optional[int] = Field(None, description="Folder ID (use -1 to remove from folder)")
+    previous_hash: Optional[str] = Field(None, description="Optional: Previous hash for overwrite protection")
+
+class NoteEdit(BaseModel):
+    """Replace characters [start, end) with text; offsets past the end clamp like Python slices"""
+    start: int = Field(..., ge=0)
+    end: int = Field(..., ge=0)
+    text: str = Field("", max_length=settings.MAX_CONTENT_SIZE)
+    
+    @field_validator('end')
+    @classmethod
+    def validate_range(cls, v: int, info) -> int:
+        if 'start' in info.data and v < info.data['start']:
+            raise ValueError('end must not be before start')
+        return v
+
+class NoteDeltaRequest(BaseModel):
+    """Edits applied in order, each to the result of the previous one"""
+    previous_hash: str = Field(..., description="content_hash the edits were made against")
+    edits: List[NoteEdit] = Field(..., min_length=1, max_length=1000)
+
+class NoteResponse(NoteSummary):
+    encrypted_content: Ciphertext
+
 class NoteWithDecrypted(NoteResponse):
     decrypted_title: Optional[str] = None
     decrypted_content: Optional[str] = None
 
+class NoteRevisionSummary(BaseModel):
+    """A prior version of a note, without its encrypted body"""
+    id: int
+    note_id: int
+    content_hash: str = Field(..., description="content_hash the note had at this version")
+    created_at: datetime
+    
+    model_config = {"from_attributes": True}
+
+class NoteRevisionWithDecrypted(NoteRevisionSummary):
+    encrypted_title: Optional[Ciphertext]
+    encrypted_content: Ciphertext
+    decrypted_title: Optional[str] = None
+    decrypted_content: Optional[str] = None
+
+class NoteRevisionPage(BaseModel):
+    """Revisions of a note, newest first"""
+    revisions: List[NoteRevisionSummary]
+    next_cursor: Optional[str] = Field(None, description="Pass as ?cursor= to fetch older revisions; null on the last page")
+
+class NoteBatchOperation(BaseModel):
+    """One operation in a batch; id is required for everything except create"""
+    op: Literal["create", "update", "move", "delete"]
+    id: Optional[int] = Field(None, description="Target note ID (update, move, delete)")
+    title: Optional[str] = Field(None, max_length=500)
+    content: Optional[str] = Field(None, description="Note content (required for create)")
+    folder_id: Optional[int] = Field(None, description="Folder ID (use -1 to remove from folder)")
+    previous_hash: Optional[str] = Field(None, description="Optional: Previous hash for overwrite protection")
+
+class NoteBatchRequest(BaseModel):
+    operations: List[NoteBatchOperation] = Field(..., min_length=1, max_length=500)
+
+class NoteBatchResult(BaseModel):
+    index: int = Field(..., description="Position of the operation in the request")
+    op: str
+    id: Optional[int] = None
+    status: Literal["ok", "conflict", "not_found", "invalid"]
+    detail: Optional[str] = None
+    note: Optional[NoteSummary] = None
+
+class NoteBatchResponse(BaseModel):
+    results: List[NoteBatchResult]
+
+class ImportProgress(BaseModel):
+    """Progress of a user's latest bulk import; counts only cover committed batches"""
+    status: Literal["running", "completed", "failed"]
+    bytes_received: int
+    records: int = Field(..., description="Records parsed from the upload so far")
+    folders_created: int
+    folders_reused: int = Field(..., description="Folders matched by name to an existing folder")
+    notes_imported: int
+    notes_skipped: int = Field(..., description="Notes already present from an earlier import (matched by hash)")
+    failed: int
+    errors: List[str] = Field([], description="First errors encountered, by record number")
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+
+
+# ============= Shared Note Schemas =============
+
+class ShareCreate(BaseModel):
+    expires_in_seconds: Optional[int] = Field(None, ge=60, le=31_536_000, description="Link lifetime; omit for a link that doesn't expire")
+
+class ShareResponse(BaseModel):
+    """A note's share link; the token is only returned when the link is created"""
+    note_id: int
+    share_token: Optional[str] = Field(None, description="Fetch the note with GET /shared/{share_token}")
+    created_at: datetime
+    expires_at: Optional[datetime]
+    view_count: int = Field(..., description="Written in batches, so it can lag by a few seconds")
+    
+    model_config = {"from_attributes": True}
+
+class SharedNoteView(BaseModel):
+    """Public, decrypted view of a shared note"""
+    title: Optional[str]
+    content: str
+    shared_at: datetime
+    expires_at: Optional[datetime]
 
 # ============= Combined Schemas =============
 
 class UserWithNotes(UserResponse):
-    """User with all their notes"""
-    notes: List[NoteResponse] = []
+    """User with a page of their notes (newest first)"""
+    notes: List[Union[NoteResponse, NoteSummary]] = []
     folders: List[FolderResponse] = []
+    next_cursor: Optional[str] = Field(None, description="Pass as ?cursor= to fetch the next page; null on the last page")
 
 class LoginRequest(BaseModel):
     """Schema for user login"""
     alias: str = Field(..., min_length=1)
     password: str = Field(..., min_length=4)
 
+class PasswordChangeRequest(LoginRequest):
+    """Schema for changing a user's password"""
+    new_password: str = Field(..., min_length=4)
+
 class LoginResponse(BaseModel):
     """Schema for login response"""
     success: bool
     message: str
     user: Optional[UserResponse] = None
+    token: Optional[str] = Field(None, description="Session token; send as 'Authorization: Bearer <token>'")
+    token_type: Optional[str] = None
+    expires_in: Optional[int] = Field(None, description="Token lifetime in seconds")
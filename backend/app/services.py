@@ -1,48 +1,798 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import select
-from app.models import User, Note, Folder
-from app.schemas import UserCreate, NoteCreate, NoteUpdate, FolderCreate, FolderUpdate
-from app.crypto import CryptoUtils
-from datetime import datetime
-from typing import Optional, List
+from sqlalchemy import select, insert, update, delete, and_, or_, func, distinct, bindparam, case, Select, Update, Delete, Insert
+from app.models import User, Note, NoteDelta, NoteRevision, NoteSearchToken, SharedNote, Folder
+from app.schemas import UserCreate, NoteCreate, NoteUpdate, FolderCreate, FolderUpdate, NoteBatchOperation, NoteBatchResult, NoteSummary, NotePatch, NoteDeltaRequest, NoteEdit
+from app.config import settings
+from app.crypto import CryptoUtils, UserKey, key_cache
+from app.concurrency import map_crypto
+from app.sharing import encrypt_for_share, new_share_token, share_token_hash
+from app.user_cache import CachedUser, user_cache
+from app.last_access import last_access
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Optional, List, Set, Tuple
+import base64
+import dataclasses
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+
+# Columns returned by the summary projection of a user's note list (no encrypted body)
+NOTE_SUMMARY_COLUMNS = (Note.id, Note.user_id, Note.folder_id, Note.encrypted_title, Note.content_hash, Note.created_at, Note.updated_at, Note.delta_count)
+
+
+def encode_note_cursor(created_at: datetime, note_id: int) -> str:
+    """Opaque keyset cursor for the (created_at, id) position of a note"""
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{note_id}".encode('utf-8')).decode('ascii')
+
+
+def decode_note_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Inverse of encode_note_cursor; raises ValueError on a malformed cursor"""
+    try:
+        created_at, note_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8').split('|')
+        return datetime.fromisoformat(created_at), int(note_id)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def user_notes_query(user_id: int, limit: Optional[int] = None, cursor: Optional[str] = None, summary: bool = False) -> Select:
+    """
+    Active notes for a user, newest first, keyset-paginated on (created_at, id).
+    Fetches limit + 1 rows so callers can tell whether another page exists.
+    """
+    stmt = select(*NOTE_SUMMARY_COLUMNS) if summary else select(Note)
+    stmt = stmt.where(Note.user_id == user_id, Note.is_active == True)
+    if cursor:
+        created_at, note_id = decode_note_cursor(cursor)
+        stmt = stmt.where(or_(Note.created_at < created_at, and_(Note.created_at == created_at, Note.id < note_id)))
+    stmt = stmt.order_by(Note.created_at.desc(), Note.id.desc())
+    if limit:
+        stmt = stmt.limit(limit + 1)
+    return stmt
+
+
+def split_note_page(rows: list, limit: Optional[int]) -> Tuple[list, Optional[str]]:
+    """Trim the look-ahead row from a user_notes_query result and build the next cursor"""
+    if not limit or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_note_cursor(rows[-1].created_at, rows[-1].id)
+
+
+class NoteBatchPlan:
+    """
+    Bulk statements and per-item results for a batch of note operations.
+    Built without touching the DB so the sync and async services share it.
+    """
+
+    def __init__(self, user_id: int, operations: List[NoteBatchOperation], key: UserKey, existing: Dict[int, Any], folder_ids: Set[int]):
+        self.results: List[Optional[NoteBatchResult]] = [None] * len(operations)
+        self.inserts: List[dict] = []
+        self.updates: List[dict] = []
+        self.replaced_bodies: List[int] = []
+        self.search_texts: Dict[Tuple[int, int], str] = {}
+        self._insert_indexes: List[int] = []
+        self._insert_texts: List[Tuple[str, str]] = []
+        now = datetime.utcnow()
+        seen: Set[int] = set()
+        for index, operation in enumerate(operations):
+            def fail(status: str, detail: str) -> None:
+                self.results[index] = NoteBatchResult(index=index, op=operation.op, id=operation.id, status=status, detail=detail)
+            
+            folder_id = None if operation.folder_id in (None, -1) else operation.folder_id
+            if folder_id is not None and folder_id not in folder_ids:
+                fail("invalid", f"Folder {folder_id} not found")
+                continue
+            if operation.op == "create":
+                if operation.content is None:
+                    fail("invalid", "content is required")
+                    continue
+                encrypted_content = CryptoUtils.encrypt_with_key(operation.content, key)
+                self.inserts.append(dict(
+                    user_id=user_id,
+                    folder_id=folder_id,
+                    encrypted_title=CryptoUtils.encrypt_with_key(operation.title, key) if operation.title else None,
+                    encrypted_content=encrypted_content,
+                    content_hash=CryptoUtils.hash_content(encrypted_content),
+                    created_at=now,
+                    is_active=True
+                ))
+                self._insert_indexes.append(index)
+                self._insert_texts.append((operation.title or "", operation.content))
+                continue
+            
+            if operation.id is None:
+                fail("invalid", "id is required")
+                continue
+            if operation.id in seen:
+                fail("invalid", "Duplicate note id in batch")
+                continue
+            seen.add(operation.id)
+            note = existing.get(operation.id)
+            if note is None:
+                fail("not_found", f"Note {operation.id} not found")
+                continue
+            if operation.previous_hash and operation.previous_hash != note.content_hash:
+                fail("conflict", "Note modified. Refresh.")
+                continue
+            
+            values: Dict[str, Any] = {"id": operation.id, "updated_at": now}
+            if operation.op == "update":
+                if operation.title is None and operation.content is None and operation.folder_id is None:
+                    fail("invalid", "Nothing to update")
+                    continue
+                if operation.title is not None:
+                    values["encrypted_title"] = CryptoUtils.encrypt_with_key(operation.title, key)
+                if operation.content is not None:
+                    values["encrypted_content"] = CryptoUtils.encrypt_with_key(operation.content, key)
+                    values["content_hash"] = CryptoUtils.hash_content(values["encrypted_content"])
+                    values["delta_count"] = 0
+                    self.replaced_bodies.append(operation.id)
+                if operation.folder_id is not None:
+                    values["folder_id"] = folder_id
+                self.search_texts.update(note_search_texts(operation.id, operation.title, operation.content))
+            elif operation.op == "move":
+                if operation.folder_id is None:
+                    fail("invalid", "folder_id is required (use -1 to remove from folder)")
+                    continue
+                values["folder_id"] = folder_id
+            else:
+                values["is_active"] = False
+            self.updates.append(values)
+            summary = {**note._mapping, **{k: v for k, v in values.items() if k in NoteSummary.model_fields}}
+            self.results[index] = NoteBatchResult(index=index, op=operation.op, id=operation.id, status="ok", note=NoteSummary.model_validate(summary))
+    
+    def complete_inserts(self, rows: list) -> None:
+        """Fill in create results from INSERT .. RETURNING rows (in parameter order)"""
+        for index, row, (title, content) in zip(self._insert_indexes, rows, self._insert_texts):
+            self.results[index] = NoteBatchResult(index=index, op="create", id=row.id, status="ok", note=NoteSummary.model_validate(row))
+            self.search_texts.update(note_search_texts(row.id, title, content))
+
+
+def note_batch_queries(user_id: int, operations: List[NoteBatchOperation]) -> Tuple[Optional[Select], Optional[Select]]:
+    """One IN query for the target notes (no bodies) and one for the referenced folders"""
+    note_ids = {op.id for op in operations if op.op != "create" and op.id is not None}
+    folder_ids = {op.folder_id for op in operations if op.folder_id not in (None, -1)}
+    notes_stmt = select(*NOTE_SUMMARY_COLUMNS).where(Note.id.in_(note_ids), Note.user_id == user_id, Note.is_active == True) if note_ids else None
+    folders_stmt = select(Folder.id).where(Folder.id.in_(folder_ids), Folder.user_id == user_id, Folder.is_active == True) if folder_ids else None
+    return notes_stmt, folders_stmt
+
+
+def note_patch_statement(note_id: int, user_id: int, patch: NotePatch, key: UserKey) -> Update:
+    """
+    Single UPDATE .. RETURNING for a partial note update. Ownership and the
+    previous_hash check are part of the WHERE clause, so no row comes back on
+    a missing note or a conflict. The body is only re-encrypted if content is sent.
+    Raises ValueError when the patch changes nothing.
+    """
+    values: Dict[str, Any] = {}
+    if patch.title is not None:
+        values["encrypted_title"] = CryptoUtils.encrypt_with_key(patch.title, key) if patch.title else None
+    if patch.content is not None:
+        values["encrypted_content"] = CryptoUtils.encrypt_with_key(patch.content, key)
+        values["content_hash"] = CryptoUtils.hash_content(values["encrypted_content"])
+        values["delta_count"] = 0
+    if patch.folder_id is not None:
+        values["folder_id"] = None if patch.folder_id == -1 else patch.folder_id
+    if not values:
+        raise ValueError("Nothing to update")
+    values["updated_at"] = datetime.utcnow()
+    stmt = update(Note).where(Note.id == note_id, Note.user_id == user_id, Note.is_active == True)
+    if patch.previous_hash:
+        stmt = stmt.where(Note.content_hash == patch.previous_hash)
+    return stmt.values(**values).returning(*NOTE_SUMMARY_COLUMNS)
+
+
+def folder_delete_statements(folder_id: int, cascade: bool = False) -> List[Update]:
+    """Bulk UPDATEs that soft-delete a folder and unfile (or cascade soft-delete) its notes"""
+    now = datetime.utcnow()
+    if cascade:
+        notes_stmt = update(Note).where(Note.folder_id == folder_id, Note.is_active == True).values(is_active=False, updated_at=now)
+    else:
+        # Remove folder reference from notes but don't delete them
+        notes_stmt = update(Note).where(Note.folder_id == folder_id).values(folder_id=None)
+    folder_stmt = update(Folder).where(Folder.id == folder_id, Folder.is_active == True).values(is_active=False)
+    return [notes_stmt, folder_stmt]
+
+
+NOTE_BATCH_INSERT = insert(Note).returning(*NOTE_SUMMARY_COLUMNS, sort_by_parameter_order=True)
+
+def encrypt_note_edits(edits: List[NoteEdit], key: UserKey) -> bytes:
+    """Encrypted delta payload; its size follows the edit, not the note"""
+    return CryptoUtils.encrypt_with_key(json.dumps([[edit.start, edit.end, edit.text] for edit in edits], separators=(',', ':')), key)
+
+
+class ContentTooLarge(ValueError):
+    """A write would grow a note body past settings.MAX_CONTENT_SIZE"""
+
+
+def apply_note_edits(content: str, edits: Iterable[Tuple[int, int, str]]) -> str:
+    """Apply (start, end, text) edits in order, each to the result of the previous one"""
+    for start, end, text in edits:
+        content = content[:start] + text + content[end:]
+    return content
+
+
+def apply_note_deltas(content: str, encrypted_deltas: Iterable[bytes], key: UserKey) -> str:
+    """Apply encrypted deltas (in seq order) to a decrypted base"""
+    for blob in encrypted_deltas:
+        content = apply_note_edits(content, json.loads(CryptoUtils.decrypt_with_key(blob, key)))
+    return content
+
+
+def note_content_after_delta(encrypted_content: bytes, encrypted_deltas: Iterable[bytes], edits: List[NoteEdit], key: UserKey) -> str:
+    """The body a delta would produce; raises ContentTooLarge if it exceeds MAX_CONTENT_SIZE"""
+    content = apply_note_deltas(CryptoUtils.decrypt_with_key(encrypted_content, key), encrypted_deltas, key)
+    content = apply_note_edits(content, ((edit.start, edit.end, edit.text) for edit in edits))
+    if len(content.encode('utf-8')) > settings.MAX_CONTENT_SIZE:
+        raise ContentTooLarge(f"Content larger than {settings.MAX_CONTENT_SIZE} bytes")
+    return content
+
+
+def compact_note_content(encrypted_content: bytes, encrypted_deltas: Iterable[bytes], key: UserKey) -> bytes:
+    """A new base snapshot: the base with every delta applied, re-encrypted"""
+    content = apply_note_deltas(CryptoUtils.decrypt_with_key(encrypted_content, key), encrypted_deltas, key)
+    return CryptoUtils.encrypt_with_key(content, key)
+
+
+def note_deltas_query(note_id: int) -> Select:
+    return select(NoteDelta.encrypted_delta).where(NoteDelta.note_id == note_id).order_by(NoteDelta.seq)
+
+
+def note_delta_base_query(note_id: int, user_id: int) -> Select:
+    """The base and chain head a delta is checked against before it is saved"""
+    return select(Note.encrypted_content, Note.content_hash).where(Note.id == note_id, Note.user_id == user_id, Note.is_active == True)
+
+
+def notes_deltas_query(note_ids: List[int]) -> Select:
+    """(note_id, encrypted_delta) of several notes, each in seq order"""
+    return select(NoteDelta.note_id, NoteDelta.encrypted_delta).where(NoteDelta.note_id.in_(note_ids)).order_by(NoteDelta.note_id, NoteDelta.seq)
+
+
+def group_note_deltas(rows) -> Dict[int, List[bytes]]:
+    deltas: Dict[int, List[bytes]] = {}
+    for note_id, encrypted_delta in rows:
+        deltas.setdefault(note_id, []).append(encrypted_delta)
+    return deltas
+
+
+def note_delta_statements(note_id: int, user_id: int, delta: NoteDeltaRequest, key: UserKey) -> Tuple[Update, dict]:
+    """
+    UPDATE .. RETURNING that advances the note's chain head, and the values of the
+    note_deltas row to insert when it matches. The new content_hash chains the
+    previous one with the delta, so saving never reads or hashes the whole body.
+    Like note_patch_statement, no row comes back on a missing note or a stale previous_hash.
+    """
+    encrypted_delta = encrypt_note_edits(delta.edits, key)
+    content_hash = CryptoUtils.hash_content(delta.previous_hash.encode('utf-8') + encrypted_delta)
+    now = datetime.utcnow()
+    stmt = (
+        update(Note)
+        .where(Note.id == note_id, Note.user_id == user_id, Note.is_active == True, Note.content_hash == delta.previous_hash)
+        .values(content_hash=content_hash, delta_count=Note.delta_count + 1, updated_at=now)
+        .returning(*NOTE_SUMMARY_COLUMNS)
+    )
+    return stmt, dict(note_id=note_id, encrypted_delta=encrypted_delta, content_hash=content_hash, created_at=now)
+
+
+def note_compaction_statements(note_id: int, encrypted_content: bytes) -> Tuple[Delete, Update]:
+    """Swap in a compacted base and drop the deltas; content_hash (the chain head) is kept"""
+    return (
+        delete(NoteDelta).where(NoteDelta.note_id == note_id),
+        update(Note).where(Note.id == note_id).values(encrypted_content=encrypted_content, delta_count=0).returning(*NOTE_SUMMARY_COLUMNS),
+    )
+
+
+def record_revisions_statement(note_ids: List[int]) -> Insert:
+    """
+    INSERT .. SELECT snapshotting the current version of each note, skipping versions
+    already recorded. Runs before a body is replaced; notes with pending deltas are
+    compacted first so encrypted_content matches content_hash.
+    """
+    recorded = select(NoteRevision.id).where(NoteRevision.note_id == Note.id, NoteRevision.content_hash == Note.content_hash).exists()
+    versions = select(Note.id, Note.encrypted_title, Note.encrypted_content, Note.content_hash, func.coalesce(Note.updated_at, Note.created_at)).where(Note.id.in_(note_ids), ~recorded)
+    return insert(NoteRevision).from_select(["note_id", "encrypted_title", "encrypted_content", "content_hash", "created_at"], versions)
+
+
+def note_revisions_query(note_id: int, limit: int, cursor: Optional[str] = None) -> Select:
+    """Revision summaries of a note, newest first, keyset-paginated on id (limit + 1 rows)"""
+    stmt = select(NoteRevision.id, NoteRevision.note_id, NoteRevision.content_hash, NoteRevision.created_at).where(NoteRevision.note_id == note_id)
+    if cursor:
+        try:
+            stmt = stmt.where(NoteRevision.id < int(cursor))
+        except ValueError as e:
+            raise ValueError("Invalid cursor") from e
+    return stmt.order_by(NoteRevision.id.desc()).limit(limit + 1)
+
+
+def split_revision_page(rows: list, limit: int) -> Tuple[list, Optional[str]]:
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, str(rows[-1].id)
+
+
+# Time-decayed retention: (max age, spacing). Revisions younger than max age keep one
+# per spacing window (None keeps all); the last tier applies to everything older.
+REVISION_DECAY_TIERS = (
+    (timedelta(hours=1), None),
+    (timedelta(days=1), timedelta(hours=1)),
+    (timedelta(days=30), timedelta(days=1)),
+    (None, timedelta(weeks=1)),
+)
+
+
+def revisions_to_prune(revisions: List[Tuple[int, datetime]], now: datetime) -> List[int]:
+    """
+    Apply NOTE_REVISION_RETENTION to one note's (id, created_at) revisions, newest first.
+    Returns the ids to delete.
+    """
+    if settings.NOTE_REVISION_RETENTION == "count":
+        return [revision_id for revision_id, _ in revisions[settings.NOTE_REVISION_KEEP_LAST:]]
+    prune, kept_windows = [], set()
+    for revision_id, created_at in revisions:
+        age = now - created_at
+        spacing = next(spacing for max_age, spacing in REVISION_DECAY_TIERS if max_age is None or age < max_age)
+        if spacing is None:
+            continue
+        # The newest revision in each window survives
+        window = (spacing, int(created_at.timestamp() // spacing.total_seconds()))
+        if window in kept_windows:
+            prune.append(revision_id)
+        else:
+            kept_windows.add(window)
+    return prune
+
+
+# Blind search index. Title and body are tokenised separately, so renaming a note only rewrites its title tokens
+SEARCH_FIELD_TITLE = 0
+SEARCH_FIELD_CONTENT = 1
+SEARCH_TOKEN_PURPOSE = b"cryptora-search"
+SEARCH_WORD_RE = re.compile(r"\w+")
+MAX_SEARCH_TERMS = 10
+# Notes indexed per login, so enabling the index on an existing vault fills it in gradually
+SEARCH_BACKFILL_BATCH_SIZE = 200
+# Tokens per DELETE .. IN, well under SQLite's bound parameter limit
+SEARCH_DELETE_CHUNK = 1000
+# Plain Core INSERT: token rows are many and tiny, so the ORM bulk path's per-row work dominates
+SEARCH_TOKEN_INSERT = insert(NoteSearchToken.__table__)
+
+
+def search_terms(text: str, prefixes: bool = True) -> Set[str]:
+    """Case-folded words of a text, plus their prefixes down to SEARCH_MIN_PREFIX_LENGTH"""
+    words = {word[:settings.SEARCH_MAX_TERM_LENGTH] for word in SEARCH_WORD_RE.findall(text.casefold())}
+    min_prefix = settings.SEARCH_MIN_PREFIX_LENGTH
+    if not prefixes or min_prefix <= 0:
+        return words
+    terms = set(words)
+    for word in words:
+        terms.update(word[:length] for length in range(min_prefix, len(word)))
+    return terms
+
+
+def blind_tokens(terms: Iterable[str], key: UserKey) -> Set[str]:
+    """Keyed hashes of search terms, truncated to 128 bits"""
+    keyed_hash = CryptoUtils.keyed_hasher(key, SEARCH_TOKEN_PURPOSE)
+    return {keyed_hash(term)[:32] for term in terms}
+
+
+def note_search_tokens(text: Optional[str], key: UserKey) -> Set[str]:
+    """Blind-index tokens of one note field"""
+    return blind_tokens(search_terms(text), key) if text else set()
+
+
+def note_search_texts(note_id: int, title: Optional[str], content: Optional[str]) -> Dict[Tuple[int, int], str]:
+    """Changed fields of a note keyed by (note_id, field); None leaves a field's tokens as they are, "" clears them"""
+    texts = {}
+    if title is not None:
+        texts[(note_id, SEARCH_FIELD_TITLE)] = title
+    if content is not None:
+        texts[(note_id, SEARCH_FIELD_CONTENT)] = content
+    return texts
+
+
+def search_token_rows(user_id: int, note_id: int, field: int, tokens: Iterable[str]) -> List[dict]:
+    return [{"note_id": note_id, "field": field, "token": token, "user_id": user_id} for token in tokens]
+
+
+def search_tokens_query(note_ids: Iterable[int]) -> Select:
+    return select(NoteSearchToken.note_id, NoteSearchToken.field, NoteSearchToken.token).where(NoteSearchToken.note_id.in_(set(note_ids)))
+
+
+def search_index_changes(user_id: int, texts: Dict[Tuple[int, int], str], rows: Iterable[Any], key: UserKey) -> Tuple[List[Delete], List[dict]]:
+    """
+    DELETEs and INSERT parameters that bring each (note_id, field) in texts in line
+    with its new plaintext, given its current token rows. Only tokens that changed
+    are written, so a small edit to a large note touches a handful of rows.
+    """
+    current: Dict[Tuple[int, int], Set[str]] = {}
+    for note_id, field, token in rows:
+        current.setdefault((note_id, field), set()).add(token)
+    deletes, inserts = [], []
+    for (note_id, field), text in texts.items():
+        tokens = note_search_tokens(text, key)
+        existing = current.get((note_id, field), set())
+        removed = sorted(existing - tokens)
+        for start in range(0, len(removed), SEARCH_DELETE_CHUNK):
+            deletes.append(delete(NoteSearchToken).where(NoteSearchToken.note_id == note_id, NoteSearchToken.field == field, NoteSearchToken.token.in_(removed[start:start + SEARCH_DELETE_CHUNK])))
+        inserts.extend(search_token_rows(user_id, note_id, field, tokens - existing))
+    return deletes, inserts
+
+
+def search_query_tokens(query: str, key: UserKey) -> Set[str]:
+    """
+    Tokens for a search query; every word must match a word of the note, or the
+    start of one when it is at least SEARCH_MIN_PREFIX_LENGTH long.
+    Raises ValueError for queries without words or with too many.
+    """
+    terms = search_terms(query, prefixes=False)
+    if not terms:
+        raise ValueError("Query has no searchable words")
+    if len(terms) > MAX_SEARCH_TERMS:
+        raise ValueError(f"Query has more than {MAX_SEARCH_TERMS} words")
+    return blind_tokens(terms, key)
+
+
+def note_search_query(user_id: int, tokens: Set[str], limit: int) -> Select:
+    """Summaries of active notes holding every token (in title or body), newest first"""
+    matches = (
+        select(NoteSearchToken.note_id)
+        .where(NoteSearchToken.user_id == user_id, NoteSearchToken.token.in_(tokens))
+        .group_by(NoteSearchToken.note_id)
+        .having(func.count(distinct(NoteSearchToken.token)) == len(tokens))
+    )
+    return (
+        select(*NOTE_SUMMARY_COLUMNS)
+        .where(Note.id.in_(matches), Note.user_id == user_id, Note.is_active == True)
+        .order_by(Note.created_at.desc(), Note.id.desc())
+        .limit(limit)
+    )
+
+
+def search_backfill_query(user_id: int, limit: int = SEARCH_BACKFILL_BATCH_SIZE) -> Select:
+    """
+    A user's active notes without any index tokens that the backfill hasn't looked at yet.
+    Notes without words or that don't decrypt never get tokens, so search_indexed keeps them from coming back.
+    """
+    indexed = select(NoteSearchToken.note_id).where(NoteSearchToken.note_id == Note.id).exists()
+    return (
+        select(Note.id, Note.encrypted_title, Note.encrypted_content, Note.delta_count)
+        .where(Note.user_id == user_id, Note.is_active == True, Note.search_indexed == False, ~indexed)
+        .order_by(Note.id)
+        .limit(limit)
+    )
+
+
+def search_indexed_statement(note_ids: List[int]) -> Update:
+    """Mark notes as looked at by the backfill; updated_at is kept so their ETags don't change"""
+    return update(Note).where(Note.id.in_(note_ids)).values(search_indexed=True, updated_at=Note.updated_at)
+
+
+def search_backfill_rows(user_id: int, rows: list, deltas: Dict[int, List[bytes]], key: UserKey) -> List[dict]:
+    """Token rows for search_backfill_query notes; notes that fail to decrypt are logged and left out"""
+    inserts = []
+    for row in rows:
+        try:
+            title = CryptoUtils.decrypt_with_key(row.encrypted_title, key) if row.encrypted_title else None
+            content = apply_note_deltas(CryptoUtils.decrypt_with_key(row.encrypted_content, key), deltas.get(row.id, []), key)
+        except Exception:
+            logger.warning("Note %s of user %s could not be decrypted; it is left out of the search index", row.id, user_id)
+            continue
+        inserts.extend(search_token_rows(user_id, row.id, SEARCH_FIELD_TITLE, note_search_tokens(title, key)))
+        inserts.extend(search_token_rows(user_id, row.id, SEARCH_FIELD_CONTENT, note_search_tokens(content, key)))
+    return inserts
+
+
+def share_values(title: Optional[str], content: str, expires_in_seconds: Optional[int]) -> Tuple[str, dict]:
+    """A fresh link token and the shared_notes values snapshotting a note under it"""
+    token = new_share_token()
+    now = datetime.utcnow()
+    return token, dict(
+        share_token=share_token_hash(token),
+        encrypted_title=encrypt_for_share(title, token) if title else None,
+        encrypted_content=encrypt_for_share(content, token),
+        created_at=now,
+        expires_at=now + timedelta(seconds=expires_in_seconds) if expires_in_seconds else None,
+        view_count=0,
+        is_active=True,
+    )
+
+
+def active_share_query(token_hash: str) -> Select:
+    """The live share behind a token hash: not revoked, not expired, and its note not deleted"""
+    return (
+        select(SharedNote)
+        .join(Note, Note.id == SharedNote.note_id)
+        .where(
+            SharedNote.share_token == token_hash,
+            SharedNote.is_active == True,
+            or_(SharedNote.expires_at.is_(None), SharedNote.expires_at > datetime.utcnow()),
+            Note.is_active == True,
+        )
+    )
+
+
+# executemany-able increment; ids are sorted by the caller so concurrent flushes lock rows in the same order
+SHARE_VIEWS_UPDATE = (
+    update(SharedNote.__table__)
+    .where(SharedNote.__table__.c.id == bindparam("share_id"))
+    .values(view_count=SharedNote.__table__.c.view_count + bindparam("views"))
+)
+
+
+def share_view_params(counts: Dict[int, int]) -> List[dict]:
+    return [{"share_id": share_id, "views": counts[share_id]} for share_id in sorted(counts)]
+
+
+def active_user_query(*criteria) -> Select:
+    return select(User).where(*criteria, User.is_active == True)
+
+
+# Users written per UPDATE when flushing buffered last-access times
+LAST_ACCESS_FLUSH_CHUNK = 1000
+
+
+def last_accessed_statements(pending: Dict[int, datetime]) -> List[Update]:
+    """One UPDATE ... SET last_accessed_at = CASE id ... per chunk of users, in id order"""
+    user_ids = sorted(pending)
+    return [
+        update(User).where(User.id.in_(chunk)).values(last_accessed_at=case({user_id: pending[user_id] for user_id in chunk}, value=User.id))
+        for chunk in (user_ids[i:i + LAST_ACCESS_FLUSH_CHUNK] for i in range(0, len(user_ids), LAST_ACCESS_FLUSH_CHUNK))
+    ]
+
+
+# Rows re-encrypted per statement when an account moves to a new key
+REHASH_BATCH_SIZE = 500
+# Keys app.importer's import hashes; moving an account to a new key recomputes them
+IMPORT_HASH_PURPOSE = b"cryptora-import"
+
+
+def rehash_notes_query(user_id: int, after_id: int, limit: int = REHASH_BATCH_SIZE) -> Select:
+    """A batch of a user's notes, deleted ones included, keyset-paginated on id"""
+    return (
+        select(Note.id, Note.encrypted_title, Note.encrypted_content, Note.delta_count, Note.import_hash, Note.is_active)
+        .where(Note.user_id == user_id, Note.id > after_id)
+        .order_by(Note.id)
+        .limit(limit)
+    )
+
+
+def rehash_tables(user_id: int) -> list:
+    """(model, criterion, encrypted columns) of a user's other records a rehash re-encrypts; runs after the notes, which read the old deltas"""
+    note_ids = select(Note.id).where(Note.user_id == user_id)
+    return [
+        (Folder, Folder.user_id == user_id, (Folder.encrypted_name,)),
+        (NoteDelta, NoteDelta.note_id.in_(note_ids), (NoteDelta.encrypted_delta,)),
+        (NoteRevision, NoteRevision.note_id.in_(note_ids), (NoteRevision.encrypted_title, NoteRevision.encrypted_content)),
+    ]
+
+
+def rehash_batch_query(model: Any, criterion: Any, columns: tuple, after_id: int, limit: int = REHASH_BATCH_SIZE) -> Select:
+    return select(model.id, *columns).where(criterion, model.id > after_id).order_by(model.id).limit(limit)
+
+
+def reencrypt_blobs(blobs: tuple, old_key: UserKey, new_key: UserKey) -> tuple:
+    """A row's blobs moved from one of a user's keys to another; blobs that don't decrypt are kept as they are"""
+    moved = []
+    for blob in blobs:
+        try:
+            moved.append(CryptoUtils.encrypt_with_key(CryptoUtils.decrypt_with_key(blob, old_key), new_key) if blob else blob)
+        except:
+            moved.append(blob)
+    return tuple(moved)
+
+
+def rehash_note(item: tuple, old_key: UserKey, new_key: UserKey) -> Tuple[Optional[dict], Optional[Tuple[Set[str], Set[str]]]]:
+    """
+    Bulk UPDATE parameters moving one rehash_notes_query note (plus its encrypted
+    deltas) to new_key, and its (title, content) search tokens under new_key when
+    the index is enabled. content_hash is kept: it names the version, not the key.
+    Import hashes are recomputed from the current text, the only plaintext left.
+    Returns (None, None) for a note that doesn't decrypt.
+    """
+    note_id, encrypted_title, encrypted_content, import_hash, is_active, deltas = item
+    try:
+        title = CryptoUtils.decrypt_with_key(encrypted_title, old_key) if encrypted_title else None
+        base = CryptoUtils.decrypt_with_key(encrypted_content, old_key)
+        content = apply_note_deltas(base, deltas, old_key) if deltas else base
+    except:
+        return None, None
+    values = {
+        "id": note_id,
+        "encrypted_title": CryptoUtils.encrypt_with_key(title, new_key) if encrypted_title else encrypted_title,
+        "encrypted_content": CryptoUtils.encrypt_with_key(base, new_key),
+        "import_hash": CryptoUtils.keyed_hash(f"{title or ''}\x00{content}", new_key, IMPORT_HASH_PURPOSE) if import_hash else import_hash,
+    }
+    # Every token of the user is rebuilt, so the backfill has to look at notes that get none here again
+    values["search_indexed"] = bool(is_active and settings.SEARCH_INDEX_ENABLED)
+    if not values["search_indexed"]:
+        return values, None
+    return values, (note_search_tokens(title, new_key), note_search_tokens(content, new_key))
+
+
+def rehash_notes_batch(user_id: int, rows: list, deltas: Dict[int, List[bytes]], old_key: UserKey, new_key: UserKey) -> Tuple[List[dict], List[dict]]:
+    """Note UPDATE parameters and search token rows moving a rehash_notes_query batch to new_key, across the crypto pool"""
+    items = [(row.id, row.encrypted_title, row.encrypted_content, row.import_hash, row.is_active, deltas.get(row.id, [])) for row in rows]
+    updates, tokens = [], []
+    for row, (values, note_tokens) in zip(rows, map_crypto(rehash_note, items, old_key, new_key)):
+        if values:
+            updates.append(values)
+        if note_tokens:
+            tokens += search_token_rows(user_id, row.id, SEARCH_FIELD_TITLE, note_tokens[0])
+            tokens += search_token_rows(user_id, row.id, SEARCH_FIELD_CONTENT, note_tokens[1])
+    return updates, tokens
+
+
+def reencrypt_rows(rows: list, columns: tuple, old_key: UserKey, new_key: UserKey) -> List[dict]:
+    """UPDATE parameters moving a rehash_batch_query batch to new_key, across the crypto pool"""
+    moved = map_crypto(reencrypt_blobs, [tuple(row)[1:] for row in rows], old_key, new_key)
+    return [{"id": row.id, **{column.key: blob for column, blob in zip(columns, blobs)}} for row, blobs in zip(rows, moved)]
+
+
+def cache_user(user: Optional[User]) -> Optional[CachedUser]:
+    """Snapshot a user row into the user cache (misses aren't cached)"""
+    if user is None:
+        return None
+    cached = CachedUser.from_user(user)
+    user_cache.put(cached)
+    return cached
+
+
+def recache_user(user: CachedUser, **changes) -> CachedUser:
+    """A cached user with columns just written, replacing the cached copy"""
+    user = dataclasses.replace(user, **changes)
+    user_cache.put(user)
+    return user
 
 
 class UserService:
     def __init__(self, db: Session):
         self.db = db
     
-    def get_user_by_alias(self, alias: str) -> Optional[User]:
-        stmt = select(User).where(User.alias == alias.lower(), User.is_active == True)
-        return self.db.scalars(stmt).first()
+    def get_user_by_alias(self, alias: str) -> Optional[CachedUser]:
+        alias = alias.lower()
+        cached = user_cache.get_by_alias(alias)
+        if cached is not None:
+            return cached
+        user = self.db.scalars(active_user_query(User.alias == alias)).first()
+        return cache_user(user)
     
-    def get_user_by_id(self, user_id: int) -> Optional[User]:
-        stmt = select(User).where(User.id == user_id, User.is_active == True)
-        return self.db.scalars(stmt).first()
+    def get_user_by_id(self, user_id: int) -> Optional[CachedUser]:
+        cached = user_cache.get_by_id(user_id)
+        if cached is not None:
+            return cached
+        user = self.db.scalars(active_user_query(User.id == user_id)).first()
+        return cache_user(user)
     
     def create_user(self, user_data: UserCreate) -> User:
-        encrypted_alias = CryptoUtils.encrypt(user_data.alias.lower(), user_data.password)
+        alias = user_data.alias.lower()
+        # Records are encrypted under a random data key; the password-derived key only wraps it
+        wrapping_key = CryptoUtils.user_key(alias, user_data.password, CryptoUtils.new_salt())
+        data_key = CryptoUtils.new_data_key()
         user = User(
-            alias=user_data.alias.lower(),
-            encrypted_alias=encrypted_alias,
+            alias=alias,
+            encrypted_alias=CryptoUtils.encrypt_with_key(alias, CryptoUtils.envelope_key(wrapping_key, data_key)),
+            wrapped_key=CryptoUtils.wrap_key(data_key, wrapping_key),
             created_at=datetime.utcnow(),
             last_accessed_at=datetime.utcnow()
         )
         self.db.add(user)
         self.db.commit()
         self.db.refresh(user)
+        user_cache.invalidate(user.id, user.alias)
         return user
     
-    def verify_password(self, user: User, password: str) -> bool:
+    @staticmethod
+    def unlock(user: CachedUser, password: str) -> Optional[UserKey]:
+        """
+        Return the user's encryption key if the password is correct; unwrapping the data
+        key is the check. Accounts without a data key yet decrypt their alias instead.
+        """
+        sealed = user.wrapped_key or user.encrypted_alias
+        salt, kdf = CryptoUtils.extract_salt(sealed), CryptoUtils.extract_kdf(sealed)
+        key = CryptoUtils.user_key(user.alias, password, salt, kdf)
         try:
-            decrypted = CryptoUtils.decrypt(user.encrypted_alias, password)
-            return decrypted == user.alias
+            if user.wrapped_key:
+                return CryptoUtils.envelope_key(key, CryptoUtils.unwrap_key(user.wrapped_key, key))
+            if CryptoUtils.decrypt_with_key(user.encrypted_alias, key) == user.alias:
+                return key
         except:
-            return False
+            pass
+        # Don't let wrong passwords occupy cache slots
+        key_cache.discard(user.alias, password, salt, kdf)
+        return None
     
-    def update_last_accessed(self, user_id: int) -> None:
-        user = self.get_user_by_id(user_id)
-        if user:
-            user.last_accessed_at = datetime.utcnow()
+    def verify_password(self, user: CachedUser, password: str) -> bool:
+        return self.unlock(user, password) is not None
+    
+    def upgrade_user_key(self, user: CachedUser, key: UserKey) -> Tuple[CachedUser, UserKey]:
+        """
+        Bring an unlocked account up to date at login, the only time the password is at
+        hand: an account without a data key gets one (adopt_data_key, once per account),
+        and a data key wrapped with outdated KDF parameters is rewrapped under the
+        configured KDF. Returns the current user record and the key the session should use.
+        """
+        if not key.envelope:
+            return self.adopt_data_key(user, key)
+        if settings.KDF_REHASH_ON_LOGIN and CryptoUtils.is_outdated(key):
+            return self.rewrap_data_key(user, key, key.password)
+        return user, key
+    
+    def rewrap_data_key(self, user: CachedUser, key: UserKey, password: str, end_sessions: bool = False) -> Tuple[CachedUser, UserKey]:
+        """
+        Wrap the user's data key under password with a fresh salt and the configured KDF;
+        one row, nothing is re-encrypted. end_sessions bumps session_epoch, which
+        invalidates every session token issued before (a password change).
+        """
+        wrapping_key = CryptoUtils.user_key(user.alias, password, CryptoUtils.new_salt())
+        wrapped_key = CryptoUtils.wrap_key(key.key, wrapping_key)
+        values = {"wrapped_key": wrapped_key}
+        if end_sessions:
+            values["session_epoch"] = User.session_epoch + 1
+        session_epoch = self.db.execute(update(User).where(User.id == user.id).values(**values).returning(User.session_epoch)).scalar_one()
+        self.db.commit()
+        return recache_user(user, wrapped_key=wrapped_key, session_epoch=session_epoch), CryptoUtils.envelope_key(wrapping_key, key.key)
+    
+    def adopt_data_key(self, user: CachedUser, key: UserKey) -> Tuple[CachedUser, UserKey]:
+        """
+        Move an account whose records are encrypted under its password-derived key to a
+        random data key: every record is re-encrypted under it (legacy v1 records too, as
+        key carries the password) and the keyed search and import hashes are rebuilt, in
+        one transaction. The cost scales with the vault, but is paid once per account.
+        """
+        # The row lock makes concurrent logins migrate once; the others unlock the stored data key
+        row = self.db.execute(select(User.encrypted_alias, User.wrapped_key).where(User.id == user.id).with_for_update()).one()
+        if row.wrapped_key:
+            self.db.rollback()
+            user = recache_user(user, encrypted_alias=row.encrypted_alias, wrapped_key=row.wrapped_key)
+            return user, self.unlock(user, key.password) or key
+        wrapping_key = CryptoUtils.user_key(user.alias, key.password, CryptoUtils.new_salt())
+        data_key = CryptoUtils.new_data_key()
+        new_key = CryptoUtils.envelope_key(wrapping_key, data_key)
+        try:
+            self._reencrypt_records(user.id, key, new_key)
+            values = {"encrypted_alias": CryptoUtils.encrypt_with_key(user.alias, new_key), "wrapped_key": CryptoUtils.wrap_key(data_key, wrapping_key)}
+            self.db.execute(update(User).where(User.id == user.id).values(**values))
+            self.db.commit()
+        except:
+            self.db.rollback()
+            raise
+        return recache_user(user, **values), new_key
+    
+    def _reencrypt_records(self, user_id: int, old_key: UserKey, new_key: UserKey) -> None:
+        """Re-encrypt a user's notes, deltas, revisions and folder names and rebuild their keyed hashes; doesn't commit"""
+        self.db.execute(delete(NoteSearchToken).where(NoteSearchToken.user_id == user_id))
+        after_id = 0
+        while rows := self.db.execute(rehash_notes_query(user_id, after_id)).all():
+            delta_ids = [row.id for row in rows if row.delta_count]
+            deltas = group_note_deltas(self.db.execute(notes_deltas_query(delta_ids))) if delta_ids else {}
+            updates, tokens = rehash_notes_batch(user_id, rows, deltas, old_key, new_key)
+            if updates:
+                self.db.execute(update(Note), updates)
+            if tokens:
+                self.db.execute(SEARCH_TOKEN_INSERT, tokens)
+            after_id = rows[-1].id
+        for model, criterion, columns in rehash_tables(user_id):
+            after_id = 0
+            while rows := self.db.execute(rehash_batch_query(model, criterion, columns, after_id)).all():
+                self.db.execute(update(model), reencrypt_rows(rows, columns, old_key, new_key))
+                after_id = rows[-1].id
+    
+    @staticmethod
+    def update_last_accessed(user: CachedUser) -> CachedUser:
+        """Buffer the user's last access for the next background flush and keep the cached record current"""
+        user = dataclasses.replace(user, last_accessed_at=datetime.utcnow())
+        last_access.record(user.id, user.last_accessed_at)
+        user_cache.put(user)
+        return user
+    
+    def flush_last_accessed(self, pending: Dict[int, datetime]) -> None:
+        """Write buffered last-access times ({user_id: accessed_at}) in one transaction"""
+        if pending:
+            for stmt in last_accessed_statements(pending):
+                self.db.execute(stmt)
             self.db.commit()
 
 
@@ -58,8 +808,8 @@ class FolderService:
         stmt = select(Folder).where(Folder.user_id == user_id, Folder.is_active == True).order_by(Folder.created_at.asc())
         return list(self.db.scalars(stmt).all())
     
-    def create_folder(self, user_id: int, folder_data: FolderCreate, password: str) -> Folder:
-        encrypted_name = CryptoUtils.encrypt(folder_data.name, password)
+    def create_folder(self, user_id: int, folder_data: FolderCreate, key: UserKey) -> Folder:
+        encrypted_name = CryptoUtils.encrypt_with_key(folder_data.name, key)
         folder = Folder(
             user_id=user_id,
             encrypted_name=encrypted_name,
@@ -72,10 +822,10 @@ class FolderService:
         self.db.refresh(folder)
         return folder
     
-    def update_folder(self, folder_id: int, folder_data: FolderUpdate, password: str) -> Folder:
+    def update_folder(self, folder_id: int, folder_data: FolderUpdate, key: UserKey) -> Folder:
         folder = self.get_folder_by_id(folder_id)
         if folder_data.name is not None:
-            folder.encrypted_name = CryptoUtils.encrypt(folder_data.name, password)
+            folder.encrypted_name = CryptoUtils.encrypt_with_key(folder_data.name, key)
         if folder_data.color is not None:
             folder.color = folder_data.color
         if folder_data.icon is not None:
@@ -84,20 +834,18 @@ class FolderService:
         self.db.refresh(folder)
         return folder
     
-    def delete_folder(self, folder_id: int) -> None:
-        folder = self.get_folder_by_id(folder_id)
-        if folder:
-            # Remove folder reference from notes but don't delete them
-            stmt = select(Note).where(Note.folder_id == folder_id, Note.is_active == True)
-            notes = self.db.scalars(stmt).all()
-            for note in notes:
-                note.folder_id = None
-            folder.is_active = False
-            self.db.commit()
+    def delete_folder(self, folder_id: int, cascade: bool = False) -> None:
+        """
+        Soft-delete a folder with set-based statements in one transaction.
+        Its notes are unfiled, or soft-deleted too when cascade is set.
+        """
+        for stmt in folder_delete_statements(folder_id, cascade):
+            self.db.execute(stmt, execution_options={"synchronize_session": False})
+        self.db.commit()
     
-    def decrypt_folder_name(self, folder: Folder, password: str) -> Optional[str]:
+    def decrypt_folder_name(self, folder: Folder, key: UserKey) -> Optional[str]:
         try:
-            return CryptoUtils.decrypt(folder.encrypted_name, password)
+            return CryptoUtils.decrypt_with_key(folder.encrypted_name, key)
         except:
             return None
 
@@ -114,9 +862,15 @@ class NoteService:
         stmt = select(Note).where(Note.user_id == user_id, Note.is_active == True).order_by(Note.created_at.desc())
         return list(self.db.scalars(stmt).all())
     
-    def create_note(self, user_id: int, note_data: NoteCreate, password: str) -> Note:
-        encrypted_title = CryptoUtils.encrypt(note_data.title, password) if note_data.title else None
-        encrypted_content = CryptoUtils.encrypt(note_data.content, password)
+    def get_user_notes_page(self, user_id: int, limit: Optional[int] = None, cursor: Optional[str] = None, summary: bool = False) -> Tuple[list, Optional[str]]:
+        """Return (notes, next_cursor); summary pages are column rows without encrypted_content"""
+        stmt = user_notes_query(user_id, limit, cursor, summary)
+        rows = list(self.db.execute(stmt).all()) if summary else list(self.db.scalars(stmt).all())
+        return split_note_page(rows, limit)
+    
+    def create_note(self, user_id: int, note_data: NoteCreate, key: UserKey) -> Note:
+        encrypted_title = CryptoUtils.encrypt_with_key(note_data.title, key) if note_data.title else None
+        encrypted_content = CryptoUtils.encrypt_with_key(note_data.content, key)
         content_hash = CryptoUtils.hash_content(encrypted_content)
         note = Note(
             user_id=user_id,
@@ -127,15 +881,18 @@ class NoteService:
             created_at=datetime.utcnow()
         )
         self.db.add(note)
+        self.db.flush()
+        self.update_search_index(user_id, note_search_texts(note.id, note_data.title or "", note_data.content), key)
         self.db.commit()
         self.db.refresh(note)
         return note
     
-    def update_note(self, note_id: int, note_data: NoteUpdate, password: str) -> Note:
+    def update_note(self, note_id: int, note_data: NoteUpdate, key: UserKey) -> Note:
         note = self.get_note_by_id(note_id)
+        self._record_revisions([note_id], [note_id] if note.delta_count else [], key)
         if note_data.title is not None:
-            note.encrypted_title = CryptoUtils.encrypt(note_data.title, password)
-        encrypted_content = CryptoUtils.encrypt(note_data.content, password)
+            note.encrypted_title = CryptoUtils.encrypt_with_key(note_data.title, key)
+        encrypted_content = CryptoUtils.encrypt_with_key(note_data.content, key)
         content_hash = CryptoUtils.hash_content(encrypted_content)
         note.encrypted_content = encrypted_content
         note.content_hash = content_hash
@@ -143,10 +900,121 @@ class NoteService:
         if note_data.folder_id is not None:
             note.folder_id = None if note_data.folder_id == -1 else note_data.folder_id
         note.updated_at = datetime.utcnow()
+        self.update_search_index(note.user_id, note_search_texts(note_id, note_data.title, note_data.content), key)
         self.db.commit()
         self.db.refresh(note)
         return note
     
+    def patch_note(self, note_id: int, user_id: int, patch: NotePatch, key: UserKey) -> Optional[Any]:
+        """Apply a partial update; returns the note summary row, or None if not found / hash conflict"""
+        if patch.content is not None:
+            delta_count = self.db.scalar(select(Note.delta_count).where(Note.id == note_id, Note.user_id == user_id, Note.is_active == True))
+            if delta_count is None:
+                return None
+            self._record_revisions([note_id], [note_id] if delta_count else [], key)
+        row = self.db.execute(note_patch_statement(note_id, user_id, patch, key)).first()
+        if row is None:
+            self.db.rollback()
+            return None
+        self.update_search_index(user_id, note_search_texts(note_id, patch.title, patch.content), key)
+        self.db.commit()
+        return row
+    
+    def save_delta(self, note_id: int, user_id: int, delta: NoteDeltaRequest, key: UserKey) -> Optional[Any]:
+        """
+        Append an encrypted delta to a note's chain; returns the note summary row,
+        or None if not found / hash conflict. Raises ContentTooLarge, before anything
+        is written, if the edits would grow the body past MAX_CONTENT_SIZE. Every
+        NOTE_DELTA_COMPACT_THRESHOLD deltas the chain is folded into a new base in
+        the same transaction.
+        """
+        base = self.db.execute(note_delta_base_query(note_id, user_id)).first()
+        if base is None or base.content_hash != delta.previous_hash:
+            self.db.rollback()
+            return None
+        content = note_content_after_delta(base.encrypted_content, self.db.scalars(note_deltas_query(note_id)).all(), delta.edits, key)
+        stmt, delta_values = note_delta_statements(note_id, user_id, delta, key)
+        row = self.db.execute(stmt).first()
+        if row is None:
+            self.db.rollback()
+            return None
+        self.db.execute(insert(NoteDelta).values(seq=row.delta_count, **delta_values))
+        if row.delta_count >= settings.NOTE_DELTA_COMPACT_THRESHOLD:
+            row = self._compact(note_id, key)
+        self.update_search_index(user_id, {(note_id, SEARCH_FIELD_CONTENT): content}, key)
+        self.db.commit()
+        return row
+    
+    def _compact(self, note_id: int, key: UserKey) -> Any:
+        """Fold the deltas into a new base and record it as a revision checkpoint"""
+        base = self.db.scalar(select(Note.encrypted_content).where(Note.id == note_id))
+        encrypted_content = compact_note_content(base, self.db.scalars(note_deltas_query(note_id)).all(), key)
+        delete_stmt, update_stmt = note_compaction_statements(note_id, encrypted_content)
+        self.db.execute(delete_stmt)
+        row = self.db.execute(update_stmt).first()
+        self.db.execute(record_revisions_statement([note_id]))
+        return row
+    
+    def _record_revisions(self, note_ids: List[int], compact_ids: List[int], key: UserKey) -> None:
+        """Snapshot the current versions of notes whose body is about to be replaced"""
+        for note_id in compact_ids:
+            self._compact(note_id, key)
+        self.db.execute(record_revisions_statement(note_ids))
+    
+    def update_search_index(self, user_id: int, texts: Dict[Tuple[int, int], str], key: UserKey) -> None:
+        """Re-tokenise changed note fields (see note_search_texts) in the current transaction; no-op unless SEARCH_INDEX_ENABLED"""
+        if not settings.SEARCH_INDEX_ENABLED or not texts:
+            return
+        rows = self.db.execute(search_tokens_query(note_id for note_id, _ in texts)).all()
+        deletes, inserts = search_index_changes(user_id, texts, rows, key)
+        for stmt in deletes:
+            self.db.execute(stmt)
+        if inserts:
+            self.db.execute(SEARCH_TOKEN_INSERT, inserts)
+    
+    def index_notes(self, user_id: int, key: UserKey) -> int:
+        """
+        Index up to SEARCH_BACKFILL_BATCH_SIZE of a user's notes that have no tokens yet.
+        Runs at login, the only time the server holds the key. Returns the number of notes looked at.
+        """
+        if not settings.SEARCH_INDEX_ENABLED:
+            return 0
+        rows = self.db.execute(search_backfill_query(user_id)).all()
+        if not rows:
+            return 0
+        delta_ids = [row.id for row in rows if row.delta_count]
+        deltas = group_note_deltas(self.db.execute(notes_deltas_query(delta_ids))) if delta_ids else {}
+        inserts = search_backfill_rows(user_id, rows, deltas, key)
+        if inserts:
+            self.db.execute(SEARCH_TOKEN_INSERT, inserts)
+        self.db.execute(search_indexed_statement([row.id for row in rows]))
+        self.db.commit()
+        return len(rows)
+    
+    def search_notes(self, user_id: int, query: str, key: UserKey, limit: int = 50) -> list:
+        """Summary rows of notes matching every word of query, from the blind index; raises ValueError on a bad query"""
+        return list(self.db.execute(note_search_query(user_id, search_query_tokens(query, key), limit)).all())
+    
+    def apply_batch(self, user_id: int, operations: List[NoteBatchOperation], key: UserKey) -> List[NoteBatchResult]:
+        """Apply a batch of note operations in one transaction using bulk statements"""
+        notes_stmt, folders_stmt = note_batch_queries(user_id, operations)
+        existing = {row.id: row for row in self.db.execute(notes_stmt)} if notes_stmt is not None else {}
+        folder_ids = set(self.db.scalars(folders_stmt)) if folders_stmt is not None else set()
+        plan = NoteBatchPlan(user_id, operations, key, existing, folder_ids)
+        try:
+            if plan.replaced_bodies:
+                self._record_revisions(plan.replaced_bodies, [note_id for note_id in plan.replaced_bodies if existing[note_id].delta_count], key)
+            if plan.updates:
+                self.db.execute(update(Note), plan.updates)
+            if plan.inserts:
+                plan.complete_inserts(self.db.execute(NOTE_BATCH_INSERT, plan.inserts).all())
+            self.update_search_index(user_id, plan.search_texts, key)
+            self.db.commit()
+        except:
+            self.db.rollback()
+            raise
+        return plan.results
+    
     def delete_note(self, note_id: int) -> None:
         note = self.get_note_by_id(note_id)
         if note:
@@ -154,14 +1022,125 @@ class NoteService:
             note.updated_at = datetime.utcnow()
             self.db.commit()
     
-    def decrypt_note_content(self, note: Note, password: str) -> Optional[str]:
+    def decrypt_note_content(self, note: Note, key: UserKey) -> Optional[str]:
         try:
-            return CryptoUtils.decrypt(note.encrypted_content, password)
+            content = CryptoUtils.decrypt_with_key(note.encrypted_content, key)
+            if note.delta_count:
+                content = apply_note_deltas(content, self.db.scalars(note_deltas_query(note.id)).all(), key)
+            return content
         except:
             return None
     
-    def decrypt_note_title(self, note: Note, password: str) -> Optional[str]:
+    def raw_note_content(self, note: Note, key: UserKey) -> bytes:
+        """The body as one self-contained blob; pending deltas are folded in memory, nothing is written"""
+        if not note.delta_count:
+            return note.encrypted_content
+        return compact_note_content(note.encrypted_content, self.db.scalars(note_deltas_query(note.id)).all(), key)
+    
+    def decrypt_note_title(self, note: Note, key: UserKey) -> Optional[str]:
         try:
-            return CryptoUtils.decrypt(note.encrypted_title, password) if note.encrypted_title else None
+            return CryptoUtils.decrypt_with_key(note.encrypted_title, key) if note.encrypted_title else None
         except:
             return None
+
+
+class RevisionService:
+    def __init__(self, db: Session):
+        self.db = db
+    
+    def list_revisions(self, note_id: int, limit: int = 50, cursor: Optional[str] = None) -> Tuple[list, Optional[str]]:
+        """Return (revision summaries, next_cursor); raises ValueError on a bad cursor"""
+        return split_revision_page(list(self.db.execute(note_revisions_query(note_id, limit, cursor)).all()), limit)
+    
+    def get_revision(self, note_id: int, revision_id: int) -> Optional[NoteRevision]:
+        stmt = select(NoteRevision).where(NoteRevision.id == revision_id, NoteRevision.note_id == note_id)
+        return self.db.scalars(stmt).first()
+    
+    @staticmethod
+    def decrypt_revision(revision: NoteRevision, key: UserKey) -> Tuple[Optional[str], Optional[str]]:
+        """(title, content) of a revision"""
+        try:
+            title = CryptoUtils.decrypt_with_key(revision.encrypted_title, key) if revision.encrypted_title else None
+            return title, CryptoUtils.decrypt_with_key(revision.encrypted_content, key)
+        except:
+            return None, None
+    
+    def prune(self, batch_size: int = 200) -> int:
+        """
+        Enforce NOTE_REVISION_RETENTION across all notes, batch_size notes per
+        transaction so no lock is held for long. Returns the number of revisions deleted.
+        """
+        # Only notes with more revisions than the policy could keep need a look
+        min_count = settings.NOTE_REVISION_KEEP_LAST if settings.NOTE_REVISION_RETENTION == "count" else 1
+        deleted, last_note_id = 0, 0
+        while True:
+            note_ids = list(self.db.scalars(
+                select(NoteRevision.note_id)
+                .where(NoteRevision.note_id > last_note_id)
+                .group_by(NoteRevision.note_id)
+                .having(func.count() > min_count)
+                .order_by(NoteRevision.note_id)
+                .limit(batch_size)
+            ))
+            if not note_ids:
+                return deleted
+            last_note_id = note_ids[-1]
+            now = datetime.utcnow()
+            by_note: Dict[int, List[Tuple[int, datetime]]] = {}
+            rows = self.db.execute(
+                select(NoteRevision.note_id, NoteRevision.id, NoteRevision.created_at)
+                .where(NoteRevision.note_id.in_(note_ids))
+                .order_by(NoteRevision.note_id, NoteRevision.id.desc())
+            )
+            for note_id, revision_id, created_at in rows:
+                by_note.setdefault(note_id, []).append((revision_id, created_at))
+            prune_ids = [revision_id for revisions in by_note.values() for revision_id in revisions_to_prune(revisions, now)]
+            if prune_ids:
+                self.db.execute(delete(NoteRevision).where(NoteRevision.id.in_(prune_ids)), execution_options={"synchronize_session": False})
+            self.db.commit()
+            deleted += len(prune_ids)
+
+
+class ShareService:
+    def __init__(self, db: Session):
+        self.db = db
+    
+    def get_share(self, note_id: int) -> Optional[SharedNote]:
+        stmt = select(SharedNote).where(SharedNote.note_id == note_id, SharedNote.is_active == True)
+        return self.db.scalars(stmt).first()
+    
+    def create_share(self, note_id: int, title: Optional[str], content: str, expires_in_seconds: Optional[int] = None) -> Tuple[SharedNote, str, Optional[str]]:
+        """
+        Snapshot a note under a new link token, replacing any earlier link of the note.
+        Returns (share, token, token hash of the replaced link or None).
+        """
+        token, values = share_values(title, content, expires_in_seconds)
+        share = self.db.scalars(select(SharedNote).where(SharedNote.note_id == note_id)).first()
+        replaced = share.share_token if share is not None and share.is_active else None
+        if share is None:
+            share = SharedNote(note_id=note_id, **values)
+            self.db.add(share)
+        else:
+            for name, value in values.items():
+                setattr(share, name, value)
+        self.db.commit()
+        self.db.refresh(share)
+        return share, token, replaced
+    
+    def revoke_share(self, note_id: int) -> Optional[str]:
+        """Deactivate a note's link; returns its token hash, or None if there was none"""
+        share = self.get_share(note_id)
+        if share is None:
+            return None
+        share.is_active = False
+        self.db.commit()
+        return share.share_token
+    
+    def get_active_share(self, token_hash: str) -> Optional[SharedNote]:
+        return self.db.scalars(active_share_query(token_hash)).first()
+    
+    def add_views(self, counts: Dict[int, int]) -> None:
+        """Add batched view counts ({share_id: views}) in one executemany"""
+        if counts:
+            self.db.execute(SHARE_VIEWS_UPDATE, share_view_params(counts))
+            self.db.commit()
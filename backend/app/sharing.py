@@ -0,0 +1,163 @@
+"""
+Public share links.
+
+A share is a snapshot of a note encrypted under a key derived from a random
+link token. The database keeps only the SHA-256 of the token (share_token), so
+the stored snapshot can't be read without the link itself.
+
+The public read path is served from SharedNoteCache, keyed by that hash, and
+views are counted in memory (ShareViewCounter) and written in batches by a
+background job, so a popular link neither decrypts nor locks its row per view.
+"""
+import hashlib
+import hmac
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.config import settings
+from app.crypto import CryptoUtils, UserKey
+from app.schemas import SharedNoteView
+
+SHARE_KEY_PURPOSE = b"cryptora-share"
+
+
+def new_share_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def share_token_hash(token: str) -> str:
+    """What the database stores and the cache is keyed on"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def share_key(token: str, salt: bytes) -> UserKey:
+    return UserKey(user="", salt=salt, key=hmac.new(token.encode("utf-8"), SHARE_KEY_PURPOSE + salt, hashlib.sha256).digest())
+
+
+def encrypt_for_share(plaintext: str, token: str) -> bytes:
+    return CryptoUtils.encrypt_with_key(plaintext, share_key(token, CryptoUtils.new_salt()))
+
+
+def decrypt_shared(blob: bytes, token: str) -> str:
+    return CryptoUtils.decrypt_with_key(blob, share_key(token, CryptoUtils.extract_salt(blob)))
+
+
+@dataclass(frozen=True)
+class CachedShare:
+    share_id: int
+    body: bytes  # Serialized SharedNoteView
+    expires_at: Optional[datetime]
+
+
+def render_share(share, token: str) -> CachedShare:
+    """Decrypt a SharedNote row with its link token into a ready-to-send response body"""
+    view = SharedNoteView(
+        title=decrypt_shared(share.encrypted_title, token) if share.encrypted_title else None,
+        content=decrypt_shared(share.encrypted_content, token),
+        shared_at=share.created_at,
+        expires_at=share.expires_at,
+    )
+    return CachedShare(share_id=share.id, body=view.model_dump_json().encode("utf-8"), expires_at=share.expires_at)
+
+
+class SharedNoteCache:
+    """
+    Bounded cache of rendered shares keyed by token hash.
+    An entry lives for ttl_seconds or until its share expires, whichever comes
+    first. Revoking discards the entry in this process; other workers drop it
+    within ttl_seconds. When full, expired entries go before the least recently used.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl_seconds: float = 60.0):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token_hash: str) -> Optional[CachedShare]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(token_hash)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(token_hash)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[token_hash]
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, token_hash: str, share: CachedShare) -> None:
+        ttl = self.ttl_seconds
+        if share.expires_at is not None:
+            ttl = min(ttl, (share.expires_at - datetime.utcnow()).total_seconds())
+        if ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._entries[token_hash] = (now + ttl, share)
+            self._entries.move_to_end(token_hash)
+            if len(self._entries) > self.max_size:
+                for expired in [key for key, (deadline, _) in self._entries.items() if deadline <= now]:
+                    del self._entries[expired]
+                    self.evictions += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, token_hash: str) -> None:
+        with self._lock:
+            self._entries.pop(token_hash, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class ShareViewCounter:
+    """Per-share view counts accumulated between background flushes"""
+
+    def __init__(self):
+        self._counts: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, share_id: int) -> None:
+        with self._lock:
+            self._counts[share_id] = self._counts.get(share_id, 0) + 1
+
+    def drain(self) -> Dict[int, int]:
+        """Take the pending counts, leaving the counter empty"""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+        return counts
+
+    def restore(self, counts: Dict[int, int]) -> None:
+        """Put back counts whose write failed, so the next flush retries them"""
+        with self._lock:
+            for share_id, views in counts.items():
+                self._counts[share_id] = self._counts.get(share_id, 0) + views
+
+
+share_cache = SharedNoteCache(max_size=settings.SHARE_CACHE_SIZE, ttl_seconds=settings.SHARE_CACHE_TTL_SECONDS)
+share_views = ShareViewCounter()
@@ -0,0 +1,199 @@
+"""
+Read-through cache of active user records.
+
+Nearly every route starts by resolving its user from the alias in the path.
+UserCache keeps immutable CachedUser snapshots, reachable by alias and by id,
+in a bounded per-process LRU with a TTL. An optional UserCacheBackend (e.g.
+Redis) can sit behind it so workers fill from one another; a backend is called
+inline, so it should answer in well under a database round trip.
+
+UserService invalidates an entry whenever it changes the user row. Another
+worker can keep serving its local copy for at most ttl_seconds.
+"""
+import base64
+import json
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+
+from app.config import settings
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """The columns of an active User that the routes read"""
+    id: int
+    alias: str
+    encrypted_alias: bytes
+    created_at: datetime
+    last_accessed_at: datetime
+    wrapped_key: Optional[bytes] = None
+    session_epoch: int = 0
+
+    @classmethod
+    def from_user(cls, user) -> "CachedUser":
+        return cls(id=user.id, alias=user.alias, encrypted_alias=user.encrypted_alias, created_at=user.created_at, last_accessed_at=user.last_accessed_at, wrapped_key=user.wrapped_key, session_epoch=user.session_epoch)
+
+    def to_bytes(self) -> bytes:
+        return json.dumps({
+            "id": self.id,
+            "alias": self.alias,
+            "encrypted_alias": base64.b64encode(self.encrypted_alias).decode("ascii"),
+            "created_at": self.created_at.isoformat(),
+            "last_accessed_at": self.last_accessed_at.isoformat(),
+            "wrapped_key": base64.b64encode(self.wrapped_key).decode("ascii") if self.wrapped_key else None,
+            "session_epoch": self.session_epoch,
+        }, separators=(",", ":")).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CachedUser":
+        record = json.loads(data)
+        return cls(
+            id=record["id"],
+            alias=record["alias"],
+            encrypted_alias=base64.b64decode(record["encrypted_alias"]),
+            created_at=datetime.fromisoformat(record["created_at"]),
+            last_accessed_at=datetime.fromisoformat(record["last_accessed_at"]),
+            wrapped_key=base64.b64decode(record["wrapped_key"]) if record.get("wrapped_key") else None,
+            session_epoch=record.get("session_epoch", 0),
+        )
+
+
+class UserCacheBackend(ABC):
+    """Shared storage behind the per-process cache; implement this for e.g. Redis"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, *keys: str) -> None:
+        ...
+
+
+class UserCache:
+    """
+    Bounded, TTL-evicted cache of CachedUser by alias and by id.
+    Only hits are cached: a miss always goes to the database, so a newly
+    registered alias is visible at once.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl_seconds: float = 30.0, backend: Optional[UserCacheBackend] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        # alias -> (deadline, user); ids map to aliases so both lookups share one entry
+        self._entries: "OrderedDict[str, Tuple[float, CachedUser]]" = OrderedDict()
+        self._aliases: "dict[int, str]" = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _alias_key(alias: str) -> str:
+        return f"user:alias:{alias}"
+
+    @staticmethod
+    def _id_key(user_id: int) -> str:
+        return f"user:id:{user_id}"
+
+    def _get_local(self, alias: str) -> Optional[CachedUser]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(alias)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(alias)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                self._pop(alias)
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def _pop(self, alias: str) -> None:
+        _, user = self._entries.pop(alias)
+        if self._aliases.get(user.id) == alias:
+            del self._aliases[user.id]
+
+    def _put_local(self, user: CachedUser) -> None:
+        with self._lock:
+            if user.alias in self._entries:
+                self._pop(user.alias)
+            self._entries[user.alias] = (time.monotonic() + self.ttl_seconds, user)
+            self._aliases[user.id] = user.alias
+            while len(self._entries) > self.max_size:
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _get_shared(self, key: str) -> Optional[CachedUser]:
+        if self.backend is None:
+            return None
+        data = self.backend.get(key)
+        if data is None:
+            return None
+        user = CachedUser.from_bytes(data)
+        self._put_local(user)
+        return user
+
+    def get_by_alias(self, alias: str) -> Optional[CachedUser]:
+        return self._get_local(alias) or self._get_shared(self._alias_key(alias))
+
+    def get_by_id(self, user_id: int) -> Optional[CachedUser]:
+        with self._lock:
+            alias = self._aliases.get(user_id)
+        if alias is not None:
+            user = self._get_local(alias)
+            if user is not None:
+                return user
+        else:
+            with self._lock:
+                self.misses += 1
+        return self._get_shared(self._id_key(user_id))
+
+    def put(self, user: CachedUser) -> None:
+        self._put_local(user)
+        if self.backend is not None:
+            data = user.to_bytes()
+            self.backend.set(self._alias_key(user.alias), data, self.ttl_seconds)
+            self.backend.set(self._id_key(user.id), data, self.ttl_seconds)
+
+    def invalidate(self, user_id: int, alias: str) -> None:
+        """Drop a user here and in the shared backend, after any change to their row"""
+        with self._lock:
+            if alias in self._entries:
+                self._pop(alias)
+            if user_id in self._aliases:
+                self._pop(self._aliases[user_id])
+        if self.backend is not None:
+            self.backend.delete(self._alias_key(alias), self._id_key(user_id))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._aliases.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "shared_backend": type(self.backend).__name__ if self.backend is not None else None,
+            }
+
+
+user_cache = UserCache(max_size=settings.USER_CACHE_SIZE, ttl_seconds=settings.USER_CACHE_TTL_SECONDS)
@@ -0,0 +1,150 @@
+"""
+API hot-path benchmark.
+
+Drives the FastAPI app in-process (httpx ASGITransport, lifespan included)
+through the requests that dominate real traffic and reports latency and
+throughput per case:
+
+    register          POST /register (one KDF each)
+    login_warm        POST /login with the derived key cached
+    login_cold        POST /login with the key cache cleared first
+    create_note       POST /{alias}/notes
+    update_note       PUT /{alias}/notes/{id}
+    get_note          GET /{alias}/notes/{id} (decrypts the body)
+    list_user         GET /{alias} for a user with --list-notes notes
+    list_user_summary the same with fields=summary
+    folder_delete     DELETE /{alias}/folders/{id} with --folder-notes notes in it
+
+Requests within a case run --concurrency at a time. Runs against a throwaway
+SQLite database unless DATABASE_URL is set (e.g. a local Postgres); aliases
+are unique per run, so a shared database can be reused.
+
+Usage (from backend/):
+    python -m benchmarks.api --output before.json
+    python -m benchmarks.api --ops 500 --concurrency 8 --note-bytes 4000 --output after.json
+    python -m benchmarks.compare before.json after.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import string
+import tempfile
+import time
+from typing import Awaitable, Callable, List
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='cryptora-bench-'), 'api.db')}")
+# The benchmark would otherwise measure 429s
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+
+from app.crypto import key_cache
+from app.main import app
+from benchmarks.results import percentiles, run_metadata, write_results
+
+PASSWORD = "benchmark-password"
+SEED_BATCH_SIZE = 500
+
+
+def note_text(size: int, rng: random.Random) -> str:
+    words = []
+    while sum(len(word) + 1 for word in words) < size:
+        words.append("".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))))
+    return " ".join(words)[:size]
+
+
+async def measure(ops: int, concurrency: int, request: Callable[[int], Awaitable[httpx.Response]], before: Callable[[], None] = None) -> dict:
+    """Run request(0..ops-1), `concurrency` at a time; before() runs untimed ahead of each request"""
+    samples: List[float] = []
+    counter = iter(range(ops))
+
+    async def worker():
+        for i in counter:
+            if before:
+                before()
+            start = time.perf_counter()
+            response = await request(i)
+            samples.append(time.perf_counter() - start)
+            response.raise_for_status()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return percentiles(samples, time.perf_counter() - started)
+
+
+async def login(client: httpx.AsyncClient, alias: str) -> dict:
+    response = await client.post("/login", json={"alias": alias, "password": PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+async def seed_notes(client: httpx.AsyncClient, alias: str, headers: dict, count: int, size: int, rng: random.Random, folder_id: int = None) -> None:
+    for offset in range(0, count, SEED_BATCH_SIZE):
+        operations = [{"op": "create", "title": f"note {offset + i}", "content": note_text(size, rng), "folder_id": folder_id} for i in range(min(SEED_BATCH_SIZE, count - offset))]
+        response = await client.post(f"/{alias}/notes/batch", headers=headers, json={"operations": operations})
+        response.raise_for_status()
+
+
+async def run(ops: int, concurrency: int, note_bytes: int, list_notes: int, folder_notes: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    prefix = f"b{os.getpid()}x{rng.randrange(10**6)}"
+    results = {}
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None) as client:
+            aliases = [f"{prefix}u{i}" for i in range(ops)]
+            results["register"] = await measure(ops, concurrency, lambda i: client.post("/register", json={"alias": aliases[i], "password": PASSWORD}))
+            # Registering left every account's key in the key cache
+            results["login_warm"] = await measure(ops, concurrency, lambda i: client.post("/login", json={"alias": aliases[i], "password": PASSWORD}))
+            results["login_cold"] = await measure(ops, concurrency, lambda i: client.post("/login", json={"alias": aliases[i], "password": PASSWORD}), before=key_cache.clear)
+
+            alias = aliases[0]
+            headers = await login(client, alias)
+            bodies = [note_text(note_bytes, rng) for _ in range(ops)]
+            note_ids: List[int] = [0] * ops
+
+            async def create(i):
+                response = await client.post(f"/{alias}/notes", headers=headers, json={"title": f"note {i}", "content": bodies[i]})
+                note_ids[i] = response.json().get("id", 0)
+                return response
+
+            results["create_note"] = await measure(ops, concurrency, create)
+            results["update_note"] = await measure(ops, concurrency, lambda i: client.put(f"/{alias}/notes/{note_ids[i]}", headers=headers, json={"title": f"note {i}", "content": bodies[-i - 1]}))
+            results["get_note"] = await measure(ops, concurrency, lambda i: client.get(f"/{alias}/notes/{note_ids[i]}", headers=headers))
+
+            list_alias = aliases[1]
+            list_headers = await login(client, list_alias)
+            await seed_notes(client, list_alias, list_headers, list_notes, note_bytes, rng)
+            results["list_user"] = await measure(ops, concurrency, lambda i: client.get(f"/{list_alias}"))
+            results["list_user_summary"] = await measure(ops, concurrency, lambda i: client.get(f"/{list_alias}", params={"fields": "summary"}))
+
+            # One folder per delete, each filled beforehand; only the DELETE is timed
+            folder_alias = aliases[2]
+            folder_headers = await login(client, folder_alias)
+            folder_ids = []
+            for i in range(ops):
+                response = await client.post(f"/{folder_alias}/folders", headers=folder_headers, json={"name": f"folder {i}"})
+                response.raise_for_status()
+                folder_ids.append(response.json()["id"])
+                await seed_notes(client, folder_alias, folder_headers, folder_notes, 200, rng, folder_id=folder_ids[-1])
+            results["folder_delete"] = await measure(ops, concurrency, lambda i: client.delete(f"/{folder_alias}/folders/{folder_ids[i]}", headers=folder_headers))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=200, help="requests per case")
+    parser.add_argument("--concurrency", type=int, default=1, help="requests in flight per case")
+    parser.add_argument("--note-bytes", type=int, default=2000, help="note body size")
+    parser.add_argument("--list-notes", type=int, default=1000, help="notes owned by the list_user account")
+    parser.add_argument("--folder-notes", type=int, default=50, help="notes in each deleted folder")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args()
+    results = asyncio.run(run(args.ops, args.concurrency, args.note_bytes, args.list_notes, args.folder_notes, args.seed))
+    meta = run_metadata(ops=args.ops, concurrency=args.concurrency, note_bytes=args.note_bytes, list_notes=args.list_notes, folder_notes=args.folder_notes, seed=args.seed)
+    write_results("api", meta, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
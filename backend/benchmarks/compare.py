@@ -0,0 +1,69 @@
+"""
+Compare two benchmark result files written with --output.
+
+Prints p50, p99 and throughput for every case in both files with the relative
+change; latency increases and throughput drops beyond --threshold are flagged.
+Differing meta (database, commit, settings) is listed first, since it often
+explains a difference on its own.
+
+Usage (from backend/):
+    python -m benchmarks.compare before.json after.json --threshold 0.1
+"""
+import argparse
+import json
+import sys
+from typing import Optional
+
+METRICS = [("p50_ms", True), ("p99_ms", True), ("ops_per_second", False)]  # (key, lower is better)
+
+
+def change(before: Optional[float], after: Optional[float]) -> Optional[float]:
+    if before in (None, 0) or after is None:
+        return None
+    return (after - before) / before
+
+
+def compare(before: dict, after: dict, threshold: float) -> int:
+    """Print the comparison; returns the number of regressions"""
+    if before.get("benchmark") != after.get("benchmark"):
+        print(f"warning: comparing '{before.get('benchmark')}' with '{after.get('benchmark')}' results")
+    for key in sorted(set(before.get("meta", {})) | set(after.get("meta", {}))):
+        if key != "started_at" and before["meta"].get(key) != after["meta"].get(key):
+            print(f"meta {key}: {before['meta'].get(key)} -> {after['meta'].get(key)}")
+    regressions = 0
+    print(f"{'case':<28}" + "".join(f"{name:>30}" for name, _ in METRICS))
+    for case in before["results"]:
+        if case not in after["results"]:
+            continue
+        cells = []
+        for name, lower_is_better in METRICS:
+            old, new = before["results"][case].get(name), after["results"][case].get(name)
+            delta = change(old, new)
+            if delta is None:
+                cells.append(f"{'-':>30}")
+                continue
+            worse = delta > threshold if lower_is_better else delta < -threshold
+            regressions += worse
+            cell = f"{old} -> {new} ({delta:+.1%})" + (" !" if worse else "  ")
+            cells.append(f"{cell:>30}")
+        print(f"{case:<28}" + "".join(cells))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.1, help="relative change flagged as a regression")
+    args = parser.parse_args()
+    with open(args.before, encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, encoding="utf-8") as f:
+        after = json.load(f)
+    regressions = compare(before, after, args.threshold)
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
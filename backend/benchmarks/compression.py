@@ -0,0 +1,97 @@
+"""
+Compress-then-encrypt benchmark.
+
+Encrypts a corpus of note bodies with each available codec and reports the
+stored bytes and encrypt/decrypt latency. The default corpus is the text
+files of this repository (docs, Python and TypeScript sources); point
+--corpus at a directory of exported notes for numbers closer to production.
+
+Usage (from backend/):
+    python -m benchmarks.compression --min-bytes 512
+    python -m benchmarks.compression --corpus ~/notes --repeat 5
+"""
+import argparse
+import json
+import os
+import pathlib
+import time
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.config import settings
+from app.crypto import CryptoUtils, UserKey, COMPRESSION_CODECS, zstandard
+
+TEXT_SUFFIXES = {".md", ".txt", ".py", ".ts", ".tsx", ".css", ".json"}
+DEFAULT_CORPUS = pathlib.Path(__file__).resolve().parents[2]
+
+
+def load_corpus(root: pathlib.Path, max_bytes: int) -> list:
+    notes = []
+    for path in sorted(root.rglob("*")):
+        if path.suffix not in TEXT_SUFFIXES or not path.is_file() or any(part in ("node_modules", ".git", "dist") for part in path.parts):
+            continue
+        text = path.read_text(encoding="utf-8", errors="ignore")
+        if text.strip() and len(text.encode("utf-8")) <= max_bytes:
+            notes.append(text)
+    return notes
+
+
+def percentile_us(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e6, 1)
+
+
+def bench_codec(notes: list, key: UserKey, codec: int, repeat: int) -> dict:
+    encrypt_times, decrypt_times, stored = [], [], 0
+    for _ in range(repeat):
+        stored = 0
+        for text in notes:
+            start = time.perf_counter()
+            blob = CryptoUtils.encrypt_with_key(text, key, codec)
+            encrypt_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            CryptoUtils.decrypt_with_key(blob, key)
+            decrypt_times.append(time.perf_counter() - start)
+            stored += len(blob)
+    return {
+        "stored_bytes": stored,
+        "encrypt_p50_us": percentile_us(encrypt_times, 0.50),
+        "encrypt_p99_us": percentile_us(encrypt_times, 0.99),
+        "decrypt_p50_us": percentile_us(decrypt_times, 0.50),
+        "decrypt_p99_us": percentile_us(decrypt_times, 0.99),
+    }
+
+
+def run(notes: list, repeat: int) -> dict:
+    key = UserKey(user="bench", salt=CryptoUtils.new_salt(), key=os.urandom(32))
+    plaintext = sum(len(text.encode("utf-8")) for text in notes)
+    results = {}
+    for name, codec in COMPRESSION_CODECS.items():
+        if name == "zstd" and zstandard is None:
+            continue
+        results[name] = bench_codec(notes, key, codec, repeat)
+        results[name]["ratio"] = round(results[name]["stored_bytes"] / plaintext, 3)
+    return {
+        "notes": len(notes),
+        "plaintext_bytes": plaintext,
+        "min_bytes": settings.COMPRESSION_MIN_BYTES,
+        "codecs": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", type=pathlib.Path, default=DEFAULT_CORPUS, help="directory of text files, one note per file")
+    parser.add_argument("--min-bytes", type=int, default=settings.COMPRESSION_MIN_BYTES, help="compression threshold")
+    parser.add_argument("--max-note-bytes", type=int, default=settings.MAX_CONTENT_SIZE)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    settings.COMPRESSION_MIN_BYTES = args.min_bytes
+    notes = load_corpus(args.corpus, args.max_note_bytes)
+    if not notes:
+        parser.error(f"no text files found under {args.corpus}")
+    print(json.dumps(run(notes, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+CryptoUtils micro-benchmarks.
+
+Times the primitives behind every request, with no HTTP or database in the way:
+
+    derive_key                 the configured password KDF on the crypto pool (a key cache miss)
+    user_key_cached            the same lookup served by the key cache
+    unwrap_key                 unwrapping a data key (a login, after the KDF)
+    encrypt_with_key/<size>    compress-then-encrypt under a data key
+    decrypt_with_key/<size>    the reverse
+    encrypt/<size>             password API (cached KDF + encrypt)
+    decrypt/<size>             password API (cached KDF + decrypt)
+
+Payloads are word-like text (compressible, like notes) unless --random is
+given, which measures incompressible data instead.
+
+Usage (from backend/):
+    python -m benchmarks.crypto --output crypto.json
+    python -m benchmarks.crypto --sizes 100 10000 1000000 --iterations 50 --random
+"""
+import argparse
+import os
+import random
+import string
+import time
+from typing import Callable, List
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from app.concurrency import shutdown_crypto_executor
+from app.crypto import CryptoUtils, key_cache
+from benchmarks.results import percentiles, run_metadata, write_results
+
+DEFAULT_SIZES = [100, 1_000, 10_000, 100_000, 1_000_000]
+
+
+def payload(size: int, incompressible: bool, rng: random.Random) -> str:
+    if incompressible:
+        return "".join(rng.choices(string.ascii_letters + string.digits + string.punctuation, k=size))
+    words = " ".join("".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(size // 4 + 1))
+    return words[:size]
+
+
+def bench(iterations: int, fn: Callable[[], object], warmup: int = 3) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples: List[float] = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples, time.perf_counter() - started)
+
+
+def run(sizes: List[int], iterations: int, kdf_iterations: int, incompressible: bool, seed: int) -> dict:
+    rng = random.Random(seed)
+    password, salt = "benchmark-password", CryptoUtils.new_salt()
+    results = {"derive_key": bench(kdf_iterations, lambda: CryptoUtils.derive_key(password, salt), warmup=1)}
+    key_cache.clear()
+    wrapping_key = CryptoUtils.user_key("bench", password, salt)
+    results["user_key_cached"] = bench(iterations, lambda: CryptoUtils.user_key("bench", password, salt))
+    data_key = CryptoUtils.new_data_key()
+    wrapped_key = CryptoUtils.wrap_key(data_key, wrapping_key)
+    results["unwrap_key"] = bench(iterations, lambda: CryptoUtils.unwrap_key(wrapped_key, wrapping_key))
+    key = CryptoUtils.envelope_key(wrapping_key, data_key)
+    for size in sizes:
+        text = payload(size, incompressible, rng)
+        blob = CryptoUtils.encrypt_with_key(text, key)
+        password_blob = CryptoUtils.encrypt(text, password, "bench")
+        results[f"encrypt_with_key/{size}"] = {**bench(iterations, lambda: CryptoUtils.encrypt_with_key(text, key)), "stored_bytes": len(blob)}
+        results[f"decrypt_with_key/{size}"] = bench(iterations, lambda: CryptoUtils.decrypt_with_key(blob, key))
+        results[f"encrypt/{size}"] = bench(iterations, lambda: CryptoUtils.encrypt(text, password, "bench"))
+        results[f"decrypt/{size}"] = bench(iterations, lambda: CryptoUtils.decrypt(password_blob, password, "bench"))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="payload sizes in bytes")
+    parser.add_argument("--iterations", type=int, default=200, help="timed calls per cipher case")
+    parser.add_argument("--kdf-iterations", type=int, default=20, help="timed derive_key calls")
+    parser.add_argument("--random", action="store_true", help="incompressible payloads")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args()
+    try:
+        results = run(args.sizes, args.iterations, args.kdf_iterations, args.random, args.seed)
+    finally:
+        shutdown_crypto_executor()
+    meta = run_metadata(sizes=args.sizes, iterations=args.iterations, kdf_iterations=args.kdf_iterations, payload="random" if args.random else "text", seed=args.seed)
+    write_results("crypto", meta, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Concurrent-login load test.
+
+Fires bursts of concurrent /login requests at the app in-process while a probe
+keeps hitting the cheap root endpoint. If blocking work runs on the event loop,
+probe latency tracks login latency; with the thread/crypto pools it stays flat.
+
+Usage (from backend/):
+    python -m benchmarks.login_load --concurrency 32 --rounds 10
+
+Runs against a throwaway SQLite database unless DATABASE_URL is set.
+Requires httpx.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+if "DATABASE_URL" not in os.environ:
+    os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/login_load.db"
+
+import httpx
+
+from app.main import app
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 2)
+
+    return {"n": len(ordered), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "mean_ms": round(statistics.fmean(ordered) * 1000, 2)}
+
+
+async def timed(client, method, url, **kwargs):
+    start = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def run(concurrency: int, rounds: int, users: int, probe_interval: float) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            aliases = [f"loaduser{i}" for i in range(users)]
+            for alias in aliases:
+                await client.post("/register", json={"alias": alias, "password": "load-test-pw"})
+
+            login_times, probe_times = [], []
+            done = asyncio.Event()
+
+            async def probe():
+                # Latency counts from when the probe was due, so time spent waiting
+                # for a stalled event loop shows up instead of being skipped over
+                while not done.is_set():
+                    due = time.perf_counter() + probe_interval
+                    await asyncio.sleep(probe_interval)
+                    await timed(client, "GET", "/")
+                    probe_times.append(time.perf_counter() - due)
+
+            probe_task = asyncio.create_task(probe())
+            started = time.perf_counter()
+            for _ in range(rounds):
+                burst = [
+                    timed(client, "POST", "/login", json={"alias": aliases[i % users], "password": "load-test-pw"})
+                    for i in range(concurrency)
+                ]
+                login_times.extend(await asyncio.gather(*burst))
+            elapsed = time.perf_counter() - started
+            done.set()
+            await probe_task
+
+    return {
+        "concurrency": concurrency,
+        "rounds": rounds,
+        "users": users,
+        "logins_per_second": round(len(login_times) / elapsed, 1),
+        "login": percentiles(login_times),
+        "probe": percentiles(probe_times),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--users", type=int, default=8, help="distinct accounts to spread logins across")
+    parser.add_argument("--probe-interval", type=float, default=0.005, help="seconds between probe requests")
+    args = parser.parse_args()
+    result = asyncio.run(run(args.concurrency, args.rounds, args.users, args.probe_interval))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
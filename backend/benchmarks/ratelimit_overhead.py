@@ -0,0 +1,75 @@
+"""
+Rate limiter overhead benchmark.
+
+Measures the cost of a token-bucket decision in InMemoryTokenBucketStore and
+the per-request overhead RateLimitMiddleware adds in front of a no-op ASGI app.
+
+Usage (from backend/):
+    python -m benchmarks.ratelimit_overhead --requests 200000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from app.ratelimit import InMemoryTokenBucketStore, RateLimitMiddleware
+
+
+async def noop_app(scope, receive, send):
+    pass
+
+
+async def noop_receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def noop_send(message):
+    pass
+
+
+def bench_store(n: int, keys: int) -> float:
+    store = InMemoryTokenBucketStore()
+    names = [f"ip:10.0.{i // 256}.{i % 256}" for i in range(keys)]
+    start = time.perf_counter()
+    for i in range(n):
+        store.consume_sync(names[i % keys], 1.0, 1e12, 1e12)
+    return (time.perf_counter() - start) / n
+
+
+async def bench_app(app, n: int, keys: int) -> float:
+    scopes = [
+        {"type": "http", "method": "GET", "path": f"/user{i}/notes/1", "client": (f"10.0.{i // 256}.{i % 256}", 5000)}
+        for i in range(keys)
+    ]
+    start = time.perf_counter()
+    for i in range(n):
+        await app(scopes[i % keys], noop_receive, noop_send)
+    return (time.perf_counter() - start) / n
+
+
+async def run(n: int, keys: int) -> dict:
+    # A huge budget so every request is allowed and we time the fast path
+    middleware = RateLimitMiddleware(noop_app, store=InMemoryTokenBucketStore(), per_minute=10**12)
+    await bench_app(middleware, min(n, 10_000), keys)  # warm up
+    bare = await bench_app(noop_app, n, keys)
+    limited = await bench_app(middleware, n, keys)
+    return {
+        "requests": n,
+        "distinct_clients": keys,
+        "store_consume_us": round(bench_store(n, keys) * 1e6, 3),
+        "bare_app_us": round(bare * 1e6, 3),
+        "with_middleware_us": round(limited * 1e6, 3),
+        "middleware_overhead_us": round((limited - bare) * 1e6, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--clients", type=int, default=1000, help="distinct IP/alias pairs")
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.requests, args.clients)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Shared result format for the benchmark suite (benchmarks.api, benchmarks.crypto,
+benchmarks.workload).
+
+A result file is JSON: {"benchmark", "meta", "results"}, where meta records
+what the numbers depend on (commit, Python, database, KDF and compression
+settings) and results maps a case name to its timings. Compare two files with:
+
+    python -m benchmarks.compare before.json after.json
+"""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+
+def percentiles(samples: List[float], elapsed: Optional[float] = None) -> Dict[str, float]:
+    """Latency summary in ms; with elapsed (wall seconds for all samples) also ops/s"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {"n": 0}
+
+    def pick(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e3, 3)
+
+    summary = {"n": len(ordered), "p50_ms": pick(0.50), "p99_ms": pick(0.99), "mean_ms": round(statistics.fmean(ordered) * 1e3, 3)}
+    if elapsed:
+        summary["ops_per_second"] = round(len(ordered) / elapsed, 1)
+    return summary
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True, cwd=os.path.dirname(__file__)).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_metadata(**extra) -> dict:
+    from app.config import settings
+    from app.crypto import CURRENT_KDF
+    from sqlalchemy.engine import make_url
+    return {
+        "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "database": make_url(settings.DATABASE_URL).get_backend_name(),
+        "database_async": settings.DATABASE_ASYNC,
+        "crypto_pool": settings.CRYPTO_POOL_KIND,
+        "kdf": str(CURRENT_KDF),
+        "compression": settings.COMPRESSION_ALGORITHM,
+        **extra,
+    }
+
+
+def write_results(benchmark: str, meta: dict, results: dict, output: Optional[str]) -> None:
+    """Print the result document, and save it to `output` when given"""
+    document = {"benchmark": benchmark, "meta": meta, "results": results}
+    text = json.dumps(document, indent=2)
+    print(text)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
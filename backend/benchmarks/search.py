@@ -0,0 +1,133 @@
+"""
+Blind-index search benchmark.
+
+Builds a synthetic vault (Zipf-distributed words, like natural text) in a
+throwaway SQLite database, or in DATABASE_URL when it is set, with the search
+index enabled. It then compares the latency of a search through
+note_search_tokens against the scan it replaces, which decrypts every note and
+matches the words in Python.
+
+Usage (from backend/):
+    python -m benchmarks.search                      # 100k notes
+    python -m benchmarks.search --notes 20000 --words 50 --queries 200
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import string
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='cryptora-bench-'), 'search.db')}")
+
+from sqlalchemy import insert, select
+
+from app.config import settings
+from app.crypto import CryptoUtils
+from app.database import Base, SessionLocal, engine
+from app.models import Note
+from app.schemas import UserCreate
+from app.services import (
+    NoteService, UserService, SEARCH_FIELD_CONTENT, SEARCH_FIELD_TITLE, SEARCH_TOKEN_INSERT, note_search_tokens, search_terms, search_token_rows
+)
+
+INSERT_BATCH_SIZE = 2000
+
+
+def make_vocabulary(size: int, rng: random.Random) -> list:
+    return ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) for _ in range(size)]
+
+
+def zipf_cum_weights(size: int) -> list:
+    return list(itertools.accumulate(1 / rank for rank in range(1, size + 1)))
+
+
+def percentile_ms(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1e3, 2)
+
+
+def build_vault(db, user_id: int, key, notes: int, words: int, vocabulary: list, rng: random.Random) -> dict:
+    weights = zipf_cum_weights(len(vocabulary))
+    token_rows = 0
+    start = time.perf_counter()
+    for offset in range(0, notes, INSERT_BATCH_SIZE):
+        count = min(INSERT_BATCH_SIZE, notes - offset)
+        texts = [(" ".join(rng.choices(vocabulary, cum_weights=weights, k=3)), " ".join(rng.choices(vocabulary, cum_weights=weights, k=words))) for _ in range(count)]
+        rows = []
+        for title, content in texts:
+            encrypted_content = CryptoUtils.encrypt_with_key(content, key)
+            rows.append({"user_id": user_id, "encrypted_title": CryptoUtils.encrypt_with_key(title, key), "encrypted_content": encrypted_content, "content_hash": CryptoUtils.hash_content(encrypted_content)})
+        ids = db.scalars(insert(Note).returning(Note.id, sort_by_parameter_order=True), rows).all()
+        tokens = []
+        for note_id, (title, content) in zip(ids, texts):
+            tokens += search_token_rows(user_id, note_id, SEARCH_FIELD_TITLE, note_search_tokens(title, key))
+            tokens += search_token_rows(user_id, note_id, SEARCH_FIELD_CONTENT, note_search_tokens(content, key))
+        db.execute(SEARCH_TOKEN_INSERT, tokens)
+        db.commit()
+        token_rows += len(tokens)
+    return {"build_seconds": round(time.perf_counter() - start, 1), "token_rows": token_rows, "tokens_per_note": round(token_rows / notes, 1)}
+
+
+def scan_search(db, user_id: int, query: str, key) -> list:
+    """The pre-index approach: decrypt every note and match words in Python"""
+    terms = search_terms(query, prefixes=False)
+    matches = []
+    for note_id, encrypted_title, encrypted_content in db.execute(select(Note.id, Note.encrypted_title, Note.encrypted_content).where(Note.user_id == user_id, Note.is_active == True)):
+        words = search_terms(CryptoUtils.decrypt_with_key(encrypted_title, key) + " " + CryptoUtils.decrypt_with_key(encrypted_content, key))
+        if terms <= words:
+            matches.append(note_id)
+    return matches
+
+
+def run(notes: int, words: int, vocabulary_size: int, queries: int, scan_queries: int, seed: int) -> dict:
+    settings.SEARCH_INDEX_ENABLED = True
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(vocabulary_size, rng)
+    with SessionLocal() as db:
+        user_service = UserService(db)
+        alias = f"bench{rng.randrange(10**9)}"
+        user = user_service.create_user(UserCreate(alias=alias, password="benchmark"))
+        key = user_service.unlock(user, "benchmark")
+        build = build_vault(db, user.id, key, notes, words, vocabulary, rng)
+        note_service = NoteService(db)
+        # One- and two-word queries over frequent and rare words, some as prefixes
+        samples = [" ".join(rng.choice(vocabulary)[:rng.choice([3, 10])] for _ in range(rng.randint(1, 2))) for _ in range(queries)]
+        index_times, hits = [], []
+        for query in samples:
+            start = time.perf_counter()
+            hits.append(len(note_service.search_notes(user.id, query, key, limit=500)))
+            index_times.append(time.perf_counter() - start)
+        scan_times = []
+        for query in samples[:scan_queries]:
+            start = time.perf_counter()
+            scan_search(db, user.id, query, key)
+            scan_times.append(time.perf_counter() - start)
+    return {
+        "notes": notes,
+        "words_per_note": words,
+        "vocabulary": vocabulary_size,
+        "database": engine.url.get_backend_name(),
+        "index": build,
+        "index_search": {"queries": len(index_times), "p50_ms": percentile_ms(index_times, 0.50), "p99_ms": percentile_ms(index_times, 0.99), "mean_hits": round(sum(hits) / len(hits), 1)},
+        "scan_search": {"queries": len(scan_times), "p50_ms": percentile_ms(scan_times, 0.50), "max_ms": percentile_ms(scan_times, 1.0)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notes", type=int, default=100_000)
+    parser.add_argument("--words", type=int, default=30, help="words per note body")
+    parser.add_argument("--vocabulary", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=500, help="searches through the index")
+    parser.add_argument("--scan-queries", type=int, default=3, help="searches by decrypting every note (slow)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    print(json.dumps(run(args.notes, args.words, args.vocabulary, args.queries, args.scan_queries, args.seed), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""
+Large-vault data generator.
+
+Writes users, folders and notes straight through the models with bulk inserts,
+encrypting on the crypto pool (map_crypto, so CRYPTO_POOL_KIND=process runs it
+on every core). The records are exactly what the API would have written: each
+user can log in with --password, and their notes decrypt, paginate, search (if
+SEARCH_INDEX_ENABLED) and export like any other.
+
+Plaintext is deterministic for a given --seed: note bodies are Zipf-distributed
+words with log-normal lengths around --note-bytes, and timestamps spread over the
+past year. Ciphertext differs between runs, since every record gets a fresh nonce.
+
+Usage (from backend/):
+    python -m benchmarks.seed --users 1 --notes 50000 --folders 300
+    DATABASE_URL=postgresql://... python -m benchmarks.seed --users 20 --notes 5000 --prefix load
+
+Runs against a throwaway SQLite database unless DATABASE_URL is set.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='cryptora-seed-'), 'seed.db')}")
+
+from sqlalchemy import insert
+
+from app.concurrency import map_crypto, shutdown_crypto_executor
+from app.config import settings
+from app.crypto import CryptoUtils, UserKey
+from app.database import Base, SessionLocal, engine
+from app.models import Folder, Note, User
+from app.services import SEARCH_FIELD_CONTENT, SEARCH_FIELD_TITLE, SEARCH_TOKEN_INSERT, note_search_tokens, search_token_rows
+from benchmarks.search import make_vocabulary, zipf_cum_weights
+
+FOLDER_COLORS = ["default", "red", "orange", "yellow", "green", "blue", "purple"]
+FOLDER_ICONS = ["folder", "book", "star", "briefcase", "home", "code"]
+UNFILED_SHARE = 0.2  # Notes left outside any folder
+HISTORY_DAYS = 365
+DEFAULT_BATCH_SIZE = 2000
+
+
+class TextGenerator:
+    """Deterministic Zipf-distributed word text"""
+
+    def __init__(self, rng: random.Random, vocabulary_size: int = 20_000):
+        self.rng = rng
+        self.vocabulary = make_vocabulary(vocabulary_size, rng)
+        self.weights = zipf_cum_weights(vocabulary_size)
+
+    def words(self, count: int) -> str:
+        return " ".join(self.rng.choices(self.vocabulary, cum_weights=self.weights, k=count))
+
+    def body(self, median_bytes: int) -> str:
+        size = min(settings.MAX_CONTENT_SIZE, max(20, int(self.rng.lognormvariate(math.log(median_bytes), 0.9))))
+        # Paragraphs of a few sentences, roughly six bytes per word
+        paragraphs, length = [], 0
+        while length < size:
+            paragraph = ". ".join(self.words(self.rng.randint(6, 16)).capitalize() for _ in range(self.rng.randint(2, 6))) + "."
+            paragraphs.append(paragraph)
+            length += len(paragraph) + 2
+        return "\n\n".join(paragraphs)[:size]
+
+
+def encrypt_note(spec: dict, key: UserKey) -> dict:
+    """Encrypted notes row (plus search tokens when enabled) for one note spec; runs on the crypto pool"""
+    encrypted_content = CryptoUtils.encrypt_with_key(spec["content"], key)
+    row = {
+        "user_id": spec["user_id"],
+        "folder_id": spec["folder_id"],
+        "encrypted_title": CryptoUtils.encrypt_with_key(spec["title"], key),
+        "encrypted_content": encrypted_content,
+        "content_hash": CryptoUtils.hash_content(encrypted_content),
+        "created_at": spec["created_at"],
+        "updated_at": spec["updated_at"],
+    }
+    if spec["search"]:
+        row["search_tokens"] = (note_search_tokens(spec["title"], key), note_search_tokens(spec["content"], key))
+    return row
+
+
+def seed_user(db, alias: str, password: str, folders: int, notes: int, note_bytes: int, batch_size: int, text: TextGenerator, rng: random.Random) -> dict:
+    wrapping_key = CryptoUtils.user_key(alias, password, rng.randbytes(16))
+    data_key = CryptoUtils.new_data_key()
+    key = CryptoUtils.envelope_key(wrapping_key, data_key)
+    now = datetime.utcnow()
+    created_at = now - timedelta(days=HISTORY_DAYS)
+    user_id = db.scalar(insert(User).returning(User.id), [{"alias": alias, "encrypted_alias": CryptoUtils.encrypt_with_key(alias, key), "wrapped_key": CryptoUtils.wrap_key(data_key, wrapping_key), "created_at": created_at, "last_accessed_at": now}])
+    folder_names = [text.words(rng.randint(1, 3)).title() for _ in range(folders)]
+    folder_rows = [{"user_id": user_id, "encrypted_name": blob, "color": rng.choice(FOLDER_COLORS), "icon": rng.choice(FOLDER_ICONS), "created_at": created_at} for blob in map_crypto(CryptoUtils.encrypt_with_key, folder_names, key)]
+    folder_ids = list(db.scalars(insert(Folder).returning(Folder.id, sort_by_parameter_order=True), folder_rows)) if folder_rows else []
+    search = settings.SEARCH_INDEX_ENABLED
+    token_rows = 0
+    for offset in range(0, notes, batch_size):
+        specs = []
+        for _ in range(min(batch_size, notes - offset)):
+            created = created_at + timedelta(seconds=rng.uniform(0, HISTORY_DAYS * 86400))
+            specs.append({
+                "user_id": user_id,
+                "folder_id": rng.choice(folder_ids) if folder_ids and rng.random() >= UNFILED_SHARE else None,
+                "title": text.words(rng.randint(2, 7)).capitalize(),
+                "content": text.body(note_bytes),
+                "created_at": created,
+                "updated_at": created + timedelta(seconds=rng.expovariate(1 / 86400)),
+                "search": search,
+            })
+        rows = map_crypto(encrypt_note, specs, key)
+        if search:
+            tokens = [row.pop("search_tokens") for row in rows]
+            note_ids = db.scalars(insert(Note).returning(Note.id, sort_by_parameter_order=True), rows).all()
+            index = []
+            for note_id, (title_tokens, content_tokens) in zip(note_ids, tokens):
+                index += search_token_rows(user_id, note_id, SEARCH_FIELD_TITLE, title_tokens)
+                index += search_token_rows(user_id, note_id, SEARCH_FIELD_CONTENT, content_tokens)
+            if index:
+                db.execute(SEARCH_TOKEN_INSERT, index)
+            token_rows += len(index)
+        else:
+            db.execute(insert(Note), rows)
+        db.commit()
+    return {"alias": alias, "user_id": user_id, "folders": len(folder_ids), "notes": notes, "search_token_rows": token_rows}
+
+
+def run(users: int, notes: int, folders: int, note_bytes: int, password: str, prefix: Optional[str], seed: int, batch_size: int) -> dict:
+    Base.metadata.create_all(bind=engine)
+    rng = random.Random(seed)
+    text = TextGenerator(rng)
+    prefix = prefix or f"seed{seed}"
+    start = time.perf_counter()
+    seeded: List[dict] = []
+    with SessionLocal() as db:
+        for i in range(users):
+            seeded.append(seed_user(db, f"{prefix}-{i}", password, folders, notes, note_bytes, batch_size, text, rng))
+    elapsed = time.perf_counter() - start
+    return {
+        "database": engine.url.render_as_string(hide_password=True),
+        "password": password,
+        "users": seeded,
+        "seconds": round(elapsed, 1),
+        "notes_per_second": round(users * notes / elapsed, 1) if elapsed else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1)
+    parser.add_argument("--notes", type=int, default=50_000, help="notes per user")
+    parser.add_argument("--folders", type=int, default=300, help="folders per user")
+    parser.add_argument("--note-bytes", type=int, default=1500, help="median note body size")
+    parser.add_argument("--password", default="seed-password")
+    parser.add_argument("--prefix", help="alias prefix (default seed<seed>); aliases are <prefix>-<n>")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="notes encrypted and inserted per transaction")
+    args = parser.parse_args()
+    try:
+        result = run(args.users, args.notes, args.folders, args.note_bytes, args.password, args.prefix, args.seed, args.batch_size)
+    finally:
+        shutdown_crypto_executor()
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
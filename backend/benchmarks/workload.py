@@ -0,0 +1,223 @@
+"""
+Mixed-workload load test against large vaults.
+
+Virtual users log in to seeded accounts and, for --duration seconds, repeatedly
+pick one of three scenarios (weights from --mix):
+
+    browse     sidebar paging: summary pages of GET /{alias} (revalidating the
+               first one with If-None-Match), then a folder and a note
+    autosave   open a note, then a burst of chained POST .../delta saves
+    move       PATCH a note into another folder, or a batch move of a page
+
+Every request is timed under its action name (browse_page, get_folder,
+get_note, autosave_delta, move_note, move_batch, ...) and reported with
+latency percentiles, throughput, errors and 409 conflicts.
+
+Without --alias the test seeds its own vault first (benchmarks.seed, into the
+throwaway SQLite database or DATABASE_URL); with --alias it runs against
+accounts seeded earlier, e.g. into a local Postgres:
+
+Usage (from backend/):
+    python -m benchmarks.workload --notes 20000 --folders 200 --duration 30 --output load.json
+    DATABASE_URL=postgresql://... python -m benchmarks.seed --users 4 --notes 50000 --prefix load
+    DATABASE_URL=postgresql://... python -m benchmarks.workload --alias load-0 load-1 load-2 load-3 --password seed-password --vusers 16
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='cryptora-load-'), 'load.db')}")
+# The load test would otherwise measure 429s
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+
+import httpx
+
+from app.main import app
+from benchmarks import seed
+from benchmarks.results import percentiles, run_metadata, write_results
+
+DEFAULT_MIX = "browse=70,autosave=20,move=10"
+PAGE_SIZE = 50
+MAX_BROWSE_PAGES = 3
+MOVE_BATCH_SIZE = 20
+
+
+def parse_mix(mix: str) -> Dict[str, int]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"unknown scenario '{name.strip()}' (expected {', '.join(SCENARIOS)})")
+        weights[name.strip()] = int(weight)
+    return weights
+
+
+class Recorder:
+    """Per-action samples, errors and conflicts, shared by all virtual users"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.conflicts: Dict[str, int] = defaultdict(int)
+
+    async def request(self, action: str, send) -> Optional[httpx.Response]:
+        """Time one request; returns the response, or None when it failed"""
+        start = time.perf_counter()
+        response = await send
+        self.samples[action].append(time.perf_counter() - start)
+        if response.status_code == 409:
+            self.conflicts[action] += 1
+            return None
+        if response.status_code >= 400:
+            self.errors[action] += 1
+            return None
+        return response
+
+    def summary(self, elapsed: float) -> dict:
+        return {
+            action: {**percentiles(samples, elapsed), "errors": self.errors[action], "conflicts": self.conflicts[action]}
+            for action, samples in sorted(self.samples.items())
+        }
+
+
+class VirtualUser:
+    """One logged-in client with the ids it has seen so far"""
+
+    def __init__(self, client: httpx.AsyncClient, alias: str, headers: dict, recorder: Recorder, rng: random.Random):
+        self.client = client
+        self.alias = alias
+        self.headers = headers
+        self.recorder = recorder
+        self.rng = rng
+        self.note_ids: List[int] = []
+        self.folder_ids: List[int] = []
+        self.first_page_etag: Optional[str] = None
+
+    def remember(self, page: dict) -> None:
+        self.folder_ids = [folder["id"] for folder in page["folders"]] or self.folder_ids
+        self.note_ids.extend(note["id"] for note in page["notes"])
+        del self.note_ids[:-5000]
+
+    async def page(self, cursor: Optional[str] = None) -> Optional[dict]:
+        params = {"fields": "summary", "limit": PAGE_SIZE}
+        headers = dict(self.headers)
+        if cursor:
+            params["cursor"] = cursor
+        elif self.first_page_etag:
+            headers["If-None-Match"] = self.first_page_etag
+        response = await self.recorder.request("browse_page", self.client.get(f"/{self.alias}", params=params, headers=headers))
+        if response is None or response.status_code == 304:
+            return None
+        if not cursor:
+            self.first_page_etag = response.headers.get("ETag")
+        page = response.json()
+        self.remember(page)
+        return page
+
+    async def browse(self) -> None:
+        page = await self.page()
+        for _ in range(self.rng.randint(0, MAX_BROWSE_PAGES - 1)):
+            if not page or not page["next_cursor"]:
+                break
+            page = await self.page(page["next_cursor"])
+        if self.folder_ids:
+            await self.recorder.request("get_folder", self.client.get(f"/{self.alias}/folders/{self.rng.choice(self.folder_ids)}", headers=self.headers))
+        if self.note_ids:
+            await self.recorder.request("get_note", self.client.get(f"/{self.alias}/notes/{self.rng.choice(self.note_ids)}", headers=self.headers))
+
+    async def autosave(self) -> None:
+        if not self.note_ids:
+            return await self.browse()
+        note_id = self.rng.choice(self.note_ids)
+        response = await self.recorder.request("autosave_open", self.client.get(f"/{self.alias}/notes/{note_id}", headers=self.headers))
+        if response is None:
+            return
+        note = response.json()
+        content_hash, length = note["content_hash"], len(note["decrypted_content"] or "")
+        # Typing at a random point of the note, a few words per save
+        position = self.rng.randint(0, length)
+        for _ in range(self.rng.randint(3, 8)):
+            text = " " + " ".join(self.rng.choices(["lorem", "ipsum", "dolor", "sit", "amet", "todo", "draft"], k=self.rng.randint(1, 4)))
+            delta = {"previous_hash": content_hash, "edits": [{"start": position, "end": position, "text": text}]}
+            response = await self.recorder.request("autosave_delta", self.client.post(f"/{self.alias}/notes/{note_id}/delta", headers=self.headers, json=delta))
+            if response is None:
+                return
+            content_hash, position = response.json()["content_hash"], position + len(text)
+
+    async def move(self) -> None:
+        if not self.note_ids:
+            return await self.browse()
+        targets = self.folder_ids + [-1]
+        if self.rng.random() < 0.8:
+            note_id = self.rng.choice(self.note_ids)
+            await self.recorder.request("move_note", self.client.patch(f"/{self.alias}/notes/{note_id}", headers=self.headers, json={"folder_id": self.rng.choice(targets)}))
+            return
+        folder_id = self.rng.choice(targets)
+        operations = [{"op": "move", "id": note_id, "folder_id": folder_id} for note_id in self.rng.sample(self.note_ids, min(MOVE_BATCH_SIZE, len(self.note_ids)))]
+        await self.recorder.request("move_batch", self.client.post(f"/{self.alias}/notes/batch", headers=self.headers, json={"operations": operations}))
+
+
+SCENARIOS = {"browse": VirtualUser.browse, "autosave": VirtualUser.autosave, "move": VirtualUser.move}
+
+
+async def virtual_user(vuser: VirtualUser, mix: Dict[str, int], deadline: float, think: float) -> None:
+    names, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        await SCENARIOS[vuser.rng.choices(names, weights=weights)[0]](vuser)
+        if think:
+            await asyncio.sleep(vuser.rng.expovariate(1 / think))
+
+
+async def run(aliases: List[str], password: str, vusers: int, duration: float, mix: Dict[str, int], think: float, seed_value: int) -> dict:
+    rng = random.Random(seed_value)
+    recorder = Recorder()
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load", timeout=None) as client:
+            users = []
+            for i in range(vusers):
+                alias = aliases[i % len(aliases)]
+                response = await client.post("/login", json={"alias": alias, "password": password})
+                response.raise_for_status()
+                users.append(VirtualUser(client, alias, {"Authorization": f"Bearer {response.json()['token']}"}, recorder, random.Random(rng.random())))
+            # Each client starts the way the UI does, with the first sidebar page (untimed)
+            for vuser in users:
+                response = await client.get(f"/{vuser.alias}", params={"fields": "summary", "limit": PAGE_SIZE}, headers=vuser.headers)
+                response.raise_for_status()
+                vuser.remember(response.json())
+            started = time.perf_counter()
+            await asyncio.gather(*(virtual_user(vuser, mix, started + duration, think) for vuser in users))
+            elapsed = time.perf_counter() - started
+    return recorder.summary(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alias", nargs="+", help="existing accounts to load (default: seed a fresh vault)")
+    parser.add_argument("--password", default="seed-password", help="password of the --alias accounts")
+    parser.add_argument("--vusers", type=int, default=8, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help=f"scenario weights (default {DEFAULT_MIX})")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between scenarios per virtual user")
+    parser.add_argument("--accounts", type=int, default=1, help="accounts to seed without --alias")
+    parser.add_argument("--notes", type=int, default=20_000, help="notes per seeded account")
+    parser.add_argument("--folders", type=int, default=200, help="folders per seeded account")
+    parser.add_argument("--note-bytes", type=int, default=1500, help="median seeded note size")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON result to this file")
+    args = parser.parse_args()
+    aliases = args.alias
+    if not aliases:
+        seeded = seed.run(args.accounts, args.notes, args.folders, args.note_bytes, args.password, f"load{os.getpid()}", args.seed, seed.DEFAULT_BATCH_SIZE)
+        aliases = [user["alias"] for user in seeded["users"]]
+    results = asyncio.run(run(aliases, args.password, args.vusers, args.duration, args.mix, args.think_ms / 1e3, args.seed))
+    meta = run_metadata(accounts=len(aliases), seeded=not args.alias, notes=None if args.alias else args.notes, folders=None if args.alias else args.folders, vusers=args.vusers, duration=args.duration, mix=args.mix, think_ms=args.think_ms, seed=args.seed)
+    write_results("workload", meta, results, args.output)
+
+
+if __name__ == "__main__":
+    main()
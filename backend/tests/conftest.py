@@ -0,0 +1,71 @@
+"""
+Shared fixtures.
+
+Settings are read when app modules are imported, so the environment is set up
+first: a throwaway SQLite database, DATABASE_ASYNC so the aiosqlite engine
+exists next to the sync one, no rate limiting (tests/test_ratelimit.py drives
+the middleware directly) and a cheap KDF.
+
+Route tests take the `client` fixture and run once against the sync router and
+once against the async router.
+"""
+import os
+import tempfile
+import uuid
+from dataclasses import dataclass
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='cryptora-test-'), 'test.db')}"
+os.environ["DATABASE_ASYNC"] = "true"
+os.environ["RATE_LIMIT_ENABLED"] = "false"
+os.environ["KDF_ALGORITHM"] = "pbkdf2-sha256"
+os.environ["KDF_PBKDF2_ITERATIONS"] = "1000"
+os.environ["NOTE_REVISION_PRUNE_INTERVAL_SECONDS"] = "0"
+
+import pytest
+from fastapi import APIRouter, FastAPI
+from fastapi.testclient import TestClient
+
+from app.async_routers import async_router
+from app.main import lifespan
+from app.routers import router
+
+PASSWORD = "test-password"
+
+
+def make_app(api_router: APIRouter) -> FastAPI:
+    test_app = FastAPI(lifespan=lifespan)
+    test_app.include_router(api_router)
+    return test_app
+
+
+APPS = {"sync": make_app(router), "async": make_app(async_router)}
+
+
+@dataclass
+class Account:
+    alias: str
+    password: str
+    headers: dict
+
+
+def new_alias() -> str:
+    return f"u{uuid.uuid4().hex[:12]}"
+
+
+def login(client: TestClient, alias: str, password: str = PASSWORD) -> dict:
+    response = client.post("/login", json={"alias": alias, "password": password})
+    assert response.json()["success"], response.text
+    return {"Authorization": f"Bearer {response.json()['token']}"}
+
+
+@pytest.fixture(params=sorted(APPS))
+def client(request):
+    with TestClient(APPS[request.param]) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def account(client) -> Account:
+    alias = new_alias()
+    assert client.post("/register", json={"alias": alias, "password": PASSWORD}).status_code == 201
+    return Account(alias, PASSWORD, login(client, alias))
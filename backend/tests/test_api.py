@@ -0,0 +1,116 @@
+"""Account, folder and note CRUD through both routers (the async one on aiosqlite)"""
+from app.database import async_engine
+from tests.conftest import PASSWORD, login, new_alias
+
+
+def second_account(client):
+    alias = new_alias()
+    client.post("/register", json={"alias": alias, "password": PASSWORD})
+    return alias, login(client, alias)
+
+
+def test_async_engine_runs_on_aiosqlite():
+    assert async_engine is not None and async_engine.url.drivername == "sqlite+aiosqlite"
+
+
+def test_register_and_login(client):
+    alias = new_alias()
+    response = client.post("/register", json={"alias": alias, "password": PASSWORD})
+    assert response.status_code == 201 and response.json()["alias"] == alias
+    assert client.post("/register", json={"alias": alias, "password": PASSWORD}).status_code == 409
+
+    response = client.post("/login", json={"alias": alias, "password": PASSWORD}).json()
+    assert response["success"] and response["token"] and response["user"]["alias"] == alias
+    assert not client.post("/login", json={"alias": alias, "password": "wrong-password"}).json()["success"]
+    assert client.post("/login", json={"alias": new_alias(), "password": PASSWORD}).json()["message"] == "User not found"
+
+
+def test_routes_require_a_session(client, account):
+    assert client.post(f"/{account.alias}/folders", json={"name": "x"}).status_code == 401
+    assert client.post(f"/{account.alias}/notes", headers={"Authorization": "Bearer bogus"}, json={"content": "x"}).status_code == 401
+
+
+def test_folder_crud(client, account):
+    base = f"/{account.alias}/folders"
+    response = client.post(base, headers=account.headers, json={"name": "Work", "color": "blue"})
+    assert response.status_code == 201
+    folder_id = response.json()["id"]
+
+    folder = client.get(f"{base}/{folder_id}", headers=account.headers).json()
+    assert folder["decrypted_name"] == "Work" and folder["color"] == "blue"
+
+    assert client.put(f"{base}/{folder_id}", headers=account.headers, json={"name": "Projects"}).status_code == 200
+    assert client.get(f"{base}/{folder_id}", headers=account.headers).json()["decrypted_name"] == "Projects"
+
+    assert client.delete(f"{base}/{folder_id}", headers=account.headers).status_code == 204
+    assert client.get(f"{base}/{folder_id}", headers=account.headers).status_code == 404
+
+
+def test_note_crud(client, account):
+    base = f"/{account.alias}/notes"
+    folder_id = client.post(f"/{account.alias}/folders", headers=account.headers, json={"name": "Inbox"}).json()["id"]
+    response = client.post(base, headers=account.headers, json={"title": "Groceries", "content": "milk, eggs", "folder_id": folder_id})
+    assert response.status_code == 201
+    note = response.json()
+    assert note["folder_id"] == folder_id and note["encrypted_content"].startswith("v5:")
+
+    fetched = client.get(f"{base}/{note['id']}", headers=account.headers).json()
+    assert fetched["decrypted_title"] == "Groceries" and fetched["decrypted_content"] == "milk, eggs"
+
+    response = client.put(f"{base}/{note['id']}", headers=account.headers, json={"title": "Groceries", "content": "milk, eggs, bread", "previous_hash": note["content_hash"]})
+    assert response.status_code == 200
+    # A save against the old hash is a conflict
+    response = client.put(f"{base}/{note['id']}", headers=account.headers, json={"content": "stale", "previous_hash": note["content_hash"]})
+    assert response.status_code == 409
+    assert client.get(f"{base}/{note['id']}", headers=account.headers).json()["decrypted_content"] == "milk, eggs, bread"
+
+    listing = client.get(f"/{account.alias}").json()
+    assert [listed["id"] for listed in listing["notes"]] == [note["id"]]
+    assert [folder["id"] for folder in listing["folders"]] == [folder_id]
+
+    assert client.delete(f"{base}/{note['id']}", headers=account.headers).status_code == 204
+    assert client.get(f"{base}/{note['id']}", headers=account.headers).status_code == 404
+    assert client.get(f"/{account.alias}").json()["notes"] == []
+
+
+def test_patch_only_moves_into_own_folders(client, account):
+    url = f"/{account.alias}/notes/" + str(client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "x"}).json()["id"])
+    folder_id = client.post(f"/{account.alias}/folders", headers=account.headers, json={"name": "Mine"}).json()["id"]
+    other, other_headers = second_account(client)
+    foreign_id = client.post(f"/{other}/folders", headers=other_headers, json={"name": "Theirs"}).json()["id"]
+    deleted_id = client.post(f"/{account.alias}/folders", headers=account.headers, json={"name": "Gone"}).json()["id"]
+    client.delete(f"/{account.alias}/folders/{deleted_id}", headers=account.headers)
+
+    assert client.patch(url, headers=account.headers, json={"folder_id": folder_id}).json()["folder_id"] == folder_id
+    for target in (foreign_id, deleted_id, 10**9):
+        response = client.patch(url, headers=account.headers, json={"folder_id": target, "title": "moved"})
+        assert response.status_code == 404 and response.json()["detail"] == f"Folder {target} not found"
+    fetched = client.get(url, headers=account.headers).json()
+    assert fetched["folder_id"] == folder_id and fetched["decrypted_title"] is None
+    assert client.patch(url, headers=account.headers, json={"folder_id": -1}).json()["folder_id"] is None
+
+
+def test_notes_are_private(client, account):
+    note_id = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "secret"}).json()["id"]
+    other, other_headers = second_account(client)
+    # A session is only valid for its own alias
+    assert client.get(f"/{account.alias}/notes/{note_id}", headers=other_headers).status_code == 403
+    assert client.get(f"/{other}/notes/{note_id}", headers=other_headers).status_code == 404
+
+
+def test_folder_delete_unfiles_or_cascades(client, account):
+    folders, notes = f"/{account.alias}/folders", f"/{account.alias}/notes"
+    loose = client.post(notes, headers=account.headers, json={"content": "loose"}).json()["id"]
+    unfiled_folder, cascade_folder = (client.post(folders, headers=account.headers, json={"name": name}).json()["id"] for name in ("Keep", "Drop"))
+    kept = [client.post(notes, headers=account.headers, json={"content": str(i), "folder_id": unfiled_folder}).json()["id"] for i in range(2)]
+    dropped = [client.post(notes, headers=account.headers, json={"content": str(i), "folder_id": cascade_folder}).json()["id"] for i in range(2)]
+
+    assert client.delete(f"{folders}/{unfiled_folder}", headers=account.headers).status_code == 204
+    assert all(client.get(f"{notes}/{note_id}", headers=account.headers).json()["folder_id"] is None for note_id in kept)
+
+    assert client.delete(f"{folders}/{cascade_folder}", params={"cascade": True}, headers=account.headers).status_code == 204
+    assert all(client.get(f"{notes}/{note_id}", headers=account.headers).status_code == 404 for note_id in dropped)
+    listing = client.get(f"/{account.alias}").json()
+    assert sorted(note["id"] for note in listing["notes"]) == sorted(kept + [loose]) and listing["folders"] == []
+    # The folder is gone, so deleting it again is a 404
+    assert client.delete(f"{folders}/{cascade_folder}", params={"cascade": True}, headers=account.headers).status_code == 404
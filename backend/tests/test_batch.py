@@ -0,0 +1,73 @@
+"""Note batches: one result per operation, failures don't stop the rest"""
+from tests.test_api import second_account
+
+
+def batch(client, account, *operations):
+    response = client.post(f"/{account.alias}/notes/batch", headers=account.headers, json={"operations": list(operations)})
+    assert response.status_code == 200, response.text
+    return response.json()["results"]
+
+
+def test_every_operation_gets_a_result_in_order(client, account):
+    base = f"/{account.alias}/notes"
+    kept = client.post(base, headers=account.headers, json={"content": "kept"}).json()
+    moved = client.post(base, headers=account.headers, json={"content": "moved"}).json()
+    gone = client.post(base, headers=account.headers, json={"content": "gone"}).json()
+    folder = client.post(f"/{account.alias}/folders", headers=account.headers, json={"name": "Inbox"}).json()
+
+    results = batch(
+        client, account,
+        {"op": "create", "title": "new", "content": "fresh"},
+        {"op": "update", "id": kept["id"], "content": "edited", "previous_hash": kept["content_hash"]},
+        {"op": "move", "id": moved["id"], "folder_id": folder["id"]},
+        {"op": "delete", "id": gone["id"]},
+    )
+    assert [(result["index"], result["op"], result["status"]) for result in results] == [(0, "create", "ok"), (1, "update", "ok"), (2, "move", "ok"), (3, "delete", "ok")]
+    assert results[1]["note"]["content_hash"] != kept["content_hash"] and results[2]["note"]["folder_id"] == folder["id"]
+    assert client.get(f"{base}/{results[0]['id']}", headers=account.headers).json()["decrypted_content"] == "fresh"
+    assert client.get(f"{base}/{kept['id']}", headers=account.headers).json()["decrypted_content"] == "edited"
+    assert client.get(f"{base}/{gone['id']}", headers=account.headers).status_code == 404
+
+
+def test_stale_hash_is_a_conflict(client, account):
+    base = f"/{account.alias}/notes"
+    note = client.post(base, headers=account.headers, json={"content": "v1"}).json()
+    client.put(f"{base}/{note['id']}", headers=account.headers, json={"content": "v2"})
+    (result,) = batch(client, account, {"op": "update", "id": note["id"], "content": "v3", "previous_hash": note["content_hash"]})
+    assert result["status"] == "conflict" and result["note"] is None
+    assert client.get(f"{base}/{note['id']}", headers=account.headers).json()["decrypted_content"] == "v2"
+
+
+def test_missing_and_foreign_notes_are_not_found(client, account):
+    other_alias, other_headers = second_account(client)
+    foreign = client.post(f"/{other_alias}/notes", headers=other_headers, json={"content": "theirs"}).json()
+    results = batch(client, account, {"op": "delete", "id": 10**9}, {"op": "update", "id": foreign["id"], "content": "mine now"})
+    assert [result["status"] for result in results] == ["not_found", "not_found"]
+    assert client.get(f"/{other_alias}/notes/{foreign['id']}", headers=other_headers).json()["decrypted_content"] == "theirs"
+
+
+def test_invalid_operations_are_reported_not_applied(client, account):
+    base = f"/{account.alias}/notes"
+    untouched, unmoved, deleted = (client.post(base, headers=account.headers, json={"content": str(i)}).json()["id"] for i in range(3))
+    results = batch(
+        client, account,
+        {"op": "create", "title": "no body"},
+        {"op": "update"},
+        {"op": "update", "id": untouched},
+        {"op": "move", "id": unmoved},
+        {"op": "create", "content": "x", "folder_id": 10**9},
+        {"op": "delete", "id": deleted},
+        {"op": "delete", "id": deleted},
+    )
+    assert [(result["status"], result["detail"]) for result in results] == [
+        ("invalid", "content is required"),
+        ("invalid", "id is required"),
+        ("invalid", "Nothing to update"),
+        ("invalid", "folder_id is required (use -1 to remove from folder)"),
+        ("invalid", f"Folder {10**9} not found"),
+        ("ok", None),
+        ("invalid", "Duplicate note id in batch"),
+    ]
+    # Only the one valid operation was applied
+    assert sorted(note["id"] for note in client.get(f"/{account.alias}").json()["notes"]) == [untouched, unmoved]
+    assert client.get(f"{base}/{untouched}", headers=account.headers).json()["decrypted_content"] == "0"
@@ -0,0 +1,92 @@
+"""Delta saves: the hash chain, conflicts and compaction into a new base"""
+from app.config import settings
+from app.crypto import CryptoUtils
+from app.database import SessionLocal
+from app.models import User
+from app.services import UserService
+from app.user_cache import CachedUser
+from tests.conftest import PASSWORD
+
+
+def save_delta(client, account, note_id, previous_hash, start, end, text):
+    return client.post(f"/{account.alias}/notes/{note_id}/delta", headers=account.headers, json={"previous_hash": previous_hash, "edits": [{"start": start, "end": end, "text": text}]})
+
+
+def test_delta_chain(client, account):
+    note = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "hello world"}).json()
+    response = client.post(f"/{account.alias}/notes/{note['id']}/delta", headers=account.headers, json={"previous_hash": note["content_hash"], "edits": [{"start": 0, "end": 5, "text": "HELLO"}, {"start": 11, "end": 11, "text": "!"}]})
+    assert response.status_code == 200
+    first = response.json()
+    assert first["delta_count"] == 1 and first["content_hash"] != note["content_hash"]
+
+    second = save_delta(client, account, note["id"], first["content_hash"], 0, 0, ">> ").json()
+    assert second["delta_count"] == 2
+    assert client.get(f"/{account.alias}/notes/{note['id']}", headers=account.headers).json()["decrypted_content"] == ">> HELLO world!"
+
+
+def test_note_read_reports_pending_deltas(client, account):
+    note = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "base"}).json()
+    row = save_delta(client, account, note["id"], note["content_hash"], 4, 4, " edited").json()
+    fetched = client.get(f"/{account.alias}/notes/{note['id']}", headers=account.headers).json()
+    # encrypted_content is still the base, so clients must know deltas sit on top of it
+    assert fetched["delta_count"] == 1 and fetched["content_hash"] == row["content_hash"]
+    assert fetched["encrypted_content"] == note["encrypted_content"]
+    listed = client.get(f"/{account.alias}").json()["notes"]
+    assert [entry["delta_count"] for entry in listed if entry["id"] == note["id"]] == [1]
+
+
+def test_delta_against_stale_hash_conflicts(client, account):
+    note = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "abc"}).json()
+    assert save_delta(client, account, note["id"], note["content_hash"], 3, 3, "d").status_code == 200
+    assert save_delta(client, account, note["id"], note["content_hash"], 3, 3, "e").status_code == 409
+    assert save_delta(client, account, 10**9, note["content_hash"], 0, 0, "x").status_code == 404
+    assert client.get(f"/{account.alias}/notes/{note['id']}", headers=account.headers).json()["decrypted_content"] == "abcd"
+
+
+def test_chain_is_compacted_at_threshold(client, account, monkeypatch):
+    monkeypatch.setattr(settings, "NOTE_DELTA_COMPACT_THRESHOLD", 3)
+    note = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "0"}).json()
+    content_hash, expected, counts = note["content_hash"], "0", []
+    for i in range(1, 5):
+        row = save_delta(client, account, note["id"], content_hash, len(expected), len(expected), str(i)).json()
+        content_hash, expected = row["content_hash"], expected + str(i)
+        counts.append(row["delta_count"])
+    # The third delta folds the chain into the base; the fourth starts a new chain
+    assert counts == [1, 2, 0, 1]
+    fetched = client.get(f"/{account.alias}/notes/{note['id']}", headers=account.headers).json()
+    assert fetched["decrypted_content"] == expected and fetched["content_hash"] == content_hash
+
+
+def test_full_save_resets_the_chain(client, account):
+    note = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "draft"}).json()
+    row = save_delta(client, account, note["id"], note["content_hash"], 5, 5, " two").json()
+    response = client.put(f"/{account.alias}/notes/{note['id']}", headers=account.headers, json={"content": "final", "previous_hash": row["content_hash"]})
+    assert response.status_code == 200 and response.json()["delta_count"] == 0
+    assert client.get(f"/{account.alias}/notes/{note['id']}", headers=account.headers).json()["decrypted_content"] == "final"
+
+
+def test_delta_that_grows_past_the_size_limit_is_rejected(client, account, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_CONTENT_SIZE", 10)
+    note = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "12345"}).json()
+    row = save_delta(client, account, note["id"], note["content_hash"], 5, 5, "6789").json()
+    # Each delta is small; it is the body they add up to that crosses the limit
+    assert save_delta(client, account, note["id"], row["content_hash"], 9, 9, "ab").status_code == 413
+    fetched = client.get(f"/{account.alias}/notes/{note['id']}", headers=account.headers).json()
+    assert fetched["delta_count"] == 1 and fetched["content_hash"] == row["content_hash"]
+    assert save_delta(client, account, note["id"], row["content_hash"], 0, 9, "ab").status_code == 200
+
+
+def test_raw_read_folds_deltas_without_writing(client, account):
+    note = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "raw"}).json()
+    row = save_delta(client, account, note["id"], note["content_hash"], 3, 3, " body").json()
+    url = f"/{account.alias}/notes/{note['id']}"
+    before = client.get(url, headers=account.headers)
+    raw = client.get(f"{url}/raw", headers=account.headers)
+    assert raw.status_code == 200 and raw.headers["X-Content-Hash"] == row["content_hash"]
+    with SessionLocal() as db:
+        user = CachedUser.from_user(db.query(User).filter(User.alias == account.alias).one())
+    assert CryptoUtils.decrypt_with_key(raw.content, UserService.unlock(user, PASSWORD)) == "raw body"
+    # A GET leaves the stored note, its chain and its ETag as they were
+    after = client.get(url, headers=account.headers)
+    assert after.headers["ETag"] == before.headers["ETag"]
+    assert after.json()["delta_count"] == 1 and after.json()["updated_at"] == before.json()["updated_at"]
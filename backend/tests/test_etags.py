@@ -0,0 +1,49 @@
+"""Conditional reads (If-None-Match -> 304) and writes (If-Match -> 412)"""
+
+
+def test_note_revalidation(client, account):
+    note = client.post(f"/{account.alias}/notes", headers=account.headers, json={"title": "t", "content": "body"}).json()
+    url = f"/{account.alias}/notes/{note['id']}"
+    response = client.get(url, headers=account.headers)
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "private, no-cache"
+
+    response = client.get(url, headers={**account.headers, "If-None-Match": etag})
+    assert response.status_code == 304 and response.headers["ETag"] == etag and not response.content
+    assert client.get(url, headers={**account.headers, "If-None-Match": f"W/{etag}"}).status_code == 304
+
+    # A title-only patch leaves content_hash alone but must still change the tag
+    client.patch(url, headers=account.headers, json={"title": "renamed"})
+    response = client.get(url, headers={**account.headers, "If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+
+
+def test_note_update_precondition(client, account):
+    note = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "v1"}).json()
+    url = f"/{account.alias}/notes/{note['id']}"
+    etag = client.get(url, headers=account.headers).headers["ETag"]
+
+    response = client.put(url, headers={**account.headers, "If-Match": etag}, json={"content": "v2"})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    # The tag the first writer read is stale now
+    response = client.put(url, headers={**account.headers, "If-Match": etag}, json={"content": "v3"})
+    assert response.status_code == 412
+    assert client.get(url, headers=account.headers).json()["decrypted_content"] == "v2"
+
+
+def test_folder_conditional_requests(client, account):
+    folder_id = client.post(f"/{account.alias}/folders", headers=account.headers, json={"name": "A"}).json()["id"]
+    url = f"/{account.alias}/folders/{folder_id}"
+    etag = client.get(url, headers=account.headers).headers["ETag"]
+    assert client.get(url, headers={**account.headers, "If-None-Match": etag}).status_code == 304
+    assert client.put(url, headers={**account.headers, "If-Match": etag}, json={"name": "B"}).status_code == 200
+    assert client.put(url, headers={**account.headers, "If-Match": etag}, json={"name": "C"}).status_code == 412
+    assert client.get(url, headers={**account.headers, "If-None-Match": etag}).status_code == 200
+
+
+def test_list_revalidation(client, account):
+    client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "one"})
+    etag = client.get(f"/{account.alias}", params={"fields": "summary"}).headers["ETag"]
+    assert client.get(f"/{account.alias}", params={"fields": "summary"}, headers={"If-None-Match": etag}).status_code == 304
+    client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "two"})
+    assert client.get(f"/{account.alias}", params={"fields": "summary"}, headers={"If-None-Match": etag}).status_code == 200
@@ -0,0 +1,96 @@
+"""Streaming import: batching, resuming an interrupted upload, export round trip"""
+import asyncio
+import json
+
+import pytest
+
+from app import crypto
+from app.config import settings
+from app.crypto import CryptoUtils
+from app.database import SessionLocal
+from app.importer import run_import
+from app.services import UserService
+
+
+def ndjson(*records) -> str:
+    return "".join(json.dumps(record) + "\n" for record in records)
+
+
+async def dropped_upload(text: str, after_lines: int):
+    """An upload, one line per chunk, whose connection drops after after_lines lines"""
+    for line in text.splitlines(keepends=True)[:after_lines]:
+        yield line.encode()
+    raise ConnectionResetError("client went away")
+
+
+NOTES = [{"type": "note", "title": f"note {i}", "content": f"body {i}", "folder_id": 1} for i in range(5)]
+FOLDER = {"type": "folder", "id": 1, "name": "Imported"}
+
+
+def test_resume_after_interrupted_import(client, account, monkeypatch):
+    monkeypatch.setattr(settings, "IMPORT_BATCH_SIZE", 2)
+    url = f"/{account.alias}/import"
+    with SessionLocal() as db:
+        user_service = UserService(db)
+        user = user_service.get_user_by_alias(account.alias)
+        key = user_service.unlock(user, account.password)
+    # The connection drops after the first two batches were committed
+    with pytest.raises(ConnectionResetError):
+        asyncio.run(run_import(user.id, key, dropped_upload(ndjson(FOLDER, *NOTES), 5)))
+    progress = client.get(url, headers=account.headers).json()
+    assert progress["status"] == "failed" and progress["notes_imported"] == 3 and progress["folders_created"] == 1
+
+    # Uploading the whole archive again only adds what is missing
+    response = client.post(url, headers=account.headers, content=ndjson(FOLDER, *NOTES))
+    assert response.status_code == 200
+    progress = response.json()
+    assert progress["status"] == "completed"
+    assert (progress["notes_imported"], progress["notes_skipped"]) == (2, 3)
+    assert (progress["folders_created"], progress["folders_reused"]) == (0, 1)
+
+    listing = client.get(f"/{account.alias}").json()
+    assert len(listing["notes"]) == 5 and len(listing["folders"]) == 1
+    assert {note["folder_id"] for note in listing["notes"]} == {listing["folders"][0]["id"]}
+
+
+def test_invalid_records_are_reported(client, account):
+    records = ndjson({"type": "note", "title": "ok", "content": "fine"}, {"type": "note", "title": "empty"}, {"type": "mystery"})
+    progress = client.post(f"/{account.alias}/import", headers=account.headers, content=records).json()
+    assert progress["notes_imported"] == 1 and progress["failed"] == 2 and len(progress["errors"]) == 2
+
+
+def test_export_reimports_as_duplicates(client, account):
+    client.post(f"/{account.alias}/import", headers=account.headers, content=ndjson(FOLDER, *NOTES))
+    archive = client.get(f"/{account.alias}/export", headers=account.headers).content
+    progress = client.post(f"/{account.alias}/import", headers=account.headers, content=archive).json()
+    assert progress["notes_imported"] == 0 and progress["notes_skipped"] == len(NOTES)
+
+
+def unlocked_key(account):
+    """The key a ?password= request carries: unlike a session token's, it holds the password"""
+    with SessionLocal() as db:
+        user_service = UserService(db)
+        user = user_service.get_user_by_alias(account.alias)
+        return user.id, user_service.unlock(user, account.password)
+
+
+async def upload(text: str):
+    yield text.encode()
+
+
+def test_foreign_ciphertext_is_rejected_without_deriving(client, account, monkeypatch):
+    user_id, key = unlocked_key(account)
+    # Valid under the account's password, but with its own salt and a costlier KDF
+    foreign = CryptoUtils.encrypt_with_key("elsewhere", CryptoUtils.user_key(account.alias, account.password, CryptoUtils.new_salt(), crypto.KdfParams("pbkdf2-sha256", iterations=2000)))
+    derived = []
+    monkeypatch.setattr(crypto.key_cache, "get_or_derive", lambda *args: derived.append(args))
+    progress = asyncio.run(run_import(user_id, key, upload(ndjson({"type": "note", "encrypted_content": CryptoUtils.to_text(foreign)}))))
+    assert progress.notes_imported == 0 and progress.failed == 1 and not derived
+
+
+def test_oversized_ciphertext_is_rejected_before_decrypting(client, account, monkeypatch):
+    monkeypatch.setattr(settings, "MAX_CONTENT_SIZE", 100)
+    blob = CryptoUtils.to_text(CryptoUtils.encrypt_with_key("x" * 1000, unlocked_key(account)[1], codec=crypto.CODEC_NONE))
+    monkeypatch.setattr(CryptoUtils, "decrypt_with_key", staticmethod(lambda *args: pytest.fail("decrypted an oversized blob")))
+    progress = client.post(f"/{account.alias}/import", headers=account.headers, content=ndjson({"type": "note", "encrypted_content": blob})).json()
+    assert progress["notes_imported"] == 0 and progress["errors"] == ["record 1: Content larger than 100 bytes"]
@@ -0,0 +1,40 @@
+"""KDF parameter encoding and the ceilings enforced on decoded headers"""
+import os
+import struct
+
+import pytest
+
+from app import kdf
+from app.crypto import BLOB_V4, CODEC_NONE, CryptoUtils
+from app.kdf import KDF_PBKDF2_SHA256, KDF_SCRYPT, KdfParams, MAX_PBKDF2_ITERATIONS
+
+
+def test_params_round_trip():
+    for params in (KdfParams("pbkdf2-sha256", iterations=600_000), KdfParams("scrypt", log_n=15, r=8, p=1)):
+        assert KdfParams.decode(params.encode() + b"rest") == (params, len(params.encode()))
+
+
+@pytest.mark.parametrize("encoded", [
+    struct.pack(">BI", KDF_PBKDF2_SHA256, 0),
+    struct.pack(">BI", KDF_PBKDF2_SHA256, MAX_PBKDF2_ITERATIONS + 1),
+    struct.pack(">BI", KDF_PBKDF2_SHA256, 2 ** 32 - 1),
+    struct.pack(">BBBB", KDF_SCRYPT, 40, 8, 1),
+    struct.pack(">BBBB", KDF_SCRYPT, 15, 0, 1),
+    struct.pack(">BBBB", KDF_SCRYPT, 15, 8, 255),
+])
+def test_out_of_range_params_are_rejected(encoded):
+    with pytest.raises(ValueError):
+        KdfParams.decode(encoded)
+
+
+def test_forged_header_is_not_derived(monkeypatch):
+    key = CryptoUtils.user_key("alice", "password", CryptoUtils.new_salt())
+    forged = bytes([BLOB_V4, CODEC_NONE]) + struct.pack(">BI", KDF_PBKDF2_SHA256, 2 ** 32 - 1) + os.urandom(16 + 12 + 32)
+
+    def derive(*args):
+        raise AssertionError("derived a key for a forged header")
+
+    monkeypatch.setattr(kdf, "derive", derive)
+    monkeypatch.setattr(CryptoUtils, "derive_key", staticmethod(derive))
+    with pytest.raises(ValueError):
+        CryptoUtils.decrypt_with_key(forged, key)
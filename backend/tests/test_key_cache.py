@@ -0,0 +1,84 @@
+"""KeyCache: TTL expiry, LRU bound and HMAC-keyed entries"""
+import pytest
+
+from app import crypto
+from app.crypto import KeyCache
+from app.kdf import KdfParams
+
+KDF = KdfParams("pbkdf2-sha256", iterations=1000)
+SALT = b"s" * 16
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(crypto.time, "monotonic", clock)
+    return clock
+
+
+def counting_derive():
+    calls = []
+
+    def derive(password, salt, kdf):
+        calls.append(password)
+        return f"key-{password}-{len(calls)}".encode()
+
+    return derive, calls
+
+
+def test_hits_until_the_ttl_runs_out(clock):
+    cache = KeyCache(max_size=8, ttl_seconds=60)
+    derive, calls = counting_derive()
+    first = cache.get_or_derive("alice", "pw", SALT, KDF, derive)
+    clock.now += 59
+    assert cache.get_or_derive("alice", "pw", SALT, KDF, derive) == first and len(calls) == 1
+    clock.now += 2
+    assert cache.get_or_derive("alice", "pw", SALT, KDF, derive) != first and len(calls) == 2
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2 and cache.stats()["evictions"] == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = KeyCache(max_size=2, ttl_seconds=60)
+    derive, calls = counting_derive()
+    for password in ("a", "b", "a", "c"):
+        cache.get_or_derive("alice", password, SALT, KDF, derive)
+    # "b" was the least recently used when "c" came in
+    cache.get_or_derive("alice", "a", SALT, KDF, derive)
+    cache.get_or_derive("alice", "b", SALT, KDF, derive)
+    assert calls == ["a", "b", "c", "b"] and cache.stats()["size"] == 2
+
+
+def test_entries_are_keyed_by_an_hmac_digest(clock):
+    cache = KeyCache()
+    derive, calls = counting_derive()
+    cache.get_or_derive("alice", "hunter2", SALT, KDF, derive)
+    (digest,) = cache._entries
+    assert len(digest) == 32 and b"hunter2" not in digest and b"alice" not in digest
+    # The digest depends on a per-process secret, so it can't be precomputed from a guess
+    assert KeyCache()._digest("alice", "hunter2", SALT, KDF) != digest
+
+
+def test_key_parts_do_not_run_together(clock):
+    cache = KeyCache()
+    derive, calls = counting_derive()
+    cache.get_or_derive("ab", "c", SALT, KDF, derive)
+    cache.get_or_derive("a", "bc", SALT, KDF, derive)
+    cache.get_or_derive("ab", "c", SALT, KdfParams("pbkdf2-sha256", iterations=2000), derive)
+    assert len(calls) == 3
+
+
+def test_discard_forgets_a_key(clock):
+    cache = KeyCache()
+    derive, calls = counting_derive()
+    cache.get_or_derive("alice", "wrong", SALT, KDF, derive)
+    cache.discard("alice", "wrong", SALT, KDF)
+    cache.get_or_derive("alice", "wrong", SALT, KDF, derive)
+    assert len(calls) == 2
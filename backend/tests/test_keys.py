@@ -0,0 +1,143 @@
+"""Per-user data keys: wrapping, KDF rewrap at login, password changes and migrating older accounts"""
+import asyncio
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+from app import async_services, crypto
+from app.config import settings
+from app.crypto import BLOB_V1, BLOB_V4, BLOB_V5, CryptoUtils
+from app.database import SessionLocal
+from app.kdf import LEGACY_KDF, KdfParams
+from app.models import Folder, Note, User
+from tests.conftest import APPS, PASSWORD, login, new_alias
+
+
+def stored_user(alias: str) -> User:
+    with SessionLocal() as db:
+        return db.query(User).filter_by(alias=alias).one()
+
+
+def stored_note(note_id: int) -> Note:
+    with SessionLocal() as db:
+        return db.get(Note, note_id)
+
+
+def test_new_accounts_get_a_wrapped_data_key(client, account):
+    user = stored_user(account.alias)
+    assert user.wrapped_key[0] == BLOB_V4 and user.encrypted_alias[0] == BLOB_V5
+    wrapping_key = CryptoUtils.user_key(account.alias, PASSWORD, CryptoUtils.extract_salt(user.wrapped_key), CryptoUtils.extract_kdf(user.wrapped_key))
+    data_key = CryptoUtils.unwrap_key(user.wrapped_key, wrapping_key)
+    assert CryptoUtils.decrypt_with_key(user.encrypted_alias, CryptoUtils.envelope_key(wrapping_key, data_key)) == account.alias
+    # The password-derived key alone can't read records
+    with pytest.raises(ValueError):
+        CryptoUtils.decrypt_with_key(user.encrypted_alias, wrapping_key)
+
+
+def test_outdated_kdf_is_rewrapped_at_login(client, account, monkeypatch):
+    note = client.post(f"/{account.alias}/notes", headers=account.headers, json={"title": "t", "content": "body"}).json()
+    before = stored_user(account.alias).wrapped_key
+    monkeypatch.setattr(crypto, "CURRENT_KDF", KdfParams("pbkdf2-sha256", iterations=1500))
+
+    headers = login(client, account.alias)
+    after = stored_user(account.alias).wrapped_key
+    assert after != before and CryptoUtils.extract_kdf(after) == crypto.CURRENT_KDF
+    # Only the wrapped key changed; records stay as they were
+    assert stored_note(note["id"]).encrypted_content == CryptoUtils.from_text(note["encrypted_content"])
+    for session in (account.headers, headers):
+        assert client.get(f"/{account.alias}/notes/{note['id']}", headers=session).json()["decrypted_content"] == "body"
+    login(client, account.alias)
+    assert stored_user(account.alias).wrapped_key == after
+
+
+def test_rewrap_can_be_disabled(client, account, monkeypatch):
+    before = stored_user(account.alias).wrapped_key
+    monkeypatch.setattr(crypto, "CURRENT_KDF", KdfParams("pbkdf2-sha256", iterations=1500))
+    monkeypatch.setattr(settings, "KDF_REHASH_ON_LOGIN", False)
+    login(client, account.alias)
+    assert stored_user(account.alias).wrapped_key == before
+
+
+def test_password_change_rewraps_the_data_key(client, account):
+    note = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "kept"}).json()
+    before = stored_user(account.alias)
+    response = client.post("/password", json={"alias": account.alias, "password": PASSWORD, "new_password": "new-password"}).json()
+    assert response["success"] and response["token"]
+
+    after = stored_user(account.alias)
+    assert after.wrapped_key != before.wrapped_key and after.encrypted_alias == before.encrypted_alias
+    assert stored_note(note["id"]).encrypted_content == CryptoUtils.from_text(note["encrypted_content"])
+    assert not client.post("/login", json={"alias": account.alias, "password": PASSWORD}).json()["success"]
+    headers = login(client, account.alias, "new-password")
+    for session in (headers, {"Authorization": f"Bearer {response['token']}"}):
+        assert client.get(f"/{account.alias}/notes/{note['id']}", headers=session).json()["decrypted_content"] == "kept"
+    # Sessions from before the change end with it
+    assert client.get(f"/{account.alias}/notes/{note['id']}", headers=account.headers).status_code == 401
+
+
+def test_password_change_needs_the_current_password(client, account):
+    response = client.post("/password", json={"alias": account.alias, "password": "wrong-password", "new_password": "new-password"}).json()
+    assert not response["success"]
+    login(client, account.alias)
+
+
+def v1_blob(plaintext: str, password: str) -> bytes:
+    """A legacy record: its own salt, a key derived with LEGACY_KDF, no AAD"""
+    salt, nonce = os.urandom(16), os.urandom(12)
+    return bytes([BLOB_V1]) + salt + nonce + AESGCM(CryptoUtils.derive_key(password, salt, LEGACY_KDF)).encrypt(nonce, plaintext.encode(), None)
+
+
+def legacy_account(alias: str):
+    """An account from before data keys, with a v4 and a v1 note and a folder; returns (folder id, note ids)"""
+    key = CryptoUtils.user_key(alias, PASSWORD, CryptoUtils.new_salt())
+    with SessionLocal() as db:
+        user = User(alias=alias, encrypted_alias=CryptoUtils.encrypt_with_key(alias, key))
+        db.add(user)
+        db.flush()
+        folder = Folder(user_id=user.id, encrypted_name=CryptoUtils.encrypt_with_key("Old folder", key))
+        current = Note(user_id=user.id, encrypted_title=CryptoUtils.encrypt_with_key("v4 title", key), encrypted_content=CryptoUtils.encrypt_with_key("v4 body", key), content_hash="h1")
+        legacy = Note(user_id=user.id, encrypted_title=v1_blob("v1 title", PASSWORD), encrypted_content=v1_blob("v1 body", PASSWORD), content_hash="h2")
+        db.add_all([folder, current, legacy])
+        db.commit()
+        return folder.id, (current.id, legacy.id)
+
+
+def test_accounts_without_a_data_key_migrate_at_login(client):
+    alias = new_alias()
+    folder_id, note_ids = legacy_account(alias)
+    headers = login(client, alias)
+    user = stored_user(alias)
+    assert user.wrapped_key and user.encrypted_alias[0] == BLOB_V5
+    with SessionLocal() as db:
+        assert db.get(Folder, folder_id).encrypted_name[0] == BLOB_V5
+        for note_id in note_ids:
+            note = db.get(Note, note_id)
+            assert note.encrypted_title[0] == note.encrypted_content[0] == BLOB_V5
+    notes = [client.get(f"/{alias}/notes/{note_id}", headers=headers).json() for note_id in note_ids]
+    assert [(note["decrypted_title"], note["decrypted_content"]) for note in notes] == [("v4 title", "v4 body"), ("v1 title", "v1 body")]
+    assert client.get(f"/{alias}/folders/{folder_id}", headers=headers).json()["decrypted_name"] == "Old folder"
+
+    # The migration runs once
+    login(client, alias)
+    assert stored_user(alias).wrapped_key == user.wrapped_key
+
+
+def test_async_migration_reencrypts_off_the_event_loop(monkeypatch):
+    alias = new_alias()
+    _, note_ids = legacy_account(alias)
+    reencrypt, on_loop = async_services.rehash_notes_batch, []
+
+    def rehash_notes_batch(*args):
+        try:
+            on_loop.append(asyncio.get_running_loop() is not None)
+        except RuntimeError:
+            on_loop.append(False)
+        return reencrypt(*args)
+
+    monkeypatch.setattr(async_services, "rehash_notes_batch", rehash_notes_batch)
+    with TestClient(APPS["async"]) as client:
+        headers = login(client, alias)
+        assert client.get(f"/{alias}/notes/{note_ids[1]}", headers=headers).json()["decrypted_content"] == "v1 body"
+    assert on_loop == [False]
@@ -0,0 +1,62 @@
+"""Request instrumentation and the /metrics exposition"""
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.metrics import MetricsRegistry, RequestTimings, registry
+from tests.conftest import PASSWORD, new_alias
+
+
+def samples(text):
+    """{'name{labels}': value} for every sample line"""
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line and not line.startswith("#")}
+
+
+def test_histograms_are_cumulative_and_labels_escaped():
+    metrics = MetricsRegistry(prefix="test")
+    metrics.observe("GET", '/a"b', 200, 0.003, RequestTimings(kdf=0.002, queries=2))
+    metrics.observe("GET", '/a"b', 404, 0.2, RequestTimings(db=0.1, queries=4))
+    text = metrics.render()
+    assert "# TYPE test_request_duration_seconds histogram" in text and "# TYPE test_requests_total counter" in text
+    values = samples(text)
+    labels = 'method="GET",route="/a\\"b"'
+    assert values[f'test_requests_total{{{labels},status="200"}}'] == values[f'test_requests_total{{{labels},status="404"}}'] == 1
+    assert values[f'test_request_duration_seconds_bucket{{{labels},le="0.001"}}'] == 0
+    assert values[f'test_request_duration_seconds_bucket{{{labels},le="0.005"}}'] == 1
+    assert values[f'test_request_duration_seconds_bucket{{{labels},le="0.25"}}'] == values[f'test_request_duration_seconds_bucket{{{labels},le="+Inf"}}'] == 2
+    assert values[f'test_request_duration_seconds_count{{{labels}}}'] == 2
+    assert values[f'test_request_phase_seconds_sum{{{labels},phase="kdf"}}'] == 0.002
+    assert values[f'test_request_db_queries_sum{{{labels}}}'] == 6
+
+
+@pytest.fixture
+def app_client():
+    registry.reset()
+    with TestClient(app) as client:
+        yield client
+    registry.reset()
+
+
+def test_requests_are_recorded_per_route_template(app_client):
+    alias = new_alias()
+    app_client.post("/register", json={"alias": alias, "password": PASSWORD})
+    token = app_client.post("/login", json={"alias": alias, "password": PASSWORD}).json()["token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    note_id = app_client.post(f"/{alias}/notes", headers=headers, json={"content": "timed"}).json()["id"]
+    for _ in range(2):
+        app_client.get(f"/{alias}/notes/{note_id}", headers=headers)
+    app_client.get(f"/{alias}/notes/{10**9}", headers=headers)
+
+    response = app_client.get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    values = samples(response.text)
+    note_route = 'method="GET",route="/{alias}/notes/{note_id}"'
+    assert values[f'cryptora_requests_total{{{note_route},status="200"}}'] == 2
+    assert values[f'cryptora_requests_total{{{note_route},status="404"}}'] == 1
+    assert values[f'cryptora_request_db_queries_sum{{{note_route}}}'] > 0
+    assert values[f'cryptora_request_phase_seconds_sum{{{note_route},phase="cipher"}}'] > 0
+    # Login found the key register derived in the key cache, so only register paid for the KDF
+    assert values['cryptora_request_phase_seconds_sum{method="POST",route="/register",phase="kdf"}'] > 0
+    assert values['cryptora_request_phase_seconds_sum{method="POST",route="/login",phase="kdf"}'] == 0
+    # Paths never become labels, and /metrics doesn't record itself
+    assert alias not in response.text and 'route="/metrics"' not in response.text
@@ -0,0 +1,63 @@
+"""Keyset pagination of a user's notes on (created_at, id)"""
+import base64
+from datetime import datetime
+
+import pytest
+
+from app.database import SessionLocal
+from app.models import Note
+
+
+def all_pages(client, account, limit, **params):
+    pages, cursor = [], None
+    while True:
+        response = client.get(f"/{account.alias}", params={"limit": limit, **({"cursor": cursor} if cursor else {}), **params})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        pages.append(body)
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_pages_cover_every_note_once_newest_first(client, account):
+    ids = [client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": str(i)}).json()["id"] for i in range(7)]
+    # Half the notes share a timestamp, so the order falls back to the id
+    with SessionLocal() as db:
+        for note_id in ids[2:6]:
+            db.get(Note, note_id).created_at = datetime(2030, 1, 1)
+        db.commit()
+    pages = all_pages(client, account, 3, fields="summary")
+    assert [len(page["notes"]) for page in pages] == [3, 3, 1]
+    assert [note["id"] for page in pages for note in page["notes"]] == ids[5:1:-1] + ids[6:] + ids[1::-1]
+    assert all("encrypted_content" not in note for page in pages for note in page["notes"])
+    # Folders only come with the first page
+    assert "folders" in pages[0] and all(page["folders"] == [] for page in pages[1:])
+
+
+def test_without_a_limit_everything_comes_back(client, account):
+    for i in range(3):
+        client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": str(i)})
+    body = client.get(f"/{account.alias}").json()
+    assert len(body["notes"]) == 3 and body["next_cursor"] is None
+
+
+def test_a_page_boundary_survives_new_notes(client, account):
+    for i in range(4):
+        client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": str(i)})
+    first = client.get(f"/{account.alias}", params={"limit": 2}).json()
+    client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "new"})
+    second = client.get(f"/{account.alias}", params={"limit": 2, "cursor": first["next_cursor"]}).json()
+    assert [note["id"] for note in second["notes"]] == [note["id"] - 2 for note in first["notes"]]
+
+
+@pytest.mark.parametrize("cursor", [
+    "not-a-cursor",
+    base64.urlsafe_b64encode(b"2030-01-01T00:00:00").decode(),
+    base64.urlsafe_b64encode(b"yesterday|5").decode(),
+    base64.urlsafe_b64encode(b"2030-01-01T00:00:00|five").decode(),
+    "été",
+])
+def test_bad_cursors_are_rejected(client, account, cursor):
+    response = client.get(f"/{account.alias}", params={"limit": 2, "cursor": cursor})
+    assert response.status_code == 400 and response.json()["detail"] == "Invalid cursor"
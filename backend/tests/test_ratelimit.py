@@ -0,0 +1,105 @@
+"""RateLimitMiddleware buckets, driven directly so each request can come from its own IP"""
+import asyncio
+import json
+
+from app.ratelimit import InMemoryTokenBucketStore, RateLimitMiddleware
+
+
+async def ok_app(scope, receive, send):
+    await receive()
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def limiter(per_minute: int = 5, **options) -> RateLimitMiddleware:
+    return RateLimitMiddleware(ok_app, store=InMemoryTokenBucketStore(shards=4), per_minute=per_minute, expensive_paths=[("POST", "/login")], expensive_cost=3, **options)
+
+
+def response_start(middleware: RateLimitMiddleware, method: str, path: str, ip: str = "10.0.0.1", body: bytes = b"", query: bytes = b"") -> dict:
+    """The http.response.start message of one request through the middleware"""
+    scope = {"type": "http", "method": method, "path": path, "query_string": query, "client": (ip, 1234), "headers": []}
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(middleware(scope, receive, send))
+    return sent[0]
+
+
+def request(middleware: RateLimitMiddleware, method: str, path: str, ip: str = "10.0.0.1", body: bytes = b"", query: bytes = b"") -> int:
+    return response_start(middleware, method, path, ip, body, query)["status"]
+
+
+def test_ip_bucket():
+    middleware = limiter(per_minute=5)
+    assert [request(middleware, "POST", "/register") for _ in range(6)] == [200] * 5 + [429]
+    # Other clients have their own bucket
+    assert request(middleware, "POST", "/register", ip="10.0.0.2") == 200
+
+
+def test_alias_bucket_spans_ips():
+    middleware = limiter(per_minute=5)
+    statuses = [request(middleware, "POST", "/alice/notes", ip=f"10.0.1.{i}") for i in range(6)]
+    assert statuses == [200] * 5 + [429]
+    assert request(middleware, "POST", "/bob/notes", ip="10.0.1.99") == 200
+
+
+def test_reads_cost_a_fraction_of_a_write():
+    middleware = limiter(per_minute=5, read_cost=0.5)
+    assert [request(middleware, "GET", f"/alice/notes/{i}") for i in range(11)] == [200] * 10 + [429]
+    assert request(middleware, "POST", "/alice/notes", ip="10.0.0.2") == 429
+    # With no read cost, reads are never limited and writes still are
+    middleware = limiter(per_minute=5, read_cost=0)
+    assert [request(middleware, "GET", f"/alice/notes/{i}") for i in range(20)] == [200] * 20
+    assert [request(middleware, "POST", "/alice/notes") for _ in range(6)] == [200] * 5 + [429]
+
+
+def test_password_query_costs_as_much_as_a_login():
+    middleware = limiter(per_minute=5, read_cost=0)
+    # Each guess runs the KDF, so it is charged like a login even on a free read
+    assert request(middleware, "GET", "/alice/notes/1", query=b"password=guess") == 200
+    assert request(middleware, "GET", "/alice/notes/1", ip="10.0.4.1", query=b"password=") == 429
+    assert request(middleware, "GET", "/alice/notes/1", ip="10.0.4.2", query=b"limit=5") == 200
+
+
+def test_share_links_are_only_limited_per_ip():
+    middleware = limiter(per_minute=5, read_cost=1)
+    # Public reads from many clients, of one link or of several, never share a bucket
+    statuses = [request(middleware, "GET", f"/shared/token{i % 2}", ip=f"10.0.3.{i}") for i in range(20)]
+    assert statuses == [200] * 20
+    assert [request(middleware, "GET", "/shared/token0", ip="10.0.3.250") for _ in range(6)] == [200] * 5 + [429]
+    assert request(middleware, "GET", "/shared/token1", ip="10.0.3.251") == 200
+
+
+def test_expensive_paths_cost_more():
+    middleware = limiter(per_minute=5)
+    body = json.dumps({"alias": "Carol", "password": "x"}).encode()
+    assert request(middleware, "POST", "/login", body=body) == 200
+    # 3 of 5 tokens gone, so the next login from anywhere is refused for this alias
+    assert request(middleware, "POST", "/login", ip="10.0.2.1", body=body) == 429
+    assert request(middleware, "POST", "/carol/notes", ip="10.0.2.2") == 200
+
+
+def test_rejections_carry_retry_after():
+    middleware = limiter(per_minute=1)
+    request(middleware, "POST", "/register")
+    start = response_start(middleware, "POST", "/register")
+    assert start["status"] == 429 and int(dict(start["headers"])[b"retry-after"]) >= 1
+
+
+def test_exempt_paths_and_disabled_limiter():
+    middleware = limiter(per_minute=1)
+    assert [request(middleware, "GET", "/health") for _ in range(3)] == [200] * 3
+    middleware = limiter(per_minute=1, enabled=False)
+    assert [request(middleware, "POST", "/register") for _ in range(3)] == [200] * 3
+
+
+def test_store_refills():
+    store = InMemoryTokenBucketStore(shards=1)
+    assert store.consume_sync("k", 2, capacity=2, refill_per_second=1000) == 0.0
+    wait = store.consume_sync("k", 2, capacity=2, refill_per_second=1)
+    assert 0 < wait <= 2
@@ -0,0 +1,50 @@
+"""Revision history and the retention policies enforced by the pruner"""
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models import NoteRevision
+from app.services import RevisionService, revisions_to_prune
+
+
+def test_updates_record_revisions(client, account):
+    base = f"/{account.alias}/notes"
+    note = client.post(base, headers=account.headers, json={"title": "t", "content": "v1"}).json()
+    for version in ("v2", "v3"):
+        note = client.put(f"{base}/{note['id']}", headers=account.headers, json={"title": "t", "content": version}).json()
+    revisions = client.get(f"{base}/{note['id']}/revisions", headers=account.headers).json()["revisions"]
+    assert len(revisions) == 2
+    contents = [client.get(f"{base}/{note['id']}/revisions/{revision['id']}", headers=account.headers).json()["decrypted_content"] for revision in revisions]
+    assert contents == ["v2", "v1"]
+
+
+def test_prune_keeps_the_newest_revisions(client, account, monkeypatch):
+    base = f"/{account.alias}/notes"
+    note = client.post(base, headers=account.headers, json={"content": "v0"}).json()
+    for i in range(1, 6):
+        client.put(f"{base}/{note['id']}", headers=account.headers, json={"content": f"v{i}"})
+    monkeypatch.setattr(settings, "NOTE_REVISION_RETENTION", "count")
+    monkeypatch.setattr(settings, "NOTE_REVISION_KEEP_LAST", 2)
+    with SessionLocal() as db:
+        assert RevisionService(db).prune(batch_size=1) >= 3
+        kept = db.query(NoteRevision).filter_by(note_id=note["id"]).count()
+    assert kept == 2
+    revisions = client.get(f"{base}/{note['id']}/revisions", headers=account.headers).json()["revisions"]
+    assert [client.get(f"{base}/{note['id']}/revisions/{revision['id']}", headers=account.headers).json()["decrypted_content"] for revision in revisions] == ["v4", "v3"]
+
+
+def test_decay_keeps_one_revision_per_window(monkeypatch):
+    monkeypatch.setattr(settings, "NOTE_REVISION_RETENTION", "decay")
+    now = datetime(2026, 1, 10, 12, 0)
+    revisions = [
+        (6, now - timedelta(minutes=5)),            # Recent: always kept
+        (5, now - timedelta(minutes=10)),
+        (4, now - timedelta(days=3, minutes=1)),    # Older revisions thin out to one per window
+        (3, now - timedelta(days=3, minutes=2)),
+        (2, now - timedelta(days=200, minutes=1)),
+        (1, now - timedelta(days=200, minutes=2)),
+    ]
+    pruned = revisions_to_prune(revisions, now)
+    assert 6 not in pruned and 5 not in pruned
+    assert 4 not in pruned and 3 in pruned
+    assert 2 not in pruned and 1 in pruned
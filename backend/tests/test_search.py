@@ -0,0 +1,62 @@
+"""Blind-index search: tokens kept in step with edits, and the login backfill"""
+import functools
+import logging
+
+import pytest
+
+from app import async_services, services
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Note
+from tests.conftest import login
+
+
+@pytest.fixture
+def search_enabled(monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_INDEX_ENABLED", True)
+
+
+def search(client, account, q):
+    response = client.get(f"/{account.alias}/search", headers=account.headers, params={"q": q})
+    assert response.status_code == 200, response.text
+    return [note["id"] for note in response.json()]
+
+
+def test_search_follows_edits(client, account, search_enabled):
+    base = f"/{account.alias}/notes"
+    note = client.post(base, headers=account.headers, json={"title": "Groceries", "content": "milk and eggs"}).json()
+    assert search(client, account, "milk") == search(client, account, "groc") == [note["id"]]
+    assert search(client, account, "milk bread") == []
+
+    client.patch(f"{base}/{note['id']}", headers=account.headers, json={"title": "Errands", "content": "bread"})
+    assert search(client, account, "milk") == search(client, account, "groceries") == []
+    assert search(client, account, "errands bread") == [note["id"]]
+    client.delete(f"{base}/{note['id']}", headers=account.headers)
+    assert search(client, account, "bread") == []
+
+
+def test_search_needs_words(client, account, search_enabled):
+    assert client.get(f"/{account.alias}/search", headers=account.headers, params={"q": "!!!"}).status_code == 400
+
+
+def test_backfill_moves_past_notes_without_tokens(client, account, monkeypatch, caplog):
+    base = f"/{account.alias}/notes"
+    # Written before the index was enabled: two notes without words, one that doesn't decrypt, then a real one
+    for content in ("!!! ???", "... ,,,"):
+        client.post(base, headers=account.headers, json={"content": content})
+    corrupt_id = client.post(base, headers=account.headers, json={"content": "soon corrupt"}).json()["id"]
+    with SessionLocal() as db:
+        db.get(Note, corrupt_id).encrypted_content = b"\x05\x00" + b"\x00" * 40
+        db.commit()
+    note_id = client.post(base, headers=account.headers, json={"content": "findable"}).json()["id"]
+
+    monkeypatch.setattr(settings, "SEARCH_INDEX_ENABLED", True)
+    small_batches = functools.partial(services.search_backfill_query, limit=2)
+    monkeypatch.setattr(services, "search_backfill_query", small_batches)
+    monkeypatch.setattr(async_services, "search_backfill_query", small_batches)
+    with caplog.at_level(logging.WARNING, logger="app.services"):
+        for _ in range(3):
+            account.headers = login(client, account.alias)
+    assert search(client, account, "findable") == [note_id]
+    # The corrupt note was looked at (and logged) once, not on every login
+    assert sum(record.getMessage().startswith(f"Note {corrupt_id} of user") for record in caplog.records) == 1
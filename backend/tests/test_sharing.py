@@ -0,0 +1,82 @@
+"""Share links: create, revoke, expiry, the public route and batched view counts"""
+from datetime import datetime, timedelta
+
+from app.database import SessionLocal
+from app.jobs import flush_share_views
+from app.models import SharedNote
+from app.sharing import CachedShare, SharedNoteCache, share_cache, share_token_hash
+from tests.test_api import second_account
+
+
+def share(client, account, note_id, **body):
+    response = client.post(f"/{account.alias}/notes/{note_id}/share", headers=account.headers, json=body or None)
+    assert response.status_code == 201, response.text
+    return response.json()
+
+
+def test_share_link_serves_a_snapshot(client, account):
+    note = client.post(f"/{account.alias}/notes", headers=account.headers, json={"title": "Recipe", "content": "flour, water"}).json()
+    link = share(client, account, note["id"])
+    assert link["share_token"] and link["expires_at"] is None
+
+    client.put(f"/{account.alias}/notes/{note['id']}", headers=account.headers, json={"content": "changed later"})
+    for _ in range(3):
+        view = client.get(f"/shared/{link['share_token']}")
+        assert view.status_code == 200
+        assert view.json()["title"] == "Recipe" and view.json()["content"] == "flour, water"
+
+    # Views are counted in memory and written by the flush job
+    flush_share_views()
+    info = client.get(f"/{account.alias}/notes/{note['id']}/share", headers=account.headers).json()
+    assert info["view_count"] == 3 and info["share_token"] is None
+    with SessionLocal() as db:
+        stored = db.query(SharedNote).filter(SharedNote.note_id == note["id"]).one()
+    # Only the token's hash is stored
+    assert stored.share_token == share_token_hash(link["share_token"]) != link["share_token"]
+
+
+def test_resharing_replaces_the_link(client, account):
+    note_id = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "v1"}).json()["id"]
+    first = share(client, account, note_id)["share_token"]
+    assert client.get(f"/shared/{first}").status_code == 200
+    second = share(client, account, note_id)["share_token"]
+    assert client.get(f"/shared/{first}").status_code == 404
+    assert client.get(f"/shared/{second}").json()["content"] == "v1"
+
+
+def test_revoked_link_stops_working_at_once(client, account):
+    note_id = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "secret"}).json()["id"]
+    token = share(client, account, note_id)["share_token"]
+    assert client.get(f"/shared/{token}").status_code == 200
+    assert client.delete(f"/{account.alias}/notes/{note_id}/share", headers=account.headers).status_code == 204
+    assert client.get(f"/shared/{token}").status_code == 404
+    assert client.delete(f"/{account.alias}/notes/{note_id}/share", headers=account.headers).status_code == 404
+    assert client.get(f"/{account.alias}/notes/{note_id}/share", headers=account.headers).status_code == 404
+
+
+def test_expired_link_is_not_served(client, account):
+    note_id = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "brief"}).json()["id"]
+    link = share(client, account, note_id, expires_in_seconds=60)
+    assert link["expires_at"] is not None
+    assert client.get(f"/shared/{link['share_token']}").status_code == 200
+    with SessionLocal() as db:
+        db.query(SharedNote).filter(SharedNote.note_id == note_id).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+    share_cache.discard(share_token_hash(link["share_token"]))
+    assert client.get(f"/shared/{link['share_token']}").status_code == 404
+    assert client.post(f"/{account.alias}/notes/{note_id}/share", headers=account.headers, json={"expires_in_seconds": 1}).status_code == 422
+
+
+def test_only_the_owner_manages_a_share(client, account):
+    note_id = client.post(f"/{account.alias}/notes", headers=account.headers, json={"content": "mine"}).json()["id"]
+    other, other_headers = second_account(client)
+    for method in ("post", "get", "delete"):
+        assert client.request(method, f"/{other}/notes/{note_id}/share", headers=other_headers).status_code == 404
+    assert client.get("/shared/not-a-token").status_code == 404
+
+
+def test_cache_entries_end_with_their_share():
+    cache = SharedNoteCache(ttl_seconds=60)
+    cache.put("expired", CachedShare(share_id=1, body=b"{}", expires_at=datetime.utcnow() - timedelta(seconds=1)))
+    cache.put("live", CachedShare(share_id=2, body=b"{}", expires_at=datetime.utcnow() + timedelta(hours=1)))
+    assert cache.get("expired") is None and cache.get("live").share_id == 2
@@ -0,0 +1,76 @@
+"""UserCache: lookups by alias and id, invalidation and the shared backend"""
+from datetime import datetime
+
+from app import user_cache as user_cache_module
+from app.user_cache import CachedUser, UserCache, UserCacheBackend, user_cache
+from tests.conftest import PASSWORD, login
+from tests.test_keys import stored_user
+
+
+class DictBackend(UserCacheBackend):
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ttl_seconds):
+        self.data[key] = value
+
+    def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+
+def cached(user_id=1, alias="alice", **changes):
+    now = datetime(2030, 1, 1)
+    return CachedUser(id=user_id, alias=alias, encrypted_alias=b"sealed", created_at=now, last_accessed_at=now, **changes)
+
+
+def test_invalidate_drops_both_lookups_here_and_in_the_backend():
+    backend = DictBackend()
+    cache = UserCache(backend=backend)
+    cache.put(cached())
+    assert cache.get_by_alias("alice") == cache.get_by_id(1) == cached()
+    cache.invalidate(1, "alice")
+    assert cache.get_by_alias("alice") is None and cache.get_by_id(1) is None
+    assert backend.data == {}
+
+
+def test_invalidate_by_id_follows_a_renamed_alias():
+    cache = UserCache()
+    cache.put(cached(alias="old"))
+    cache.invalidate(1, "new")
+    assert cache.get_by_alias("old") is None and cache.get_by_id(1) is None
+
+
+def test_workers_fill_from_the_shared_backend():
+    backend = DictBackend()
+    UserCache(backend=backend).put(cached(wrapped_key=b"wrapped", session_epoch=3))
+    other = UserCache(backend=backend)
+    assert other.get_by_id(1) == cached(wrapped_key=b"wrapped", session_epoch=3)
+    # Now held locally as well
+    backend.data.clear()
+    assert other.get_by_alias("alice") is not None
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(user_cache_module.time, "monotonic", lambda: now[0])
+    cache = UserCache(ttl_seconds=30)
+    cache.put(cached())
+    now[0] += 31
+    assert cache.get_by_alias("alice") is None and cache.stats()["evictions"] == 1
+
+
+def test_password_change_refreshes_the_cached_user(client, account):
+    before = user_cache.get_by_alias(account.alias)
+    assert before is not None
+    assert client.post("/password", json={"alias": account.alias, "password": PASSWORD, "new_password": "new-password"}).json()["success"]
+    after = user_cache.get_by_alias(account.alias)
+    stored = stored_user(account.alias)
+    assert after.wrapped_key == stored.wrapped_key != before.wrapped_key
+    assert after.session_epoch == stored.session_epoch == before.session_epoch + 1
+    # The cached copy is what unlock checks, so only the new password works
+    assert not client.post("/login", json={"alias": account.alias, "password": PASSWORD}).json()["success"]
+    login(client, account.alias, "new-password")
@@ -8,11 +8,11 @@ import {
   DropdownMenuItem,
   DropdownMenuTrigger,
 } from '@/components/ui/dropdown-menu';
-import type { Note, DecryptedFolder } from '@/lib/types';
+import type { NoteSummary, DecryptedFolder } from '@/lib/types';
 
 interface FolderListProps {
   folders: DecryptedFolder[];
-  notes: Note[];
+  notes: NoteSummary[];
   selectedFolderId: number | null;
   selectedNoteId: number | undefined;
   onSelectFolder: (folderId: number | null) => void;
@@ -1,8 +1,8 @@
 import { FileText } from 'lucide-react';
-import type { Note } from '@/lib/types';
+import type { NoteSummary } from '@/lib/types';
 
 interface NoteListProps {
-  notes: Note[];
+  notes: NoteSummary[];
   selectedNoteId?: number;
   onSelectNote: (noteId: number) => void;
   decryptedTitles: Map<number, string>;
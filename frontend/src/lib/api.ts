@@ -5,6 +5,7 @@ import type {
   RegisterRequest,
   User,
   Note,
+  NoteSummary,
   Folder,
   DecryptedNote,
   DecryptedFolder,
@@ -70,8 +71,9 @@ export const foldersApi = {
 };
 
 export const notesApi = {
-  getUserWithNotes: async (alias: string): Promise<{ user: User; notes: Note[]; folders: Folder[] }> => {
-    const response = await api.get(`/${alias}`);
+  getUserWithNotes: async (alias: string): Promise<{ user: User; notes: NoteSummary[]; folders: Folder[] }> => {
+    // The sidebar only needs titles, so skip the encrypted note bodies
+    const response = await api.get(`/${alias}`, { params: { fields: 'summary' } });
     return {
       user: {
         id: response.data.id,
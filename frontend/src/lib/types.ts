@@ -19,15 +19,19 @@ export interface DecryptedFolder extends Folder {
   decrypted_name: string;
 }
 
-export interface Note {
+export interface NoteSummary {
   id: number;
   user_id: number;
   folder_id: number | null;
   encrypted_title: string | null;
-  encrypted_content: string;
   content_hash: string;
   created_at: string;
   updated_at: string | null;
+  delta_count: number;
+}
+
+export interface Note extends NoteSummary {
+  encrypted_content: string;
 }
 
 export interface DecryptedNote extends Note {
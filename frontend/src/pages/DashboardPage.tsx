@@ -10,13 +10,13 @@ import { FolderDialog } from '@/components/notes/FolderDialog';
 import { NoteEditor } from '@/components/notes/NoteEditor';
 import { NoteViewer } from '@/components/notes/NoteViewer';
 import { useToast } from '@/components/ui/use-toast';
-import type { Note, DecryptedNote, DecryptedFolder } from '@/lib/types';
+import type { NoteSummary, DecryptedNote, DecryptedFolder } from '@/lib/types';
 
 export const DashboardPage = () => {
   const { user, password, logout, isAuthenticated } = useAuth();
   const navigate = useNavigate();
   const { toast } = useToast();
-  const [notes, setNotes] = useState<Note[]>([]);
+  const [notes, setNotes] = useState<NoteSummary[]>([]);
   const [decryptedFolders, setDecryptedFolders] = useState<DecryptedFolder[]>([]);
   const [decryptedTitles, setDecryptedTitles] = useState<Map<number, string>>(new Map());
   const [selectedNote, setSelectedNote] = useState<DecryptedNote | null>(null);